@@ -5,31 +5,65 @@ Supports streaming output, token counting, API configuration
 """
 
 import customtkinter as ctk
+from tkinter import filedialog
+from concurrent.futures import Future
+import multiprocessing
 import threading
 import os
-import re
 import datetime
 import sys
+import time
 
 # Fix encoding for Windows
 if sys.platform == 'win32':
     import locale
     locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
 
-from api_client import APIClient
+from api_client import APIClient, request_headers
 from prompts import get_system_prompt
+from markdown_fences import CODE, FenceTokenizer, parse_segments, remember_segments
+from paste_classifier import classify_paste_async, is_code_content, is_oversized
+from syntax_highlight import TAG_COLORS, highlight_async
+from stream_bridge import StreamBridge
+from session_store import PAGE_SIZE, SessionStore
+from usage_ledger import UsageLedger, describe, total_tokens
+from perf_hud import LoopMonitor, count_widgets, export_snapshot, process_rss
+from stall_watchdog import StallWatchdog
+from audit_log import close_shared
+from compaction import Compactor, describe as describe_compaction, describe_effect, estimate_tokens
+from attachments import (AttachmentError, AttachmentStore, describe as describe_attachment, describe_savings, message_chars,
+    resolve_messages)
+from fanout import HedgePolicy, Race, describe_hedge, describe_race, target_clients, throughput
+from deadlines import counters
+from health_probe import STATUS_COLORS, describe as describe_health, probe
+from response_buffer import ResponseBuffer
+from semantic_cache import describe as describe_cache_hit
+from scheduler import describe as describe_queues
+from conversation_tree import ROOT_SEQ, ConversationTree
+import client_process
 
 
 class CodeBlock(ctk.CTkFrame):
     """Collapsible code block with copy button - shows 5 lines by default"""
-    
+
+    PREVIEW_LINES = 5
+    # Lines inserted per step and time budget per slice when expanding
+    CHUNK_LINES = 200
+    SLICE_MS = 8
+
     def __init__(self, parent, code, language="", **kwargs):
         super().__init__(parent, fg_color="#1e1e2e", corner_radius=6, **kwargs)
         
         self.code = code
+        self.language = language
         self.is_expanded = False
-        self.lines = code.split('\n')
-        self.total_lines = len(self.lines)
+        self.total_lines = code.count('\n') + 1
+        self.inserted = 0          # chars of self.code already in the textbox
+        self.inserted_lines = 0
+        self.insert_job = None
+        self.tokens = None         # highlight tokens, once the worker is done
+        self.tagged = 0            # tokens already applied
+        self.tag_job = None
         
         # Header
         self.header = ctk.CTkFrame(self, fg_color="#2d2d3d", corner_radius=6)
@@ -45,7 +79,7 @@ class CodeBlock(ctk.CTkFrame):
         self.copy_btn.pack(side="right", padx=4, pady=4)
         
         # Expand button (only if more than 5 lines)
-        if self.total_lines > 5:
+        if self.total_lines > self.PREVIEW_LINES:
             self.toggle_btn = ctk.CTkButton(self.header, text=f"▶ +{self.total_lines - 5} lines",
                 width=80, height=22, font=("Arial", 9), fg_color="#3a7ca5", 
                 hover_color="#2d6a8f", command=self.toggle_expand)
@@ -55,31 +89,121 @@ class CodeBlock(ctk.CTkFrame):
         self.code_frame = ctk.CTkFrame(self, fg_color="#0d0d1a", corner_radius=4)
         self.code_frame.pack(fill="x", padx=2, pady=(0, 2))
         
-        preview_code = '\n'.join(self.lines[:5]) if self.total_lines > 5 else code
         self.code_text = ctk.CTkTextbox(self.code_frame, font=("Consolas", 10),
             fg_color="transparent", text_color="#e0e0e0",
             height=min(90, self.total_lines * 18), wrap="none")
         self.code_text.pack(fill="x", padx=4, pady=4)
-        self.code_text.insert("1.0", preview_code)
+        for tag, color in TAG_COLORS.items():
+            self.code_text.tag_config(tag, foreground=color)
+        # Collapsing hides the rest instead of deleting it, so re-expanding is free
+        self.code_text.tag_config("collapsed", elide=True)
+
+        self.insert_chunk(self.preview_end())
         self.code_text.configure(state="disabled")
+
+        self.highlight = highlight_async(code, language)
+        self.after(15, self.poll_highlight)
+
+    def preview_end(self):
+        """Char offset where the 5-line preview ends"""
+        end = -1
+        for _ in range(self.PREVIEW_LINES):
+            end = self.code.find('\n', end + 1)
+            if end == -1:
+                return len(self.code)
+        return end
+
+    def insert_chunk(self, end):
+        """Append self.code[inserted:end] to the textbox"""
+        chunk = self.code[self.inserted:end]
+        self.code_text.insert("end", chunk)
+        self.inserted = end
+        self.inserted_lines += chunk.count('\n')
+
+    def insert_step(self):
+        """Insert the expanded content in time-sliced chunks"""
+        self.insert_job = None
+        if not self.winfo_exists():
+            return
+        deadline = time.perf_counter() + self.SLICE_MS / 1000
+        self.code_text.configure(state="normal")
+        while self.inserted < len(self.code) and time.perf_counter() < deadline:
+            end = self.inserted
+            for _ in range(self.CHUNK_LINES):
+                end = self.code.find('\n', end + 1)
+                if end == -1:
+                    end = len(self.code)
+                    break
+            self.insert_chunk(end)
+        self.code_text.configure(state="disabled")
+
+        self.schedule_tags()
+        if self.inserted < len(self.code):
+            self.insert_job = self.after(1, self.insert_step)
+
+    def poll_highlight(self):
+        """Wait for the background tokenizer without blocking the main loop"""
+        if not self.winfo_exists():
+            return
+        if not self.highlight.done():
+            self.after(15, self.poll_highlight)
+            return
+        try:
+            self.tokens = self.highlight.result()
+        except Exception:
+            self.tokens = []
+        self.schedule_tags()
+
+    def schedule_tags(self):
+        if self.tokens is not None and self.tag_job is None and self.tagged < len(self.tokens):
+            self.tag_job = self.after(1, self.apply_tags)
+
+    def apply_tags(self):
+        """Apply highlight tags for the text inserted so far, one time slice at a time"""
+        self.tag_job = None
+        if not self.winfo_exists():
+            return
+        deadline = time.perf_counter() + self.SLICE_MS / 1000
+        inserted_line = self.inserted_lines + 1
+        ranges = {}
+        index = self.tagged
+        while index < len(self.tokens):
+            tag, start, end = self.tokens[index]
+            if int(end.split('.', 1)[0]) > inserted_line:
+                break
+            ranges.setdefault(tag, []).extend((start, end))
+            index += 1
+            if index % 500 == 0 and time.perf_counter() > deadline:
+                break
+        for tag, indices in ranges.items():
+            # One Tk call per tag (the CTk wrapper only takes a single range)
+            self.code_text._textbox.tag_add(tag, *indices)
+        self.tagged = index
+
+        # Out of time with tokens left for inserted text - continue next slice,
+        # otherwise insert_step picks tagging up again as more text arrives
+        if index < len(self.tokens) and int(self.tokens[index][2].split('.', 1)[0]) <= inserted_line:
+            self.tag_job = self.after(1, self.apply_tags)
     
     def toggle_expand(self):
         if self.is_expanded:
             # Collapse - show 5 lines
-            self.code_text.configure(state="normal")
-            self.code_text.delete("1.0", "end")
-            self.code_text.insert("1.0", '\n'.join(self.lines[:5]))
-            self.code_text.configure(state="disabled", height=90)
+            if self.insert_job is not None:
+                self.after_cancel(self.insert_job)
+                self.insert_job = None
+            self.code_text.tag_add("collapsed", f"{self.PREVIEW_LINES}.end", "end")
+            self.code_text.configure(height=90)
+            self.code_text.yview_moveto(0)
             self.toggle_btn.configure(text=f"▶ +{self.total_lines - 5} lines")
             self.is_expanded = False
         else:
-            # Expand - show all
-            self.code_text.configure(state="normal")
-            self.code_text.delete("1.0", "end")
-            self.code_text.insert("1.0", self.code)
-            self.code_text.configure(state="disabled", height=min(300, self.total_lines * 18))
+            # Expand - show all, inserting whatever is not in the textbox yet
+            self.code_text.tag_remove("collapsed", "1.0", "end")
+            self.code_text.configure(height=min(300, self.total_lines * 18))
             self.toggle_btn.configure(text="▼ Collapse")
             self.is_expanded = True
+            if self.inserted < len(self.code) and self.insert_job is None:
+                self.insert_step()
     
     def copy_code(self):
         self.clipboard_clear()
@@ -94,7 +218,7 @@ class APIConfigDialog(ctk.CTkToplevel):
     def __init__(self, parent, on_save_callback):
         super().__init__(parent)
         self.title("API Settings")
-        self.geometry("500x420")
+        self.geometry("500x500")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -105,7 +229,7 @@ class APIConfigDialog(ctk.CTkToplevel):
         
         self.update_idletasks()
         x = parent.winfo_x() + (parent.winfo_width() - 500) // 2
-        y = parent.winfo_y() + (parent.winfo_height() - 420) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - 500) // 2
         self.geometry(f"+{x}+{y}")
         
         self.create_widgets()
@@ -129,6 +253,11 @@ class APIConfigDialog(ctk.CTkToplevel):
         self.model_entry = ctk.CTkEntry(content, height=35)
         self.model_entry.pack(fill="x", pady=(0, 15))
 
+        ctk.CTkLabel(content, text="Compare models (optional: model or model@base_url, comma separated)",
+            anchor="w").pack(fill="x", pady=(0, 5))
+        self.fanout_entry = ctk.CTkEntry(content, height=35)
+        self.fanout_entry.pack(fill="x", pady=(0, 15))
+
         self.status = ctk.CTkLabel(content, text="", font=("Arial", 11))
         self.status.pack(anchor="w", pady=(0, 10))
 
@@ -152,6 +281,7 @@ class APIConfigDialog(ctk.CTkToplevel):
                             if k == 'API_BASE_URL': self.url_entry.insert(0, v)
                             elif k == 'API_KEY': self.key_entry.insert(0, v)
                             elif k == 'MODEL_NAME': self.model_entry.insert(0, v)
+                            elif k == 'FANOUT_MODELS': self.fanout_entry.insert(0, v)
         except: pass
 
     def save_config(self):
@@ -159,9 +289,18 @@ class APIConfigDialog(ctk.CTkToplevel):
         if not all([url, key, model]):
             self.status.configure(text="❌ Fill all fields", text_color="#ff5555")
             return
+        values = {'API_BASE_URL': url, 'API_KEY': key, 'MODEL_NAME': model,
+            'FANOUT_MODELS': self.fanout_entry.get().strip()}
         try:
+            # Keep any other settings already in the file
+            lines = []
+            if os.path.exists(self.env_path):
+                with open(self.env_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    lines = [l.rstrip('\n') for l in f if l.split('=', 1)[0].strip() not in values]
+            lines += [f"{k}={v}" for k, v in values.items() if v]
             with open(self.env_path, 'w', encoding='utf-8', errors='ignore') as f:
-                f.write(f"API_BASE_URL={url}\nAPI_KEY={key}\nMODEL_NAME={model}\n")
+                f.write('\n'.join(lines) + '\n')
+            os.environ['FANOUT_MODELS'] = values['FANOUT_MODELS']
             self.status.configure(text="✅ Saved!", text_color="#50fa7b")
             if self.on_save: self.on_save()
             self.after(500, self.destroy)
@@ -174,24 +313,1370 @@ class APIConfigDialog(ctk.CTkToplevel):
             self.status.configure(text="❌ Fill all fields", text_color="#ff5555")
             return
         self.status.configure(text="🔄 Testing...", text_color="#f0ad4e")
-        
+        # One-token request with the entered (unsaved) settings
+        future = Future()
+
         def do_test():
             try:
-                import requests
-                r = requests.post(f"{url}/v1/messages", headers={'Content-Type': 'application/json', 
-                    'Authorization': f'Bearer {key}'}, json={'model': model, 
-                    'messages': [{"role": "user", "content": "Hi"}], 'max_tokens': 10}, timeout=15)
-                self.after(0, lambda: self.status.configure(
-                    text="✅ OK!" if r.status_code == 200 else f"❌ {r.status_code}", 
-                    text_color="#50fa7b" if r.status_code == 200 else "#ff5555"))
+                future.set_result(probe(url, request_headers(key), model, 'message'))
             except Exception as e:
-                self.after(0, lambda: self.status.configure(text=f"❌ {str(e)[:30]}", text_color="#ff5555"))
+                future.set_exception(e)
         threading.Thread(target=do_test, daemon=True).start()
+        self.poll_test(future)
+
+    def poll_test(self, future):
+        if not future.done():
+            self.after(100, lambda: self.poll_test(future))
+            return
+        try:
+            health = future.result()
+        except Exception as e:
+            self.status.configure(text=f"❌ {str(e)[:40]}", text_color="#ff5555")
+            return
+        if health.ok:
+            self.status.configure(text=f"✅ OK ({health.latency_ms:.0f} ms)", text_color="#50fa7b")
+        else:
+            self.status.configure(text=f"❌ {(health.detail or health.status)[:40]}", text_color="#ff5555")
+
+
+class HistoryDialog(ctk.CTkToplevel):
+    """Conversation history browser with full-text search"""
+
+    def __init__(self, parent, store, on_open):
+        super().__init__(parent)
+        self.title("History")
+        self.geometry("560x520")
+        self.transient(parent)
+        self.store = store
+        self.on_open = on_open
+        self.offset = 0
+
+        self.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - 560) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - 520) // 2
+        self.geometry(f"+{x}+{y}")
+
+        self.create_widgets()
+        self.show_sessions()
+
+    def create_widgets(self):
+        bar = ctk.CTkFrame(self, fg_color="transparent")
+        bar.pack(fill="x", padx=10, pady=(10, 5))
+        self.search_entry = ctk.CTkEntry(bar, height=32, placeholder_text="Search all conversations...")
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_entry.bind("<Return>", lambda e: self.search())
+        ctk.CTkButton(bar, text="Search", width=70, height=32, fg_color="#3a7ca5",
+            hover_color="#2d6a8f", command=self.search).pack(side="left", padx=(5, 0))
+
+        self.status = ctk.CTkLabel(self, text="", font=("Arial", 10), text_color="#888", anchor="w")
+        self.status.pack(fill="x", padx=12)
+
+        self.results = ctk.CTkScrollableFrame(self, fg_color="#16162a", corner_radius=8)
+        self.results.pack(fill="both", expand=True, padx=10, pady=(5, 10))
+
+    def clear_results(self):
+        for w in self.results.winfo_children():
+            w.destroy()
+
+    def add_item(self, title, detail, command):
+        item = ctk.CTkButton(self.results, text=f"{title}\n{detail}", anchor="w", height=44,
+            font=("Arial", 11), fg_color="#1e1e3a", hover_color="#2d2d4d", command=command)
+        item.pack(fill="x", padx=4, pady=2)
+
+    def show_sessions(self, more=False):
+        """Session list, one page at a time"""
+        if not more:
+            self.offset = 0
+            self.clear_results()
+        else:
+            self.more_btn.destroy()
+        sessions = self.store.list_sessions(offset=self.offset)
+        self.offset += len(sessions)
+        for session in sessions:
+            when = datetime.datetime.fromtimestamp(session['updated']).strftime("%Y-%m-%d %H:%M")
+            self.add_item(session['title'], f"{when} · {session['message_count']} messages",
+                lambda sid=session['id'], title=session['title']: self.open(sid, title))
+        if len(sessions) == PAGE_SIZE:
+            self.more_btn = ctk.CTkButton(self.results, text="More...", height=28, fg_color="#444466",
+                hover_color="#555577", command=lambda: self.show_sessions(more=True))
+            self.more_btn.pack(pady=4)
+        self.status.configure(text=f"{self.offset} conversations" if self.offset else "No saved conversations")
+
+    def search(self):
+        query = self.search_entry.get().strip()
+        if not query:
+            self.show_sessions()
+            return
+        start = time.perf_counter()
+        hits = self.store.search(query)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.clear_results()
+        for hit in hits:
+            self.add_item(f"[{hit['role']}] {hit['title']}", hit['snippet'],
+                lambda h=hit: self.open(h['session_id'], h['title'], h['seq']))
+        self.status.configure(text=f"{len(hits)} matches ({elapsed:.0f} ms)")
+
+    def open(self, session_id, title, seq=None):
+        # Show the page that contains the hit
+        before_seq = seq + PAGE_SIZE // 2 if seq is not None else None
+        self.on_open(session_id, title, before_seq)
+        self.destroy()
+
+
+class UsageDialog(ctk.CTkToplevel):
+    """Token and cost ledger - per day and most expensive conversations"""
+
+    def __init__(self, parent, ledger, cache=None):
+        super().__init__(parent)
+        self.title("Usage")
+        self.geometry("620x520")
+        self.transient(parent)
+
+        self.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - 620) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - 520) // 2
+        self.geometry(f"+{x}+{y}")
+
+        self.body = ctk.CTkScrollableFrame(self, fg_color="#16162a", corner_radius=8)
+        self.body.pack(fill="both", expand=True, padx=10, pady=10)
+        self.status = ctk.CTkLabel(self.body, text="Loading...", font=("Arial", 10), text_color="#888888")
+        self.status.pack(fill="x", pady=8)
+        self.cache = cache
+        # The ledger is read once the writes queued so far are in
+        self.poll_ledger(ledger.store.read_async(lambda: (ledger.by_day(), ledger.by_session(), ledger.by_model())))
+
+    def poll_ledger(self, future):
+        if not self.winfo_exists():
+            return
+        if not future.done():
+            self.after(20, lambda: self.poll_ledger(future))
+            return
+        try:
+            by_day, by_session, by_model = future.result()
+        except Exception as e:
+            self.status.configure(text=f"❌ {e}", text_color="#ff5555")
+            return
+        self.status.destroy()
+        self.add_table(self.body, "Per day (last 14 days)", by_day)
+        self.add_table(self.body, "Top conversations", by_session)
+        self.add_model_table(self.body, "Models (last 30 days)", by_model)
+        if self.cache is not None:
+            self.add_cache_table(self.body, "Response cache (last 30 days)", self.cache.quality())
+
+    def add_table(self, parent, title, rows):
+        ctk.CTkLabel(parent, text=title, font=("Arial", 12, "bold"), anchor="w").pack(fill="x", pady=(8, 2))
+        lines = [f"{'':<28}{'turns':>6}{'input':>10}{'output':>10}{'cached':>10}{'cost':>10}"]
+        for row in rows:
+            cost = f"${row['cost']:.4f}" if row['cost'] is not None else "n/a"
+            label = str(row['label'])[:26]
+            lines.append(f"{label:<28}{row['turns']:>6}{row['input_tokens']:>10}{row['output_tokens']:>10}"
+                f"{row['cache_read_input_tokens']:>10}{cost:>10}")
+        if not rows:
+            lines.append("No usage recorded yet")
+        ctk.CTkLabel(parent, text="\n".join(lines), font=("Consolas", 10), justify="left",
+            anchor="w", text_color="#cccccc").pack(fill="x")
+
+    def add_model_table(self, parent, title, rows):
+        ctk.CTkLabel(parent, text=title, font=("Arial", 12, "bold"), anchor="w").pack(fill="x", pady=(8, 2))
+        lines = [f"{'':<28}{'runs':>6}{'wins':>6}{'errors':>8}{'avg TTFT':>10}{'best':>8}{'tok/s':>8}"]
+        for row in rows:
+            avg = f"{row['avg_ttft_ms']:.0f}" if row['avg_ttft_ms'] is not None else "-"
+            best = f"{row['min_ttft_ms']:.0f}" if row['min_ttft_ms'] is not None else "-"
+            rate = f"{row['avg_tokens_per_sec']:.1f}" if row['avg_tokens_per_sec'] is not None else "-"
+            lines.append(f"{row['model'][:26]:<28}{row['runs']:>6}{row['wins']:>6}{row['errors']:>8}"
+                f"{avg:>10}{best:>8}{rate:>8}")
+        if not rows:
+            lines.append("No timings recorded yet")
+        ctk.CTkLabel(parent, text="\n".join(lines), font=("Consolas", 10), justify="left",
+            anchor="w", text_color="#cccccc").pack(fill="x")
+
+    def add_cache_table(self, parent, title, quality):
+        ctk.CTkLabel(parent, text=title, font=("Arial", 12, "bold"), anchor="w").pack(fill="x", pady=(8, 2))
+
+        def percent(value):
+            return f"{value:.0%}" if value is not None else "-"
+
+        lines = [
+            f"{'Entries':<28}{quality['entries']:>10}",
+            f"{'Lookups':<28}{quality['lookups']:>10}",
+            f"{'Hits (exact / near)':<28}{quality['hits']:>10}  ({quality['exact_hits']} / {quality['near_hits']})",
+            f"{'Hit rate':<28}{percent(quality['hit_rate']):>10}",
+            f"{'Near-hit similarity':<28}{percent(quality['avg_near_similarity']):>10}"
+                f"  (lowest {percent(quality['min_near_similarity'])})",
+            f"{'Asked the model instead':<28}{quality['rejected']:>10}  ({percent(quality['rejection_rate'])} of hits)",
+        ]
+        ctk.CTkLabel(parent, text="\n".join(lines), font=("Consolas", 10), justify="left",
+            anchor="w", text_color="#cccccc").pack(fill="x")
+
+
+class FanOutView(ctk.CTkFrame):
+    """One prompt answered by several models side by side - one answer stays in the conversation"""
+
+    COLUMNS = 3
+
+    def __init__(self, parent, tab, clients, messages):
+        super().__init__(parent, fg_color="transparent")
+        self.tab = tab
+        self.answer = None           # the conversation message holding the chosen answer
+        self.columns = []
+        self.pending = len(clients)
+        frame_ms = 16 if tab.is_visible else tab.BACKGROUND_FRAME_MS
+
+        for i, client in enumerate(clients):
+            self.grid_columnconfigure(i % self.COLUMNS, weight=1, uniform="fanout")
+            box = ctk.CTkFrame(self, fg_color="#1a1a2e", corner_radius=6)
+            box.grid(row=i // self.COLUMNS, column=i % self.COLUMNS, sticky="nsew", padx=3, pady=3)
+            ctk.CTkLabel(box, text=f"[AI] {client.model}", font=("Arial", 10, "bold"), text_color="#64b5f6",
+                anchor="w").pack(fill="x", padx=6, pady=(4, 0))
+            text = ctk.CTkTextbox(box, height=220, font=("Consolas", 10), fg_color="#1a1a2e",
+                text_color="#e0e0e0", border_width=0, wrap="word")
+            text.pack(fill="both", expand=True, padx=4)
+            caption = ctk.CTkLabel(box, text="waiting...", font=("Arial", 9), text_color="#666",
+                anchor="w", justify="left", wraplength=240)
+            caption.pack(fill="x", padx=6)
+            column = {"client": client, "text": text, "caption": caption, "chunks": ResponseBuffer(), "error": None}
+            column["button"] = ctk.CTkButton(box, text="Continue with this", height=22, font=("Arial", 9),
+                fg_color="#444466", hover_color="#555577", state="disabled",
+                command=lambda c=column: tab.choose_fanout(self, c))
+            column["button"].pack(fill="x", padx=6, pady=(2, 6))
+            column["bridge"] = StreamBridge(self, lambda t, c=column: self.append(c, t),
+                lambda e, res, c=column: self.done(c, e, res), frame_ms=frame_ms)
+            self.columns.append(column)
+
+        for column in self.columns:
+            column["bridge"].start()
+            threading.Thread(target=tab.process_message,
+                args=(column["client"], column["bridge"], messages, tab.app.attachments), daemon=True).start()
+
+    @staticmethod
+    def content(column):
+        return column["chunks"].getvalue()
+
+    def append(self, column, text):
+        column["chunks"].append(text)
+        if column["text"].winfo_exists():
+            column["text"].insert("end", text)
+            column["text"].see("end")
+
+    def done(self, column, error, result):
+        column["error"] = error
+        column["caption"].configure(text=self.tab.fanout_column_done(column["client"], error, result))
+        self.pending -= 1
+        if self.pending == 0:
+            self.tab.finish_fanout(self)
+
+    def set_chosen(self, chosen):
+        for column in self.columns:
+            if column is chosen:
+                column["button"].configure(text="✓ In conversation", state="disabled", fg_color="#2a9d8f")
+            elif column["error"] is None:
+                column["button"].configure(text="Continue with this", state="normal", fg_color="#444466")
+
+    def set_frame_ms(self, frame_ms):
+        for column in self.columns:
+            column["bridge"].frame_ms = frame_ms
+
+    def close(self):
+        for column in self.columns:
+            column["bridge"].close()
+
+
+class ChatTab(ctk.CTkFrame):
+    """One conversation - its own chat view, history session and stream"""
+
+    # Hidden tabs drain their stream at this cadence and render nothing
+    BACKGROUND_FRAME_MS = 100
+    # Attachments up to this size are shown as a code block, larger ones only as a chip
+    INLINE_ATTACHMENT_BYTES = 64 * 1024
+    # The streaming textbox only keeps the end of the answer; the full text is
+    # rendered when the stream finishes
+    STREAM_WINDOW_CHARS = 32 * 1024
+
+    def __init__(self, parent, app, title):
+        super().__init__(parent, fg_color="transparent")
+        self.app = app
+        self.title = title
+        self.is_visible = False
+
+        self.is_streaming = False
+        self.total_tokens = 0
+        self.total_cost = None       # USD, None until a priced turn is recorded
+        self.turn_model = None
+        self.turn_note = None        # usage caption for the last answer
+        self.tree = ConversationTree()   # every version; self.conversation is the selected branch
+        self.current_response = ResponseBuffer()
+        self.fence_tokenizer = None
+        self.stream_bridge = None
+        self.stream_text = None
+        self.rendered_chars = 0      # how much of current_response reached the textbox
+        self.stream_shown = 0        # characters currently in the textbox
+        self.pending_finish = False  # stream finished while hidden
+
+        # Follow-ups submitted while busy, sent in order as each turn finishes
+        self.outbox = []             # [{"text", "attachments", "mode", "row", "label"}]
+        self.outbox_paused = False   # set when a turn failed
+
+        # Persistent history
+        self.session_id = None
+        self.conversation_future = None
+        self.page_future = None          # history page being read
+        self.viewing_history_page = False
+
+        # Background compaction - the summary only changes what is sent
+        self.compaction = None
+        self.compaction_future = None
+        self.compaction_job = None
+        self.compaction_report_pending = False
+        self.last_prompt_tokens = None   # exact input tokens of the last turn
+        self.last_ttft_ms = None
+        self.first_text_at = None        # perf_counter of the first delta this turn
+        self.last_tokens_per_sec = None
+
+        # Multi-model turns
+        self.turn_race = None            # Race of a race-mode turn
+        self.fanout_view = None          # FanOutView of a running fan-out turn
+
+        # Semantic cache - the last answer may be a cached one the user can replace
+        self.turn_cache_hit = None
+        self.cached_answer = None        # conversation message holding the cached answer
+        self.replacing_answer = None     # node of a cached answer being re-asked (restored on failure)
+
+        # Branches - only what follows the shared prefix is re-rendered on a switch
+        self.message_widgets = {}        # node -> first widget of its message
+        self.page_frames = {}            # seq -> role label of a history page rendered before the tree loaded
+        self.stream_label = None
+        self.branch_restore = None       # head to go back to if a regenerated answer fails
+
+        self.chat_scroll = ctk.CTkScrollableFrame(self, fg_color="#16162a", corner_radius=8)
+        self.chat_scroll.pack(fill="both", expand=True)
+
+        # Pending messages strip (shown only while something is queued)
+        self.outbox_frame = ctk.CTkFrame(self, fg_color="#1e1e3a", corner_radius=8)
+        self.outbox_header = ctk.CTkFrame(self.outbox_frame, fg_color="transparent")
+        self.outbox_header.pack(fill="x", padx=6, pady=(4, 0))
+        self.outbox_label = ctk.CTkLabel(self.outbox_header, text="", font=("Arial", 10), text_color="#f0ad4e")
+        self.outbox_label.pack(side="left")
+        self.resume_btn = ctk.CTkButton(self.outbox_header, text="▶ Resume", width=70, height=22,
+            font=("Arial", 9), fg_color="#2a9d8f", hover_color="#238b7e", command=self.resume_outbox)
+
+    @property
+    def conversation(self):
+        return self.tree.messages
+
+    @property
+    def is_busy(self):
+        return self.is_streaming or self.conversation_future is not None or self.page_future is not None
+
+    @property
+    def is_empty(self):
+        return not self.conversation and not self.is_busy and self.session_id is None
+
+    def live_tokens(self):
+        """Token estimate including the answer being streamed"""
+        if not self.is_streaming:
+            return self.total_tokens
+        input_t = message_chars(self.conversation[-1]) // 4 if self.conversation else 0
+        return self.total_tokens + input_t + len(self.current_response) // 4
+
+    def tokens_per_sec(self):
+        """Output rate of the running turn (estimated), else of the last one"""
+        if self.is_streaming and self.first_text_at is not None:
+            elapsed = time.perf_counter() - self.first_text_at
+            return len(self.current_response) / 4 / elapsed if elapsed > 0 else None
+        return self.last_tokens_per_sec
+
+    def pending_chars(self):
+        """Characters received from the network but not on screen yet"""
+        pending = len(self.current_response) - self.rendered_chars if self.is_streaming or self.pending_finish else 0
+        if self.is_streaming and self.stream_bridge is not None:
+            pending += self.stream_bridge.pending_chars
+        return pending
+
+    def set_visible(self, visible):
+        """Only the visible tab renders; hidden tabs just buffer their stream"""
+        self.is_visible = visible
+        if self.stream_bridge is not None:
+            self.stream_bridge.frame_ms = 16 if visible else self.BACKGROUND_FRAME_MS
+        if self.fanout_view is not None:
+            self.fanout_view.set_frame_ms(16 if visible else self.BACKGROUND_FRAME_MS)
+        if not visible:
+            return
+        if self.pending_finish:
+            self.pending_finish = False
+            self.finish_response()
+        elif self.stream_text is not None and self.rendered_chars < len(self.current_response):
+            # Only what fits in the window - skipped text would be trimmed right away
+            start = max(self.rendered_chars, len(self.current_response) - self.STREAM_WINDOW_CHARS)
+            self.insert_stream_text(self.current_response.slice(start))
+        self.scroll_to_bottom()
+
+    def add_role_label(self, role, color, when=None):
+        """Add role label with timestamp"""
+        frame = ctk.CTkFrame(self.chat_scroll, fg_color="transparent")
+        frame.pack(fill="x", anchor="w", pady=(8, 2), padx=5)
+
+        if when is None:
+            ts = datetime.datetime.now().strftime("%H:%M")
+        else:
+            ts = datetime.datetime.fromtimestamp(when).strftime("%Y-%m-%d %H:%M")
+        ctk.CTkLabel(frame, text=f"[{role}]", font=("Arial", 11, "bold"),
+            text_color=color).pack(side="left")
+        ctk.CTkLabel(frame, text=f" {ts}", font=("Arial", 9),
+            text_color="#555").pack(side="left")
+        return frame
+
+    def add_text(self, text):
+        """Add plain text"""
+        label = ctk.CTkLabel(self.chat_scroll, text=text, font=("Arial", 11),
+            text_color="#e0e0e0", wraplength=750, justify="left", anchor="w")
+        label.pack(fill="x", anchor="w", padx=10, pady=2)
+
+    def add_code_block(self, code, language=""):
+        """Add collapsible code block"""
+        block = CodeBlock(self.chat_scroll, code, language)
+        block.pack(fill="x", padx=10, pady=4)
+
+    def render_content(self, content):
+        """Parse and render content with code blocks"""
+        for segment in parse_segments(content):
+            body = segment.text.strip()
+            if not body:
+                continue
+            if segment.kind == CODE:
+                self.add_code_block(body, segment.language)
+            else:
+                self.add_text(body)
+
+    def add_system_msg(self, text):
+        """Add system message"""
+        self.add_role_label("System", "#bd93f9")
+        self.add_text(text)
+        self.scroll_to_bottom()
+
+    def wrap_as_code(self, text):
+        """Wrap text as code block if it looks like code"""
+        if is_code_content(text):
+            return f"```\n{text}\n```"
+        return text
+
+    def add_attachment(self, ref):
+        """Show an attachment chip, plus its text when it is small"""
+        ctk.CTkLabel(self.chat_scroll, text=describe_attachment(ref), font=("Arial", 10),
+            text_color="#8be9fd", anchor="w").pack(fill="x", anchor="w", padx=10, pady=(2, 0))
+        if 'diff' in ref:
+            ctk.CTkLabel(self.chat_scroll, text=describe_savings(ref), font=("Arial", 10),
+                text_color="#888888", anchor="w").pack(fill="x", anchor="w", padx=10)
+        store = self.app.attachments
+        if store is None or ref['size'] > self.INLINE_ATTACHMENT_BYTES:
+            return
+        try:
+            self.add_code_block(store.read_text(ref['hash']))
+        except AttachmentError as e:
+            self.add_text(f"❌ {e}")
+
+    def add_user_message(self, content, when=None, attachments=None):
+        """Add user message with auto code detection"""
+        frame = self.add_role_label("You", "#4CAF50", when)
+        for ref in attachments or ():
+            self.add_attachment(ref)
+        if content:
+            wrapped = self.wrap_as_code(content)
+            self.render_content(wrapped)
+        self.scroll_to_bottom()
+        return frame
+
+    def add_ai_message(self, content, when=None):
+        """Add AI message with code block support"""
+        frame = self.add_role_label("AI", "#64b5f6", when)
+        self.render_content(content)
+        self.scroll_to_bottom()
+        return frame
+
+    def add_node(self, node):
+        """Render a message of the tree"""
+        message = node.message
+        if message['role'] == 'user':
+            frame = self.add_user_message(message['content'], node.created, message.get('attachments'))
+        else:
+            frame = self.add_ai_message(message['content'], node.created)
+        self.mark(node, frame)
+
+    def mark(self, node, frame, controls=True):
+        """Remember where a message's widgets start; its role label gets the branch controls"""
+        if not frame.winfo_exists():
+            return
+        self.message_widgets[node] = frame
+        if not controls:
+            return
+        button = dict(width=24, height=20, font=("Arial", 10), fg_color="#444466", hover_color="#555577")
+        if node.message['role'] == 'user':
+            ctk.CTkButton(frame, text="✎", command=lambda: self.edit_message(node), **button).pack(side="right")
+        else:
+            ctk.CTkButton(frame, text="↻", command=lambda: self.regenerate(node), **button).pack(side="right")
+        siblings = node.siblings
+        if len(siblings) > 1:
+            i = siblings.index(node)
+            ctk.CTkButton(frame, text="›", command=lambda: self.show_version(node, 1),
+                state="normal" if i < len(siblings) - 1 else "disabled", **button).pack(side="right", padx=(0, 6))
+            ctk.CTkLabel(frame, text=f"{i + 1}/{len(siblings)}", font=("Arial", 9),
+                text_color="#888").pack(side="right", padx=2)
+            ctk.CTkButton(frame, text="‹", command=lambda: self.show_version(node, -1),
+                state="normal" if i > 0 else "disabled", **button).pack(side="right")
+
+    def scroll_to_bottom(self):
+        """Scroll chat to bottom"""
+        if self.is_visible:
+            self.chat_scroll._parent_canvas.yview_moveto(1.0)
+
+    def send(self, user_text, attachments=None, mode="single"):
+        """Start a turn, or queue it while this conversation is busy"""
+        if self.app.client is None:
+            self.add_system_msg("❌ API not configured\nClick ⚙️ to configure API")
+            return False
+        if self.is_busy or self.outbox:
+            self.enqueue(user_text, attachments, mode)
+            if not self.is_busy:
+                # Sending by hand also resumes a queue paused by an error
+                self.outbox_paused = False
+            self.dispatch_next()
+            return True
+        self.start_turn(user_text, attachments, mode)
+        return True
+
+    def enqueue(self, user_text, attachments=None, mode="single"):
+        """Add a pending message with edit/cancel controls"""
+        row = ctk.CTkFrame(self.outbox_frame, fg_color="#2d2d3d", corner_radius=6)
+        row.pack(fill="x", padx=6, pady=2)
+        label = ctk.CTkLabel(row, text="", font=("Arial", 10), text_color="#bbbbbb", anchor="w")
+        label.pack(side="left", fill="x", expand=True, padx=8)
+        entry = {"text": user_text, "attachments": attachments or [], "mode": mode, "row": row, "label": label}
+        ctk.CTkButton(row, text="✕", width=26, height=22, font=("Arial", 9), fg_color="#555",
+            hover_color="#666", command=lambda: self.cancel_queued(entry)).pack(side="right", padx=(2, 4), pady=3)
+        ctk.CTkButton(row, text="Edit", width=40, height=22, font=("Arial", 9), fg_color="#3a7ca5",
+            hover_color="#2d6a8f", command=lambda: self.edit_queued(entry)).pack(side="right", padx=2, pady=3)
+        self.set_queued_text(entry, user_text)
+        self.outbox.append(entry)
+        self.refresh_outbox()
+
+    def set_queued_text(self, entry, text):
+        entry["text"] = text
+        preview = ' '.join(text.split())
+        if entry["attachments"]:
+            preview = f"📎{len(entry['attachments'])} {preview}"
+        if entry["mode"] != "single":
+            preview = f"[{entry['mode']}] {preview}"
+        entry["label"].configure(text=f"⏳ {preview[:90]}{'...' if len(preview) > 90 else ''}")
+
+    def edit_queued(self, entry):
+        """Edit a pending message in a popup"""
+        popup = ctk.CTkToplevel(self)
+        popup.title("Edit Queued Message")
+        popup.geometry("600x360")
+        popup.transient(self.app)
+
+        text = ctk.CTkTextbox(popup, font=("Consolas", 11))
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+        text.insert("1.0", entry["text"])
+
+        def save_and_close():
+            new_text = text.get("1.0", "end-1c").strip()
+            # It may have been sent or cancelled while the popup was open
+            if entry in self.outbox:
+                if new_text or entry["attachments"]:
+                    self.set_queued_text(entry, new_text)
+                else:
+                    self.cancel_queued(entry)
+            popup.destroy()
+
+        btn_frame = ctk.CTkFrame(popup, fg_color="transparent")
+        btn_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkButton(btn_frame, text="Save & Close", command=save_and_close).pack(side="right")
+
+    def cancel_queued(self, entry):
+        if entry in self.outbox:
+            self.outbox.remove(entry)
+            entry["row"].destroy()
+            self.refresh_outbox()
+
+    def clear_outbox(self):
+        for entry in self.outbox:
+            entry["row"].destroy()
+        self.outbox = []
+        self.outbox_paused = False
+        self.refresh_outbox()
+
+    def resume_outbox(self):
+        self.outbox_paused = False
+        self.dispatch_next()
+
+    def dispatch_next(self):
+        """Send the next queued message as soon as the conversation is free"""
+        if self.is_busy or self.outbox_paused or not self.outbox:
+            self.refresh_outbox()
+            return
+        entry = self.outbox.pop(0)
+        entry["row"].destroy()
+        self.refresh_outbox()
+        self.start_turn(entry["text"], entry["attachments"], entry["mode"])
+
+    def refresh_outbox(self):
+        if not self.outbox:
+            self.outbox_frame.pack_forget()
+        else:
+            if not self.outbox_frame.winfo_ismapped():
+                self.outbox_frame.pack(fill="x", pady=(4, 0))
+            state = "paused after an error" if self.outbox_paused else "sent when the current answer finishes"
+            self.outbox_label.configure(text=f"{len(self.outbox)} queued - {state}")
+            if self.outbox_paused:
+                self.resume_btn.pack(side="right")
+            else:
+                self.resume_btn.pack_forget()
+        self.app.refresh_tab(self)
+
+    def start_turn(self, user_text, attachments=None, mode="single"):
+        """Send a message and stream the answer (mode: single, fanout or race)"""
+        client = self.app.client
+        if client is None:
+            self.add_system_msg("❌ API not configured\nClick ⚙️ to configure API")
+            return
+
+        if self.viewing_history_page:
+            self.render_branch()
+        if not self.conversation and self.session_id is None:
+            self.title = ' '.join(user_text.split())[:18] or (attachments[0]['name'][:18] if attachments else self.title)
+        message = {"role": "user", "content": user_text}
+        if attachments:
+            # Only references - the text is read from the attachment store when sending
+            message["attachments"] = attachments
+        node = self.tree.append(message)
+        self.persist_message(node)
+        self.mark(node, self.add_user_message(user_text, attachments=attachments))
+        self.stream_turn(client, mode)
+
+    def stream_turn(self, client, mode="single", use_cache=True):
+        """Stream an answer to the conversation as it stands - its last message is the user's"""
+        self.is_streaming = True
+        self.current_response.close()
+        self.current_response = ResponseBuffer()
+        self.fence_tokenizer = FenceTokenizer()
+        self.rendered_chars = 0
+        self.stream_shown = 0
+        self.pending_finish = False
+        self.turn_model = client.model
+        self.turn_note = None
+        self.first_text_at = None
+        self.turn_race = None
+        self.turn_cache_hit = None
+
+        # Snapshot on the main thread - the worker never touches shared state
+        self.cancel_compaction_job()
+        messages = Compactor.apply(get_system_prompt(), self.conversation, self.compaction)
+
+        clients = target_clients(client) if mode != "single" else [client]
+        if len(clients) < 2:
+            if mode != "single":
+                self.add_text("ℹ️ No other models configured (⚙️ → Compare models) - sending to one model")
+            mode = "single"
+        hedge_ms = self.app.hedging.delay_ms(client.model) if mode == "single" else None
+        if mode == "fanout":
+            self.fanout_view = FanOutView(self.chat_scroll, self, clients, messages)
+            self.fanout_view.pack(fill="x", padx=10, pady=4)
+            self.scroll_to_bottom()
+            self.app.refresh_tab(self)
+            return
+
+        # Add AI label and streaming text area
+        self.stream_label = self.add_role_label("AI", "#64b5f6")
+        self.stream_text = ctk.CTkTextbox(self.chat_scroll, height=60, font=("Consolas", 11),
+            fg_color="#1a1a2e", text_color="#e0e0e0", border_width=0, corner_radius=6)
+        self.stream_text.pack(fill="x", padx=10, pady=4)
+
+        self.stream_bridge = StreamBridge(self, self.append_stream, self.on_stream_done,
+            frame_ms=16 if self.is_visible else self.BACKGROUND_FRAME_MS)
+        self.stream_bridge.start()
+        if mode == "race":
+            self.turn_race = Race(clients)
+        elif hedge_ms is not None:
+            # Slow first token: a duplicate request takes over, the slower one is cancelled
+            self.turn_race = Race(self.app.hedging.clients(client), grace_ms=0, delays=[0, hedge_ms],
+                use_cache=use_cache)
+        if self.turn_race is not None:
+            worker, args = self.process_race, (self.turn_race, self.stream_bridge, messages, self.app.attachments)
+        else:
+            worker, args = self.process_message, (client, self.stream_bridge, messages, self.app.attachments,
+                use_cache)
+        threading.Thread(target=worker, args=args, daemon=True).start()
+        self.app.refresh_tab(self)
+
+    def process_race(self, race, bridge, messages, attachments):
+        """Worker thread: race the models, the winner's deltas go into the bridge"""
+        error = None
+        winner = None
+        try:
+            winner = race.run(resolve_messages(attachments, messages), bridge)
+        except Exception as ex:
+            error = ex
+        bridge.finish(error, winner.stream if winner is not None else None)
+
+    def process_message(self, client, bridge, messages, attachments, use_cache=False):
+        """Worker thread: resolve attachments, push stream deltas into the bridge"""
+        error = None
+        stream = None
+        try:
+            messages = resolve_messages(attachments, messages)
+            stream = client.send_message_stream(messages, use_cache=use_cache)
+            # Stop/Clear/close abort the request, even while a read waits on the socket
+            bridge.cancel_on_close(stream.abort)
+            for chunk in stream:
+                if not bridge.put(chunk):
+                    break  # Consumer went away (chat cleared or tab closed)
+        except Exception as ex:
+            error = ex
+        finally:
+            if stream is not None and hasattr(stream, 'close'):
+                stream.close()
+        bridge.finish(error, stream)
+
+    def on_stream_done(self, error, result=None):
+        """Main loop: the bridge delivered everything the worker produced"""
+        self.is_streaming = False
+        hit = getattr(result, 'cache_hit', None) if error is None else None
+        replacing = self.replacing_answer
+        if error is None:
+            content = self.current_response.getvalue()
+            if replacing is not None:
+                node = self.tree.append({"role": "assistant", "content": content}, replacing.seq)
+                if self.app.store is not None and self.session_id is not None and node.seq is not None:
+                    self.app.store.update_message(self.session_id, node.seq, content)
+            else:
+                node = self.tree.append({"role": "assistant", "content": content})
+                self.persist_message(node)
+            self.mark(node, self.stream_label)
+        elif replacing is not None or self.branch_restore is not None:
+            # The answer that was being replaced comes back
+            self.safe_destroy_stream()
+            if self.stream_label.winfo_exists():
+                self.stream_label.destroy()
+            shared = len(self.tree)
+            if replacing is not None:
+                self.tree.append(replacing.message, replacing.seq, replacing.created)
+            else:
+                self.tree.switch(self.branch_restore)
+            for node in self.tree.path[shared:]:
+                self.add_node(node)
+        self.replacing_answer = None
+        self.branch_restore = None
+        self.cached_answer = self.conversation[-1] if hit is not None else None
+        self.turn_cache_hit = hit
+        race = self.turn_race
+        if race is not None and race.winner is not None:
+            self.turn_model = race.winner.model
+        # Tokens billed before a failure count too
+        self.record_usage(result, error is None)
+        if hit is not None:
+            # Nothing was sent - keep the replay out of timings and hedge samples
+            self.turn_note = describe_cache_hit(hit)
+        else:
+            self.record_timings(result, error)
+        if error is None and hit is None:
+            self.last_ttft_ms = getattr(result, 'ttft_ms', None)
+            if race is None or race.hedged:
+                self.app.hedging.record(self.turn_model, self.last_ttft_ms)
+            self.last_tokens_per_sec = throughput(result) if result is not None else None
+            if self.last_tokens_per_sec is None and self.first_text_at is not None:
+                elapsed = time.perf_counter() - self.first_text_at
+                self.last_tokens_per_sec = len(self.current_response) / 4 / elapsed if elapsed > 0 else None
+            resumes = getattr(result, 'resumes', 0)
+            if resumes:
+                note = f"↻ Connection dropped - resumed from the partial answer ({resumes}×)"
+                self.turn_note = f"{self.turn_note}\n{note}" if self.turn_note else note
+            if self.compaction_report_pending:
+                self.compaction_report_pending = False
+                effect = describe_effect(self.compaction, self.last_prompt_tokens, self.last_ttft_ms)
+                if effect:
+                    self.turn_note = f"{self.turn_note}\n{effect}" if self.turn_note else effect
+
+        if error is None:
+            if self.is_visible:
+                self.finish_response()
+            else:
+                self.pending_finish = True
+        else:
+            self.safe_destroy_stream()
+            self.current_response.close()
+            self.add_text(f"❌ {error}")
+            # Don't fire follow-ups at a conversation that just failed
+            self.outbox_paused = bool(self.outbox)
+
+        self.app.refresh_tab(self)
+        self.dispatch_next()
+        self.schedule_compaction()
+
+    def record_usage(self, result, completed):
+        """Add the provider's exact usage for this turn to the tab and the ledger"""
+        usage = getattr(result, 'usage', None)
+        self.last_prompt_tokens = None
+        if usage:
+            model = getattr(result, 'model', None) or self.turn_model or ""
+            stop_reason = getattr(result, 'stop_reason', None)
+            usage, cost = self.charge(model, usage, stop_reason)
+            self.turn_note = describe(usage, cost, stop_reason)
+            self.last_prompt_tokens = (usage['input_tokens'] + usage['cache_creation_input_tokens']
+                + usage['cache_read_input_tokens']) or None
+        elif completed:
+            # Provider sent no usage - fall back to an estimate
+            input_tokens = message_chars(self.conversation[-2]) // 4
+            output_tokens = len(self.current_response) // 4
+            self.total_tokens += input_tokens + output_tokens
+
+    def record_timings(self, result, error):
+        """Per-model TTFT and throughput; race losers' tokens are billed too"""
+        ledger = self.app.ledger
+        race = self.turn_race
+        if race is not None:
+            for run in race.runs:
+                if run.outcome == 'skipped':
+                    continue
+                if run is not race.winner and run.stream is not None and run.stream.usage:
+                    self.charge(run.model, run.stream.usage, run.outcome)
+                ledger.record_timing(run.model, "hedge" if race.hedged else "race", run.ttft_ms,
+                    run.tokens_per_sec, run.output_tokens, run.outcome)
+            note = describe_hedge(race) if race.hedged else describe_race(race)
+            if note:
+                self.turn_note = f"{self.turn_note}\n{note}" if self.turn_note else note
+        elif result is not None:
+            ledger.record_timing(self.turn_model, "single", result.ttft_ms, throughput(result),
+                (result.usage or {}).get('output_tokens', 0), "done" if error is None else "error")
+
+    def fanout_column_done(self, client, error, result):
+        """Bill and time one fan-out answer; returns its caption"""
+        parts = []
+        usage = getattr(result, 'usage', None)
+        if usage:
+            stop_reason = getattr(result, 'stop_reason', None)
+            usage, cost = self.charge(result.model or client.model, usage, stop_reason)
+            parts.append(describe(usage, cost, stop_reason))
+        if error is None and result is not None:
+            rate = throughput(result)
+            self.app.ledger.record_timing(client.model, "fanout", result.ttft_ms, rate,
+                (result.usage or {}).get('output_tokens', 0), "done")
+            if result.ttft_ms is not None:
+                parts.insert(0, f"TTFT {result.ttft_ms:.0f} ms" + (f" · {rate:.1f} tok/s" if rate else ""))
+        else:
+            self.app.ledger.record_timing(client.model, "fanout", None, None, 0, "error")
+            parts.append(f"❌ {error}")
+        self.app.refresh_tokens(self)
+        return '\n'.join(parts)
+
+    def finish_fanout(self, view):
+        """All fan-out answers are in - keep the first good one in the conversation"""
+        self.is_streaming = False
+        self.fanout_view = None
+        self.last_prompt_tokens = None
+        answered = [c for c in view.columns if c["error"] is None]
+        if answered:
+            view.answer = {"role": "assistant", "content": view.content(answered[0])}
+            node = self.tree.append(view.answer)
+            self.persist_message(node)
+            self.mark(node, view, controls=False)
+            view.set_chosen(answered[0])
+        else:
+            self.add_text("❌ No model produced an answer")
+            self.outbox_paused = bool(self.outbox)
+        self.app.refresh_tab(self)
+        self.dispatch_next()
+        self.schedule_compaction()
+
+    def choose_fanout(self, view, column):
+        """Continue the conversation with another model's answer"""
+        if self.is_busy or not self.conversation or self.conversation[-1] is not view.answer:
+            self.add_system_msg("ℹ️ Only the latest answer can be switched, while nothing is running")
+            return
+        view.answer["content"] = view.content(column)
+        seq = self.tree.head.seq
+        if self.app.store is not None and self.session_id is not None and seq is not None:
+            self.app.store.update_message(self.session_id, seq, view.answer["content"])
+        view.set_chosen(column)
+
+    def charge(self, model, usage, stop_reason=None):
+        """Record usage in the ledger and add it to this tab's totals"""
+        usage, cost = self.app.ledger.record(self.session_id, model, usage, stop_reason)
+        self.total_tokens += total_tokens(usage)
+        if cost is not None:
+            self.total_cost = (self.total_cost or 0.0) + cost
+        return usage, cost
+
+    def schedule_compaction(self):
+        """Compact once the conversation has been idle for a moment, if it is due"""
+        compactor = self.app.compactor
+        if self.compaction_future is not None or not compactor.enabled:
+            return
+        if compactor.cut_point(self.conversation, self.compaction, self.last_prompt_tokens) is None:
+            return
+        self.cancel_compaction_job()
+        self.compaction_job = self.after(compactor.idle_ms, self.start_compaction)
+
+    def cancel_compaction_job(self):
+        if self.compaction_job is not None:
+            self.after_cancel(self.compaction_job)
+            self.compaction_job = None
+
+    def start_compaction(self):
+        self.compaction_job = None
+        client = self.app.client
+        # Not idle any more - try again after the next turn
+        if self.is_busy or self.outbox or client is None:
+            return
+        cut = self.app.compactor.cut_point(self.conversation, self.compaction, self.last_prompt_tokens)
+        if cut is None:
+            return
+        self.compaction_future = self.app.compactor.summarize_async(
+            client, list(self.conversation), cut, self.compaction)
+        self.poll_compaction(self.compaction_future, self.conversation, client.model)
+
+    def poll_compaction(self, future, conversation, model):
+        if future is not self.compaction_future:
+            return
+        if not future.done():
+            self.after(100, lambda: self.poll_compaction(future, conversation, model))
+            return
+        self.compaction_future = None
+        # Cleared or switched to another session meanwhile
+        if conversation is not self.conversation:
+            return
+        try:
+            compaction = future.result()
+        except Exception as e:
+            self.add_system_msg(f"❌ Compaction failed: {e}")
+            return
+        if compaction.usage:
+            self.charge(model, compaction.usage, 'compaction')
+        compaction.prompt_tokens_before = self.last_prompt_tokens or estimate_tokens(conversation)
+        compaction.ttft_before_ms = self.last_ttft_ms
+        self.compaction = compaction
+        self.compaction_report_pending = True
+        self.add_system_msg(describe_compaction(compaction))
+        self.app.refresh_tokens(self)
+
+    def reset_compaction(self):
+        self.cancel_compaction_job()
+        self.compaction = None
+        self.compaction_future = None
+        self.compaction_report_pending = False
+        self.last_prompt_tokens = None
+        self.last_ttft_ms = None
+
+    def safe_destroy_stream(self):
+        try:
+            if self.stream_text is not None and self.stream_text.winfo_exists():
+                self.stream_text.destroy()
+        except:
+            pass
+
+    def append_stream(self, text):
+        """Main loop: take one coalesced batch from the bridge"""
+        if self.first_text_at is None:
+            self.first_text_at = time.perf_counter()
+        self.current_response.append(text)
+        self.fence_tokenizer.feed(text)
+        if self.is_visible:
+            self.insert_stream_text(text)
+
+    def insert_stream_text(self, text):
+        try:
+            if self.stream_text is not None and self.stream_text.winfo_exists():
+                self.stream_text.configure(state="normal")
+                self.stream_text.insert("end", text)
+                self.stream_shown += len(text)
+                # Trim the head in batches once the window is a quarter over
+                excess = self.stream_shown - self.STREAM_WINDOW_CHARS
+                if excess > self.STREAM_WINDOW_CHARS // 4:
+                    self.stream_text.delete("1.0", f"1.0 + {excess} chars")
+                    self.stream_shown -= excess
+                self.stream_text.see("end")
+                # Update tokens in real-time
+                self.app.refresh_tokens(self)
+        except:
+            pass
+        self.rendered_chars = len(self.current_response)
+
+    def finish_response(self):
+        """Replace streaming text with parsed content"""
+        self.safe_destroy_stream()
+        # Segments were parsed while streaming - render without re-parsing
+        content = self.current_response.getvalue()
+        self.current_response.close()
+        remember_segments(content, self.fence_tokenizer.close())
+        self.render_content(content)
+        if self.turn_note:
+            ctk.CTkLabel(self.chat_scroll, text=self.turn_note, font=("Arial", 9),
+                text_color="#666", anchor="w").pack(fill="x", anchor="w", padx=12)
+        if self.turn_cache_hit is not None:
+            hit = self.turn_cache_hit
+            ctk.CTkButton(self.chat_scroll, text="↻ Ask the model instead", width=150, height=22,
+                font=("Arial", 9), fg_color="#444466", hover_color="#555577",
+                command=lambda: self.ask_model_instead(hit)).pack(anchor="w", padx=12, pady=(2, 4))
+        self.app.refresh_tokens(self)
+        self.scroll_to_bottom()
+
+    def ask_model_instead(self, hit):
+        """Replace a cached answer with a fresh one - the cache entry is dropped"""
+        client = self.app.client
+        if self.is_busy or client is None or not self.conversation or self.conversation[-1] is not self.cached_answer:
+            self.add_system_msg("ℹ️ Only the latest answer can be asked again, while nothing is running")
+            return
+        if client.cache is not None:
+            client.cache.reject(hit)
+        old_path = self.tree.path
+        self.replacing_answer = self.tree.pop()
+        self.cached_answer = None
+        self.show_branch(old_path, len(self.tree))
+        self.stream_turn(client, use_cache=False)
+
+    def regenerate(self, node):
+        """Answer again from the message before node - the new answer becomes another version"""
+        client = self.app.client
+        i = self.tree.index(node)
+        if self.is_busy or client is None or i is None:
+            self.add_system_msg("ℹ️ Answers can be regenerated while nothing is running")
+            return
+        self.branch_restore = self.tree.head
+        self.rewind(i)
+        self.stream_turn(client, use_cache=False)
+
+    def edit_message(self, node):
+        """Edit a sent message in a popup - sending it starts another version of the conversation"""
+        popup = ctk.CTkToplevel(self)
+        popup.title("Edit Message")
+        popup.geometry("600x360")
+        popup.transient(self.app)
+
+        text = ctk.CTkTextbox(popup, font=("Consolas", 11))
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+        text.insert("1.0", node.message['content'])
+
+        def send_and_close():
+            new_text = text.get("1.0", "end-1c").strip()
+            attachments = node.message.get('attachments')
+            popup.destroy()
+            i = self.tree.index(node)
+            if self.is_busy or self.app.client is None or i is None:
+                self.add_system_msg("ℹ️ Messages can be edited while nothing is running")
+            elif new_text or attachments:
+                self.rewind(i)
+                self.start_turn(new_text, attachments)
+
+        btn_frame = ctk.CTkFrame(popup, fg_color="transparent")
+        btn_frame.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkButton(btn_frame, text="Send", command=send_and_close).pack(side="right")
+
+    def show_version(self, node, step):
+        """Switch to the previous or next version of a message, and the branch below it"""
+        siblings = node.siblings
+        i = siblings.index(node) + step
+        if self.is_busy or self.tree.index(node) is None or not 0 <= i < len(siblings):
+            return
+        old_path = self.tree.path
+        shared = self.tree.switch(siblings[i])
+        self.show_branch(old_path, shared)
+        store = self.app.store
+        if store is not None and self.session_id is not None and self.tree.head.seq is not None:
+            store.set_head(self.session_id, self.tree.head.seq)
+        self.app.refresh_tab(self)
+
+    def rewind(self, length):
+        """Keep the first `length` messages on screen and in context, ready for another version"""
+        old_path = self.tree.path
+        self.tree.rewind(length)
+        self.show_branch(old_path, length)
+
+    def show_branch(self, old_path, shared):
+        """Show the selected branch - only messages after the part it shares with old_path are redrawn"""
+        if self.compaction is not None and self.compaction.upto > shared:
+            # The summary stands in for messages that are not on this branch
+            self.reset_compaction()
+        marker = self.message_widgets.get(old_path[shared]) if shared < len(old_path) else None
+        if self.viewing_history_page or (shared < len(old_path) and marker is None):
+            self.render_branch()
+            return
+        if marker is not None:
+            children = self.chat_scroll.winfo_children()
+            for w in children[children.index(marker):]:
+                w.destroy()
+        for node in old_path[shared:]:
+            self.message_widgets.pop(node, None)
+        for node in self.tree.path[shared:]:
+            self.add_node(node)
+        self.scroll_to_bottom()
+
+    def render_branch(self):
+        """Redraw the newest page of the selected branch from memory"""
+        for w in self.chat_scroll.winfo_children():
+            w.destroy()
+        self.message_widgets = {}
+        self.viewing_history_page = False
+        shown = self.tree.path[-PAGE_SIZE:]
+        if len(shown) < len(self.tree) and self.app.store is not None and shown[0].seq is not None:
+            ctk.CTkButton(self.chat_scroll, text="▲ Earlier messages", height=26, font=("Arial", 10),
+                fg_color="#444466", hover_color="#555577",
+                command=lambda: self.show_history_page(shown[0].seq)).pack(pady=4)
+        for node in shown:
+            self.add_node(node)
+        self.scroll_to_bottom()
+
+    def stop_stream(self):
+        """Drop the running stream - closing the bridge aborts the request"""
+        if self.stream_bridge is not None and not self.stream_bridge.closed:
+            self.stream_bridge.close()
+        if self.fanout_view is not None:
+            self.fanout_view.close()
+            self.fanout_view = None
+        self.is_streaming = False
+        self.current_response.close()
+        self.pending_finish = False
+
+    def clear(self):
+        self.stop_stream()
+        self.clear_outbox()
+        for w in self.chat_scroll.winfo_children():
+            w.destroy()
+        self.tree = ConversationTree()
+        self.message_widgets = {}
+        self.page_frames = {}
+        self.cached_answer = None
+        self.replacing_answer = None
+        self.branch_restore = None
+        self.reset_compaction()
+        self.session_id = None
+        self.viewing_history_page = False
+        self.conversation_future = None
+        self.page_future = None
+        self.total_tokens = 0
+        self.total_cost = None
+        self.app.refresh_tab(self)
+        self.add_system_msg("Chat cleared")
+
+    def new_conversation(self):
+        self.clear()
+        self.add_system_msg("New conversation")
+
+    def persist_message(self, node):
+        """Save a completed message to the history store, under its parent"""
+        store = self.app.store
+        if store is None:
+            return
+        content, attachments = node.message['content'], node.message.get('attachments')
+        if self.session_id is None:
+            self.session_id = store.create_session(content or (attachments[0]['name'] if attachments else ''))
+        node.seq = store.append_message(self.session_id, node.message['role'], content, attachments, node.parent.seq)
+
+    def open_session(self, session_id, title, before_seq=None):
+        """Show a stored conversation - renders one page, loads context in the background"""
+        if self.is_streaming:
+            self.add_system_msg("ℹ️ History can be opened here once the answer has finished")
+            return
+        if session_id != self.session_id:
+            self.session_id = session_id
+            self.title = title[:18]
+            self.tree = ConversationTree()
+            self.reset_compaction()
+            self.total_tokens = 0
+            self.total_cost = None
+            self.set_conversation_loading(self.app.store.load_tree_async(session_id))
+        self.show_history_page(before_seq)
+
+    def set_conversation_loading(self, future):
+        """Block sending until the full context of an opened session is loaded"""
+        self.conversation_future = future
+        self.app.refresh_tab(self)
+        if future is not None:
+            self.poll_conversation_load(future)
+
+    def poll_conversation_load(self, future):
+        if future is not self.conversation_future:
+            return
+        if not future.done():
+            self.after(20, lambda: self.poll_conversation_load(future))
+            return
+        try:
+            self.tree = future.result()
+        except Exception as e:
+            self.tree = ConversationTree()
+            self.add_system_msg(f"❌ {e}")
+        self.bind_page_frames()
+        totals = self.app.ledger.session_totals(self.session_id)
+        if totals.get('turns'):
+            self.total_tokens = total_tokens(totals)
+            self.total_cost = totals['cost']
+        else:
+            self.total_tokens = sum(message_chars(m) for m in self.conversation) // 4
+        self.set_conversation_loading(None)
+        self.dispatch_next()
+
+    def show_history_page(self, before_seq, after_seq=None):
+        """Render one page of the current session's selected branch (before_seq None = newest page)"""
+        store = self.app.store
+        session_id = self.session_id
+        self.page_future = store.read_async(lambda: (
+            store.load_messages(session_id, before_seq, after_seq=after_seq), store.head(session_id)))
+        self.app.refresh_tab(self)
+        self.poll_history_page(self.page_future)
+
+    def poll_history_page(self, future):
+        if future is not self.page_future:
+            return
+        if not future.done():
+            self.after(20, lambda: self.poll_history_page(future))
+            return
+        self.page_future = None
+        try:
+            page, head = future.result()
+        except Exception as e:
+            self.add_system_msg(f"❌ {e}")
+            self.dispatch_next()
+            return
+        for w in self.chat_scroll.winfo_children():
+            w.destroy()
+        self.message_widgets = {}
+        self.page_frames = {}
+
+        if page and page[0]['parent'] != ROOT_SEQ:
+            ctk.CTkButton(self.chat_scroll, text="▲ Earlier messages", height=26, font=("Arial", 10),
+                fg_color="#444466", hover_color="#555577",
+                command=lambda: self.show_history_page(page[0]['seq'])).pack(pady=4)
+        for msg in page:
+            if msg['role'] == 'user':
+                frame = self.add_user_message(msg['content'], msg['created'], msg.get('attachments'))
+            else:
+                frame = self.add_ai_message(msg['content'], msg['created'])
+            self.page_frames[msg['seq']] = frame
+
+        newer = bool(page) and head != page[-1]['seq']
+        self.viewing_history_page = newer
+        if newer:
+            ctk.CTkButton(self.chat_scroll, text="▼ Newer messages", height=26, font=("Arial", 10),
+                fg_color="#444466", hover_color="#555577",
+                command=lambda: self.show_history_page(None, page[-1]['seq'])).pack(pady=4)
+        if self.conversation_future is None:
+            self.bind_page_frames()
+        self.scroll_to_bottom()
+        self.dispatch_next()
+
+    def bind_page_frames(self):
+        """Tie the rendered history page to the loaded tree, adding the branch controls"""
+        nodes = {node.seq: node for node in self.tree.path}
+        for seq, frame in self.page_frames.items():
+            node = nodes.get(seq)
+            if node is not None:
+                self.mark(node, frame)
+        self.page_frames = {}
+
+
+class PerfHUD(ctk.CTkFrame):
+    """Performance overlay (F12) - its monitor only runs while it is shown"""
+
+    REFRESH_MS = 500
+
+    def __init__(self, app):
+        super().__init__(app, fg_color="#000000", corner_radius=6, border_width=1, border_color="#444")
+        self.app = app
+        self.monitor = LoopMonitor(self)
+        self.refresh_job = None
+        self.label = ctk.CTkLabel(self, text="", font=("Consolas", 10), text_color="#50fa7b",
+            justify="left", anchor="w")
+        self.label.pack(fill="x", padx=8, pady=(6, 2))
+        ctk.CTkButton(self, text="Export snapshot", height=22, font=("Arial", 9), fg_color="#333",
+            hover_color="#555", command=self.export).pack(fill="x", padx=8, pady=(0, 6))
+
+    @property
+    def visible(self):
+        return self.monitor.running
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def show(self):
+        self.place(relx=1.0, x=-12, y=56, anchor="ne")
+        self.lift()
+        self.monitor.start()
+        self.refresh()
+
+    def hide(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        self.monitor.stop()
+        self.place_forget()
+
+    def refresh(self):
+        m = self.metrics()
+        rate = f"{m['tokens_per_sec']:.1f}" if m['tokens_per_sec'] is not None else "-"
+        ttft = f"{m['ttft_ms']:.0f} ms" if m['ttft_ms'] is not None else "-"
+        rss = f"{m['rss_mb']:.1f} MB" if m['rss_mb'] is not None else "-"
+        queues = describe_queues(m['queues']) if m['queues'] else ""
+        self.label.configure(text=(
+            f"FPS        {m['fps']:.0f}\n"
+            f"Loop lag   {m['loop_lag_ms']:.1f} ms (max {m['max_loop_lag_ms']:.0f})\n"
+            f"Widgets    {m['widgets']}\n"
+            f"RSS        {rss}\n"
+            f"Tokens/s   {rate}\n"
+            f"TTFT       {ttft}\n"
+            f"Unrendered {m['pending_chars']} chars\n"
+            f"Stalls     {m['stalls']}\n"
+            f"Timeouts   {m['connect_timeouts']}/{m['ttft_timeouts']}/{m['idle_timeouts']} (conn/TTFT/idle)\n"
+            f"Hedges     {m['hedges_won']} won / {m['hedges_sent']} sent"
+            + (f"\nQueue wait\n{queues}" if queues else "")))
+        self.refresh_job = self.after(self.REFRESH_MS, self.refresh)
+
+    def metrics(self):
+        tab = self.app.active_tab
+        rss = process_rss()
+        counts = dict.fromkeys(('connect_timeouts', 'ttft_timeouts', 'idle_timeouts',
+            'hedges_sent', 'hedges_won', 'hedges_lost'), 0)
+        counts.update(counters())
+        client = self.app.client
+        if isinstance(client, client_process.ProcessClient):
+            for name, value in client.worker.counters().items():
+                counts[name] = counts.get(name, 0) + value
+        return {
+            'tab': tab.title,
+            'streaming': tab.is_streaming,
+            'fps': self.monitor.fps,
+            'loop_lag_ms': self.monitor.lag_ms,
+            'max_loop_lag_ms': self.monitor.max_lag_ms,
+            'widgets': count_widgets(tab.chat_scroll),
+            'rss_mb': rss / 1024 / 1024 if rss is not None else None,
+            'tokens_per_sec': tab.tokens_per_sec(),
+            'ttft_ms': tab.last_ttft_ms,
+            'pending_chars': tab.pending_chars(),
+            'stalls': self.app.watchdog.stall_count,
+            'queues': client.scheduler.stats() if client is not None else None,
+            **counts,
+        }
+
+    def export(self):
+        tab = self.app.active_tab
+        metrics = self.metrics()
+        metrics['tabs'] = len(self.app.tabs)
+        metrics['conversation_messages'] = len(tab.conversation)
+        if tab.is_streaming and tab.stream_bridge is not None:
+            metrics['stream_bridge'] = tab.stream_bridge.stats()
+        try:
+            path = export_snapshot(metrics)
+        except OSError as e:
+            self.app.add_system_msg(f"❌ Can't save snapshot: {e}")
+            return
+        self.app.add_system_msg(f"📈 Performance snapshot saved to {path}")
 
 
 class SimpleAIChat(ctk.CTk):
     """Simple AI Chat Window"""
 
+    SEND_MODES = {"Single": "single", "Fan-out": "fanout", "Race": "race"}
+
     def __init__(self):
         super().__init__()
         self.title("AI Chat - xiaomimimoapi - Jokerwpx")
@@ -199,17 +1684,37 @@ class SimpleAIChat(ctk.CTk):
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
+        # One client (and connection pool) shared by every tab
         self.client = None
-        self.is_streaming = False
-        self.total_tokens = 0
-        self.conversation = []
-        self.current_response = ""
-        self.stream_buffer = ""
-        self.last_update = 0
+        self.tabs = []
+        self.tab_buttons = {}
+        self.active_tab = None
+        self.tab_counter = 0
+
+        # Persistent history (optional - the chat works without it)
+        try:
+            self.store = SessionStore()
+        except Exception:
+            self.store = None
+        self.ledger = UsageLedger(self.store)
+        self.compactor = Compactor()
+        self.hedging = HedgePolicy(self.ledger.recent_ttfts)
+        self.perf_hud = None  # created on first F12
+        self.shown_health = None  # last probe result shown in the status bar
+        self.watchdog = StallWatchdog(self)
+        try:
+            self.attachments = AttachmentStore()
+        except Exception:
+            self.attachments = None
 
         self.create_widgets()
         self.setup()
         self.bind("<Control-Return>", lambda e: self.send_message())
+        self.bind("<Control-t>", lambda e: self.new_tab())
+        self.bind("<F12>", lambda e: self.toggle_perf_hud())
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.watchdog.start()
+        self.poll_health()
 
     def create_widgets(self):
         # Top bar
@@ -218,10 +1723,14 @@ class SimpleAIChat(ctk.CTk):
         top.pack_propagate(False)
 
         ctk.CTkLabel(top, text="🤖 AI Chat - xiaomimimoapi - Jokerwpx", font=("Arial", 14, "bold")).pack(side="left", padx=15, pady=10)
-        
+
         # GitHub button
         ctk.CTkButton(top, text="GitHub", width=70, height=28, font=("Arial", 11),
             fg_color="#333", hover_color="#555", command=self.open_github).pack(side="left", padx=5)
+        ctk.CTkButton(top, text="History", width=70, height=28, font=("Arial", 11),
+            fg_color="#333", hover_color="#555", command=self.open_history).pack(side="left", padx=5)
+        ctk.CTkButton(top, text="Usage", width=60, height=28, font=("Arial", 11),
+            fg_color="#333", hover_color="#555", command=self.open_usage).pack(side="left", padx=5)
         ctk.CTkButton(top, text="⚙️", width=40, height=32, font=("Arial", 16),
             fg_color="transparent", hover_color="#333355", command=self.open_settings).pack(side="right", padx=10)
 
@@ -236,9 +1745,19 @@ class SimpleAIChat(ctk.CTk):
         main = ctk.CTkFrame(self, fg_color="#0f0f1a")
         main.pack(fill="both", expand=True)
 
-        # Chat scroll
-        self.chat_scroll = ctk.CTkScrollableFrame(main, fg_color="#16162a", corner_radius=8)
-        self.chat_scroll.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        # Tab strip
+        tab_bar = ctk.CTkFrame(main, fg_color="transparent", height=30)
+        tab_bar.pack(fill="x", padx=10, pady=(8, 0))
+        self.tab_strip = ctk.CTkFrame(tab_bar, fg_color="transparent")
+        self.tab_strip.pack(side="left", fill="x", expand=True)
+        ctk.CTkButton(tab_bar, text="✕", width=28, height=24, font=("Arial", 10),
+            fg_color="#444466", hover_color="#555577", command=self.close_tab).pack(side="right")
+        ctk.CTkButton(tab_bar, text="+", width=28, height=24, font=("Arial", 12),
+            fg_color="#444466", hover_color="#555577", command=self.new_tab).pack(side="right", padx=(0, 4))
+
+        # Chat tabs
+        self.tab_container = ctk.CTkFrame(main, fg_color="transparent")
+        self.tab_container.pack(fill="both", expand=True, padx=10, pady=(4, 5))
 
         # Input
         inp_container = ctk.CTkFrame(main, fg_color="#1e1e3a", corner_radius=8)
@@ -247,21 +1766,27 @@ class SimpleAIChat(ctk.CTk):
         # Hidden storage for actual code content
         self.code_content = ""
         self.has_code = False
+        self.pending_paste = None
+        self.pending_send = None     # paste being stored (and diffed) before its message is sent
+        self.pending_attachments = []
+
+        # Attached files waiting to be sent (shown only when there are any)
+        self.attach_frame = ctk.CTkFrame(inp_container, fg_color="transparent")
 
         # Code preview frame (shown when code detected)
         self.code_preview_frame = ctk.CTkFrame(inp_container, fg_color="#1e1e2e", corner_radius=6)
-        
+
         self.code_preview_header = ctk.CTkFrame(self.code_preview_frame, fg_color="#2d2d3d", corner_radius=6)
         self.code_preview_header.pack(fill="x", padx=2, pady=2)
-        
+
         self.code_preview_label = ctk.CTkLabel(self.code_preview_header, text="📄 code (0 lines)",
             font=("Arial", 10), text_color="#888")
         self.code_preview_label.pack(side="left", padx=8, pady=4)
-        
+
         self.code_expand_btn = ctk.CTkButton(self.code_preview_header, text="View", width=50, height=22,
             font=("Arial", 9), fg_color="#3a7ca5", hover_color="#2d6a8f", command=self.view_code_input)
         self.code_expand_btn.pack(side="right", padx=4, pady=4)
-        
+
         self.code_clear_btn = ctk.CTkButton(self.code_preview_header, text="✕", width=30, height=22,
             font=("Arial", 9), fg_color="#555", hover_color="#666", command=self.clear_code_input)
         self.code_clear_btn.pack(side="right", padx=2, pady=4)
@@ -283,36 +1808,166 @@ class SimpleAIChat(ctk.CTk):
         ctk.CTkButton(btns, text="New", width=60, height=32, font=("Arial", 11),
             fg_color="#444466", hover_color="#555577", corner_radius=8, command=self.new_conversation).pack(side="right")
         ctk.CTkLabel(btns, text="Ctrl+Enter", font=("Arial", 9), text_color="#555").pack(side="left")
+        ctk.CTkButton(btns, text="📎 Attach file", width=100, height=28, font=("Arial", 10),
+            fg_color="#444466", hover_color="#555577", corner_radius=8, command=self.attach_file).pack(side="left", padx=8)
+        # Single model, all compare models side by side, or first token wins
+        self.mode_selector = ctk.CTkSegmentedButton(btns, values=list(self.SEND_MODES), font=("Arial", 10), height=28)
+        self.mode_selector.set("Single")
+        self.mode_selector.pack(side="left")
+
+        self.new_tab()
 
     def setup(self):
         self.use_real_api()
 
+    def toggle_perf_hud(self):
+        if self.perf_hud is None:
+            self.perf_hud = PerfHUD(self)
+        self.perf_hud.toggle()
+
     def open_github(self):
         """Open GitHub repository"""
         import webbrowser
         webbrowser.open("https://github.com/joker123-wpx/Aichat-py-xiaomimimo-api.git")
 
+    def new_tab(self):
+        """Open a new conversation tab and switch to it"""
+        self.tab_counter += 1
+        tab = ChatTab(self.tab_container, self, f"Chat {self.tab_counter}")
+        self.tabs.append(tab)
+        btn = ctk.CTkButton(self.tab_strip, text=tab.title, width=110, height=24, font=("Arial", 10),
+            fg_color="#2d2d4d", hover_color="#3d3d5d", command=lambda: self.select_tab(tab))
+        btn.pack(side="left", padx=(0, 4))
+        self.tab_buttons[tab] = btn
+        self.select_tab(tab)
+        return tab
+
+    def select_tab(self, tab):
+        if tab is self.active_tab:
+            return
+        previous = self.active_tab
+        if previous is not None:
+            previous.pack_forget()
+            previous.set_visible(False)
+            self.tab_buttons[previous].configure(fg_color="#2d2d4d")
+        self.active_tab = tab
+        tab.pack(fill="both", expand=True)
+        tab.set_visible(True)
+        self.tab_buttons[tab].configure(fg_color="#3a7ca5")
+        self.refresh_tab(tab)
+
+    def close_tab(self):
+        """Close the active tab (its stream is dropped)"""
+        tab = self.active_tab
+        index = self.tabs.index(tab)
+        tab.stop_stream()
+        tab.reset_compaction()
+        self.tabs.remove(tab)
+        self.tab_buttons.pop(tab).destroy()
+        self.active_tab = None
+        tab.destroy()
+        if self.tabs:
+            self.select_tab(self.tabs[min(index, len(self.tabs) - 1)])
+        else:
+            self.new_tab()
+
+    def refresh_tab(self, tab):
+        """Sync the tab strip and, for the active tab, the status bar and Send button"""
+        btn = self.tab_buttons.get(tab)
+        if btn is not None:
+            marker = " ●" if tab.is_streaming else ""
+            queued = f" +{len(tab.outbox)}" if tab.outbox else ""
+            btn.configure(text=f"{tab.title}{marker}{queued}")
+        if tab is not self.active_tab:
+            return
+        # While busy, Send queues the message instead
+        self.send_btn.configure(state="normal", text="Queue" if tab.is_busy else "Send")
+        if tab.is_streaming:
+            self.status_label.configure(text="● Thinking...", text_color="#f0ad4e")
+        elif self.client is not None:
+            health = self.client.health.latest
+            self.status_label.configure(text=describe_health(health),
+                text_color=STATUS_COLORS[health.status] if health is not None else "#f0ad4e")
+        else:
+            self.status_label.configure(text="● Disconnected", text_color="#ff5555")
+        self.refresh_tokens(tab)
+
+    def poll_health(self):
+        """Show new background probe results (the probe thread never touches Tk)"""
+        health = self.client.health.latest if self.client is not None else None
+        if health is not self.shown_health:
+            self.shown_health = health
+            self.refresh_tab(self.active_tab)
+        self.after(1000, self.poll_health)
+
+    def refresh_tokens(self, tab):
+        if tab is self.active_tab:
+            cost = f" · ${tab.total_cost:.4f}" if tab.total_cost is not None else ""
+            self.token_label.configure(text=f"Tokens: {tab.live_tokens()}{cost}")
+
     def on_paste(self, event=None):
-        """Handle paste event - check for large code"""
+        """Handle paste event - intercept oversized pastes, classify off the UI thread"""
+        try:
+            text = self.clipboard_get()
+        except Exception:
+            return None
+
+        if is_oversized(text):
+            # Never insert it into the textbox - show it as a preview instead
+            self.pending_paste = classify_paste_async(text)
+            self.show_code_preview(None)
+            self.poll_paste_classification(self.pending_paste, None)
+            return "break"
+
         self.after(10, self.check_for_code_paste)
         return None
 
     def check_for_code_paste(self):
         """Check if pasted content is large code"""
-        text = self.user_input.get("1.0", "end-1c").strip()
-        lines = text.split('\n')
-        
+        text = self.user_input.get("1.0", "end-1c")
+        # Needs more than 5 lines - skip classification otherwise
+        if text.strip().count('\n') < 5:
+            return
+        self.poll_paste_classification(classify_paste_async(text), text)
+
+    def poll_paste_classification(self, future, typed_text):
+        """Wait for a background classification without blocking the main loop
+
+        typed_text is the textbox content that was classified, or None for an
+        intercepted paste that never reached the textbox.
+        """
+        if not future.done():
+            self.after(15, lambda: self.poll_paste_classification(future, typed_text))
+            return
+
+        result = future.result()
+        if typed_text is None:
+            # Cleared or replaced while classifying
+            if self.pending_paste is not future:
+                return
+            self.pending_paste = None
+            self.code_content = result['text']
+            self.has_code = True
+            self.show_code_preview(result['lines'], "code" if result['is_code'] else "text")
+            return
+
         # If more than 5 lines and looks like code, switch to code preview
-        if len(lines) > 5 and (self.is_code_content(text) or '```' in text):
-            self.code_content = text
+        if result['lines'] > 5 and result['is_code']:
+            # Input changed while classifying - leave it alone
+            if self.user_input.get("1.0", "end-1c") != typed_text:
+                return
+            self.code_content = result['text']
             self.has_code = True
             self.user_input.delete("1.0", "end")
-            self.show_code_preview(len(lines))
+            self.show_code_preview(result['lines'])
 
-    def show_code_preview(self, line_count):
-        """Show code preview above input"""
+    def show_code_preview(self, line_count, kind="code"):
+        """Show code preview above input (line_count None while still analyzing)"""
         self.code_preview_frame.pack(fill="x", padx=8, pady=(8, 4), before=self.user_input)
-        self.code_preview_label.configure(text=f"📄 code ({line_count} lines)")
+        if line_count is None:
+            self.code_preview_label.configure(text="📄 analyzing paste...")
+        else:
+            self.code_preview_label.configure(text=f"📄 {kind} ({line_count} lines)")
         self.user_input.configure(height=40)
         self.user_input.focus()
 
@@ -322,28 +1977,79 @@ class SimpleAIChat(ctk.CTk):
         popup.title("View Code")
         popup.geometry("700x500")
         popup.transient(self)
-        
+
         text = ctk.CTkTextbox(popup, font=("Consolas", 11))
         text.pack(fill="both", expand=True, padx=10, pady=10)
         text.insert("1.0", self.code_content)
-        
+
         def save_and_close():
             self.code_content = text.get("1.0", "end-1c")
             lines = len(self.code_content.split('\n'))
             self.code_preview_label.configure(text=f"📄 code ({lines} lines)")
             popup.destroy()
-        
+
         btn_frame = ctk.CTkFrame(popup, fg_color="transparent")
         btn_frame.pack(fill="x", padx=10, pady=(0, 10))
         ctk.CTkButton(btn_frame, text="Save & Close", command=save_and_close).pack(side="right")
 
     def clear_code_input(self):
         """Clear code input"""
+        self.pending_paste = None
+        self.pending_send = None
         self.code_content = ""
         self.has_code = False
         self.code_preview_frame.pack_forget()
         self.user_input.configure(height=60)
 
+    def attach_file(self):
+        """Pick files to attach - they are hashed and stored off the UI thread"""
+        if self.attachments is None:
+            self.add_system_msg("❌ Attachments are not available")
+            return
+        for path in filedialog.askopenfilenames(parent=self, title="Attach file"):
+            self.poll_attachment(self.attachments.add_file_async(path), os.path.basename(path))
+
+    def poll_attachment(self, future, name):
+        if not future.done():
+            self.after(30, lambda: self.poll_attachment(future, name))
+            return
+        try:
+            ref = future.result()
+        except (AttachmentError, OSError) as e:
+            self.add_system_msg(f"❌ Can't attach {name}: {e}")
+            return
+        if all(r['hash'] != ref['hash'] for r in self.pending_attachments):
+            self.pending_attachments.append(ref)
+        self.refresh_attachments()
+
+    def remove_attachment(self, ref):
+        self.pending_attachments.remove(ref)
+        self.refresh_attachments()
+
+    def refresh_attachments(self):
+        for w in self.attach_frame.winfo_children():
+            w.destroy()
+        if not self.pending_attachments:
+            self.attach_frame.pack_forget()
+            return
+        for ref in self.pending_attachments:
+            chip = ctk.CTkFrame(self.attach_frame, fg_color="#2d2d3d", corner_radius=6)
+            chip.pack(fill="x", pady=1)
+            ctk.CTkLabel(chip, text=describe_attachment(ref), font=("Arial", 10),
+                text_color="#8be9fd").pack(side="left", padx=8)
+            ctk.CTkButton(chip, text="✕", width=26, height=20, font=("Arial", 9), fg_color="#555",
+                hover_color="#666", command=lambda r=ref: self.remove_attachment(r)).pack(side="right", padx=4, pady=2)
+        if not self.attach_frame.winfo_ismapped():
+            self.attach_frame.pack(fill="x", padx=8, pady=(8, 0), before=self.user_input)
+
+    def store_paste_async(self, text):
+        """Turn a large paste into an attachment off the UI thread; None if there is no store"""
+        if self.attachments is None:
+            return None
+        # A revision of something attached earlier in this conversation is sent as a diff
+        earlier = [ref for msg in self.active_tab.conversation for ref in msg.get('attachments', ())]
+        return self.attachments.add_text_async(text, "paste.txt", earlier)
+
     def open_settings(self):
         APIConfigDialog(self, self.reload_api)
 
@@ -353,248 +2059,132 @@ class SimpleAIChat(ctk.CTk):
     def use_real_api(self):
         # Use config from user's home directory
         config_path = os.path.join(os.path.expanduser("~"), ".aichat_config.env")
+        if self.client is not None:
+            self.client.health.stop()
+            if isinstance(self.client, client_process.ProcessClient):
+                self.client.worker.stop()
         try:
-            self.client = APIClient(config_path)
-            self.status_label.configure(text="● Connected", text_color="#50fa7b")
+            # CLIENT_PROCESS=1: requests run in a worker process, off the Tk process's GIL
+            client_class = client_process.ProcessClient if client_process.enabled(config_path) else APIClient
+            self.client = client_class(config_path)
+            self.client.health.start()
+            self.shown_health = None
+            self.refresh_tab(self.active_tab)
             self.add_system_msg(f"Connected: {self.client.model}")
         except Exception as e:
             self.status_label.configure(text="● Disconnected", text_color="#ff5555")
             self.add_system_msg(f"❌ {e}\nClick ⚙️ to configure API")
 
-    def add_role_label(self, role, color):
-        """Add role label with timestamp"""
-        frame = ctk.CTkFrame(self.chat_scroll, fg_color="transparent")
-        frame.pack(fill="x", anchor="w", pady=(8, 2), padx=5)
-        
-        ts = datetime.datetime.now().strftime("%H:%M")
-        ctk.CTkLabel(frame, text=f"[{role}]", font=("Arial", 11, "bold"), 
-            text_color=color).pack(side="left")
-        ctk.CTkLabel(frame, text=f" {ts}", font=("Arial", 9), 
-            text_color="#555").pack(side="left")
-
-    def add_text(self, text):
-        """Add plain text"""
-        label = ctk.CTkLabel(self.chat_scroll, text=text, font=("Arial", 11),
-            text_color="#e0e0e0", wraplength=750, justify="left", anchor="w")
-        label.pack(fill="x", anchor="w", padx=10, pady=2)
-
-    def add_code_block(self, code, language=""):
-        """Add collapsible code block"""
-        block = CodeBlock(self.chat_scroll, code, language)
-        block.pack(fill="x", padx=10, pady=4)
-
-    def render_content(self, content):
-        """Parse and render content with code blocks"""
-        code_pattern = r'```(\w*)\n?(.*?)```'
-        last_end = 0
-        
-        for match in re.finditer(code_pattern, content, re.DOTALL):
-            # Text before code
-            text_before = content[last_end:match.start()].strip()
-            if text_before:
-                self.add_text(text_before)
-            
-            # Code block
-            lang = match.group(1)
-            code = match.group(2).strip()
-            if code:
-                self.add_code_block(code, lang)
-            
-            last_end = match.end()
-        
-        # Remaining text
-        remaining = content[last_end:].strip()
-        if remaining:
-            self.add_text(remaining)
-
     def add_system_msg(self, text):
-        """Add system message"""
-        self.add_role_label("System", "#bd93f9")
-        self.add_text(text)
-        self.scroll_to_bottom()
-
-    def is_code_content(self, text):
-        """Check if text looks like code"""
-        # Already has code fence
-        if '```' in text:
-            return False
-        
-        code_indicators = [
-            r'^\s*(def |class |import |from |if |for |while |return |async |await )',  # Python
-            r'^\s*(function |const |let |var |import |export |if |for |while |return )',  # JS
-            r'^\s*(<\?php|<\w+>|<\w+\s)',  # PHP/HTML/XML
-            r'[{}\[\]();]',  # Brackets common in code
-            r'^\s*#include|^\s*using namespace',  # C/C++
-            r'=>|->|\$\w+|@\w+',  # Arrow functions, variables
-        ]
-        
-        lines = text.strip().split('\n')
-        if len(lines) < 2:
-            return False
-        
-        code_line_count = 0
-        for line in lines:
-            for pattern in code_indicators:
-                if re.search(pattern, line, re.MULTILINE):
-                    code_line_count += 1
-                    break
-        
-        # If more than 30% lines look like code
-        return code_line_count / len(lines) > 0.3
+        """Add system message to the active tab"""
+        self.active_tab.add_system_msg(text)
 
-    def wrap_as_code(self, text):
-        """Wrap text as code block if it looks like code"""
-        if self.is_code_content(text):
-            return f"```\n{text}\n```"
-        return text
+    def send_message(self):
+        if self.pending_send is not None or self.pending_paste is not None:
+            # The paste is still being stored or analyzed (the preview says so)
+            return
+        text_input = self.user_input.get("1.0", "end-1c").strip()
+        attachments = list(self.pending_attachments)
+        mode = self.SEND_MODES[self.mode_selector.get()]
 
-    def add_user_message(self, content):
-        """Add user message with auto code detection"""
-        self.add_role_label("You", "#4CAF50")
-        wrapped = self.wrap_as_code(content)
-        self.render_content(wrapped)
-        self.scroll_to_bottom()
+        if self.has_code and self.code_content:
+            # Stored once by hash and sent as its own content block
+            future = self.store_paste_async(self.code_content)
+            if future is not None:
+                self.pending_send = future
+                self.code_preview_label.configure(text="📄 preparing paste...")
+                self.poll_paste_send(future, self.active_tab, text_input, attachments, mode)
+                return
+            self.send_to_tab(self.active_tab, self.inline_code(text_input), attachments, mode)
+            return
+        self.send_to_tab(self.active_tab, text_input, attachments, mode)
 
-    def add_ai_message(self, content):
-        """Add AI message with code block support"""
-        self.add_role_label("AI", "#64b5f6")
-        self.render_content(content)
-        self.scroll_to_bottom()
+    def poll_paste_send(self, future, tab, text_input, attachments, mode):
+        """Send once the paste is stored - the revision diff can take a while"""
+        if not future.done():
+            self.after(15, lambda: self.poll_paste_send(future, tab, text_input, attachments, mode))
+            return
+        if self.pending_send is not future:
+            # Cleared meanwhile
+            return
+        self.pending_send = None
+        try:
+            ref = future.result()
+        except (AttachmentError, OSError):
+            self.send_to_tab(tab, self.inline_code(text_input), attachments, mode)
+            return
+        self.send_to_tab(tab, text_input, attachments + [ref], mode)
 
-    def scroll_to_bottom(self):
-        """Scroll chat to bottom"""
-        self.chat_scroll._parent_canvas.yview_moveto(1.0)
+    def inline_code(self, text_input):
+        """The message with the paste as a code block, when it can't be an attachment"""
+        if text_input:
+            return f"{text_input}\n\n```\n{self.code_content}\n```"
+        return f"```\n{self.code_content}\n```"
 
-    def send_message(self):
-        if self.is_streaming:
+    def send_to_tab(self, tab, user_text, attachments, mode):
+        if tab not in self.tabs:
             return
-
-        # Combine code and text
-        text_input = self.user_input.get("1.0", "end-1c").strip()
-        
-        if self.has_code and self.code_content:
-            # Has code block + optional text
-            if text_input:
-                user_text = f"{text_input}\n\n```\n{self.code_content}\n```"
-            else:
-                user_text = f"```\n{self.code_content}\n```"
-        else:
-            user_text = text_input
-        
-        if not user_text:
+        if not (user_text or attachments) or not tab.send(user_text, attachments, mode):
+            if self.has_code:
+                lines = len(self.code_content.split('\n'))
+                self.code_preview_label.configure(text=f"📄 code ({lines} lines)")
             return
 
-        self.conversation.append({"role": "user", "content": user_text})
-        self.add_user_message(user_text)
-        
-        # Clear input
+        # Clear input - files attached while the paste was being stored stay
+        self.pending_attachments = [r for r in self.pending_attachments if r not in attachments]
+        self.refresh_attachments()
         self.code_content = ""
         self.has_code = False
         self.code_preview_frame.pack_forget()
         self.user_input.configure(height=60)
         self.user_input.delete("1.0", "end")
 
-        self.send_btn.configure(state="disabled", text="Thinking...")
-        self.status_label.configure(text="● Thinking...", text_color="#f0ad4e")
-        self.is_streaming = True
-        self.current_response = ""
-
-        # Add AI label and streaming text area
-        self.add_role_label("AI", "#64b5f6")
-        self.stream_text = ctk.CTkTextbox(self.chat_scroll, height=60, font=("Consolas", 11),
-            fg_color="#1a1a2e", text_color="#e0e0e0", border_width=0, corner_radius=6)
-        self.stream_text.pack(fill="x", padx=10, pady=4)
-
-        threading.Thread(target=self.process_message, daemon=True).start()
-
-    def process_message(self):
-        try:
-            system_prompt = get_system_prompt()
-            messages = [{"role": "system", "content": system_prompt}] + self.conversation
-            
-            import time
-            self.stream_buffer = ""
-            self.last_update = time.time()
-            char_count = 0
-
-            for chunk in self.client.send_message_stream(messages):
-                self.current_response += chunk
-                self.stream_buffer += chunk
-                char_count += len(chunk)
-                
-                # Batch updates - only update UI every 100ms or 50 chars
-                now = time.time()
-                if now - self.last_update > 0.1 or len(self.stream_buffer) > 50:
-                    buf = self.stream_buffer
-                    tokens = char_count // 4
-                    self.stream_buffer = ""
-                    self.last_update = now
-                    self.after(0, lambda b=buf, t=tokens: self.append_stream_with_tokens(b, t))
-
-            # Flush remaining buffer
-            if self.stream_buffer:
-                buf = self.stream_buffer
-                tokens = char_count // 4
-                self.after(0, lambda b=buf, t=tokens: self.append_stream_with_tokens(b, t))
-
-            self.conversation.append({"role": "assistant", "content": self.current_response})
-            
-            input_tokens = len(self.conversation[-2]['content']) // 4
-            output_tokens = len(self.current_response) // 4
-            self.total_tokens += input_tokens + output_tokens
-
-            self.after(0, self.finish_response)
-
-        except Exception as ex:
-            error_msg = str(ex)
-            self.after(0, lambda: self.safe_destroy_stream())
-            self.after(0, lambda msg=error_msg: self.add_text(f"❌ {msg}"))
-
-        finally:
-            self.is_streaming = False
-            self.after(0, lambda: self.send_btn.configure(state="normal", text="Send"))
-            self.after(0, lambda: self.status_label.configure(text="● Connected", text_color="#50fa7b"))
-
-    def safe_destroy_stream(self):
-        try:
-            if hasattr(self, 'stream_text') and self.stream_text.winfo_exists():
-                self.stream_text.destroy()
-        except:
-            pass
-
-    def append_stream_with_tokens(self, text, tokens):
-        try:
-            if hasattr(self, 'stream_text') and self.stream_text.winfo_exists():
-                self.stream_text.configure(state="normal")
-                self.stream_text.insert("end", text)
-                self.stream_text.see("end")
-                # Update tokens in real-time
-                input_t = len(self.conversation[-1]['content']) // 4 if self.conversation else 0
-                self.token_label.configure(text=f"Tokens: {self.total_tokens + input_t + tokens}")
-        except:
-            pass
-
-    def finish_response(self):
-        """Replace streaming text with parsed content"""
-        self.stream_text.destroy()
-        self.render_content(self.current_response)
-        self.token_label.configure(text=f"Tokens: {self.total_tokens}")
-        self.scroll_to_bottom()
-
     def clear_chat(self):
-        for w in self.chat_scroll.winfo_children():
-            w.destroy()
-        self.conversation = []
-        self.total_tokens = 0
-        self.token_label.configure(text="Tokens: 0")
-        self.add_system_msg("Chat cleared")
+        self.active_tab.clear()
 
     def new_conversation(self):
-        self.clear_chat()
-        self.add_system_msg("New conversation")
+        self.active_tab.new_conversation()
+
+    def open_history(self):
+        if self.store is None:
+            self.add_system_msg("❌ History is not available")
+            return
+        HistoryDialog(self, self.store, self.open_session)
+
+    def open_usage(self):
+        if self.store is None:
+            self.add_system_msg("❌ Usage ledger is not available")
+            return
+        UsageDialog(self, self.ledger, self.client.cache if self.client is not None else None)
+
+    def open_session(self, session_id, title, before_seq=None):
+        """Show a stored conversation in its tab, the active tab if unused, or a new tab"""
+        tab = next((t for t in self.tabs if t.session_id == session_id), None)
+        if tab is None:
+            tab = self.active_tab if self.active_tab.is_empty else self.new_tab()
+        self.select_tab(tab)
+        tab.open_session(session_id, title, before_seq)
+        self.refresh_tab(tab)
+
+    def on_close(self):
+        for tab in self.tabs:
+            tab.stop_stream()
+        if self.client is not None:
+            self.client.health.stop()
+            if isinstance(self.client, client_process.ProcessClient):
+                self.client.worker.stop()
+            if self.client.cache is not None:
+                self.client.cache.close()
+        self.watchdog.stop()
+        close_shared()
+        if self.store is not None:
+            self.store.close()
+        self.destroy()
 
 
 def main():
+    # The packaged app re-runs itself for the client worker process
+    multiprocessing.freeze_support()
     app = SimpleAIChat()
     app.mainloop()
 
@@ -5,11 +5,183 @@ Supports custom API endpoints and streaming output
 """
 
 import requests
+import contextlib
+import copy
 import json
+import socket
+from requests.adapters import HTTPAdapter
 import os
-from typing import Dict, List, Optional, Generator, Any
+import time
+from typing import Dict, List, Optional, Generator, Any, Iterator
 from dotenv import load_dotenv
 
+from audit_log import payload_digest, redact, shared_log
+from deadlines import count, watchdog
+from health_probe import HealthProbe
+from response_buffer import ResponseBuffer
+from scheduler import BACKGROUND, INTERACTIVE, Scheduler
+from semantic_cache import CacheHit, SemanticCache
+
+# A resumed stream may repeat the end of the partial answer; the first
+# OVERLAP_CHARS of the continuation are checked against it, and repeats of at
+# least MIN_OVERLAP characters are dropped. Shorter ones are kept: "windo" +
+# "ndow" can't be told from "bana" + "na split", and dropping text the model
+# did send is worse than showing a few letters twice.
+OVERLAP_CHARS = 256
+MIN_OVERLAP = 8
+# Cached answers are replayed in pieces of this size, like a fast stream
+CACHE_REPLAY_CHARS = 64
+
+
+def request_headers(api_key: str) -> Dict[str, str]:
+    """Headers of every API request"""
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {api_key}',
+        'User-Agent': 'AI-Tool-Client/1.0'
+    }
+
+
+class StreamInterrupted(Exception):
+    """The connection failed after the response had started"""
+
+
+def strip_overlap(tail: str, text: str) -> str:
+    """Drop the start of text that repeats the end of tail"""
+    for k in range(min(len(tail), len(text)), MIN_OVERLAP - 1, -1):
+        if tail.endswith(text[:k]):
+            return text[k:]
+    return text
+
+
+def _continuation(deltas: Iterator[str], tail: str, held: str) -> Generator[str, None, None]:
+    """
+    Deltas of a resumed stream without what they repeat of the partial answer
+
+    Args:
+        deltas: Text of the continuation
+        tail: End of the text already yielded
+        held: Trailing whitespace of that text, left out of the prefill
+    """
+    head = []
+    size = 0
+    for text in deltas:
+        head.append(text)
+        size += len(text)
+        if size >= OVERLAP_CHARS:
+            break
+    head = ''.join(head)
+    text = strip_overlap(tail, head)
+    if len(text) == len(head) and held:
+        # The continuation follows the prefill, which had to leave the whitespace out
+        text = strip_overlap(tail[:len(tail) - len(held)], head)
+        if text.startswith(held):
+            # ... and it re-sent that whitespace
+            text = text[len(held):]
+    if text:
+        yield text
+    yield from deltas
+
+
+class StreamResult:
+    """
+    Streamed response
+
+    Iterating yields text deltas exactly like the old generator did. The
+    provider's metadata is recorded as its events go by, so once iteration
+    ends `usage`, `stop_reason`, `model` and `message_id` hold the real values.
+    `ttft_ms` is the time from the request to the first text delta and
+    `finished_at` the perf_counter() when the stream ended normally.
+    `resumes` counts reconnects after the connection dropped mid-answer.
+    `cache_hit` is set when the answer came from the semantic cache.
+    `queue_ms` is how long the request waited for a scheduler slot.
+    """
+
+    def __init__(self):
+        self.usage: Dict[str, int] = {}
+        self.stop_reason: Optional[str] = None
+        self.model: Optional[str] = None
+        self.message_id: Optional[str] = None
+        self.ttft_ms: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.aborted = False
+        self.resumes = 0
+        self.cache_hit: Optional[CacheHit] = None
+        self.queue_ms: Optional[float] = None
+        self.started = time.perf_counter()
+        self._deltas: Optional[Iterator[str]] = None
+        self._response = None
+
+    def __iter__(self) -> Iterator[str]:
+        return self._timed()
+
+    def _timed(self) -> Generator[str, None, None]:
+        for text in self._deltas:
+            if self.ttft_ms is None:
+                self.ttft_ms = (time.perf_counter() - self.started) * 1000
+            yield text
+        self.finished_at = time.perf_counter()
+
+    def close(self):
+        """Stop reading and release the connection"""
+        if self._deltas is not None and hasattr(self._deltas, 'close'):
+            self._deltas.close()
+
+    def abort(self):
+        """
+        Cancel from another thread
+
+        Shuts the socket down, which wakes a read blocked on it (closing the
+        response would wait for that read to return).
+        """
+        self.aborted = True
+        self.shutdown()
+
+    def shutdown(self):
+        """Break the connection without marking the stream aborted"""
+        raw = getattr(self._response, 'raw', None)
+        sock = getattr(getattr(raw, '_connection', None), 'sock', None)
+        if sock is None:
+            # Connection already detached (e.g. "Connection: close") - the socket is behind the body reader
+            reader = getattr(getattr(raw, '_fp', None), 'fp', None)
+            sock = getattr(getattr(reader, 'raw', None), '_sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def handle_event(self, event: Dict[str, Any]) -> Optional[str]:
+        """Record metadata from one SSE event and return its text, if any"""
+        kind = event.get('type')
+        if kind == 'message_start':
+            message = event.get('message') or {}
+            self.message_id = message.get('id', self.message_id)
+            self.model = message.get('model', self.model)
+            self._merge_usage(message.get('usage'))
+            return None
+        if kind == 'message_delta':
+            delta = event.get('delta') or {}
+            self.stop_reason = delta.get('stop_reason', self.stop_reason)
+            self._merge_usage(event.get('usage'))
+            return None
+        if 'delta' in event:
+            return event['delta'].get('text')
+        if 'content' in event:
+            # Non-streaming response format
+            self.message_id = event.get('id', self.message_id)
+            self.model = event.get('model', self.model)
+            self.stop_reason = event.get('stop_reason', self.stop_reason)
+            self._merge_usage(event.get('usage'))
+            return event['content'][0]['text']
+        return None
+
+    def _merge_usage(self, usage: Optional[Dict[str, Any]]):
+        # message_delta carries cumulative counts, so later values win
+        for key, value in (usage or {}).items():
+            if isinstance(value, int):
+                self.usage[key] = value
+
 
 class APIClient:
     """Model API Client"""
@@ -22,7 +194,8 @@ class APIClient:
             config_path: Configuration file path, if None uses environment variables
         """
         if config_path and os.path.exists(config_path):
-            load_dotenv(config_path)
+            # Override so that settings saved in the dialog apply on reload
+            load_dotenv(config_path, override=True)
         else:
             load_dotenv()
 
@@ -30,19 +203,55 @@ class APIClient:
         self.api_key = os.getenv('API_KEY', '')
         self.model = os.getenv('MODEL_NAME', 'gpt-4')
         self.timeout = int(os.getenv('TIMEOUT', '1200'))
+        # Streams get their own deadlines; TIMEOUT stays the read timeout of
+        # non-streaming calls
+        self.connect_timeout = float(os.getenv('CONNECT_TIMEOUT', '10'))
+        self.ttft_timeout = float(os.getenv('TTFT_TIMEOUT', '120'))
+        self.idle_timeout = float(os.getenv('IDLE_TIMEOUT', '60'))
         self.max_tokens = int(os.getenv('MAX_TOKENS', '81920'))
         self.temperature = float(os.getenv('TEMPERATURE', '0.7'))
+        self.pool_size = int(os.getenv('POOL_SIZE', '8'))
+        # Reconnects per answer after a mid-stream failure (0 disables)
+        self.stream_resumes = int(os.getenv('STREAM_RESUMES', '2'))
 
         if not self.api_key:
             raise ValueError("API_KEY not set, please configure in .env file")
 
+        # One keep-alive connection pool shared by every conversation using this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Slots for those connections by priority, so background work can't starve a chat turn
+        self.scheduler = Scheduler(self.pool_size)
+
+        # Audit trail of every call (None when AUDIT_LOG=0)
+        self.audit = shared_log()
+        # Cached endpoint health; background probing is started by the app
+        self.health = HealthProbe(self)
+        # Near-duplicate answer cache (opt-in, shared with with_model copies)
+        self.cache = SemanticCache() if os.getenv('SEMANTIC_CACHE', '0') == '1' else None
+
+    def with_model(self, model: str, base_url: Optional[str] = None) -> 'APIClient':
+        """
+        Client for another model or endpoint
+
+        Shares this client's key, settings and connection pool.
+
+        Args:
+            model: Model name
+            base_url: Endpoint, if different from this client's
+        """
+        other = copy.copy(self)
+        other.model = model
+        if base_url:
+            other.base_url = base_url.rstrip('/')
+        other.health = HealthProbe(other)
+        return other
+
     def _prepare_headers(self) -> Dict[str, str]:
         """Prepare request headers"""
-        return {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.api_key}',
-            'User-Agent': 'AI-Tool-Client/1.0'
-        }
+        return request_headers(self.api_key)
 
     def _prepare_payload(self, messages: List[Dict[str, str]], stream: bool = False) -> Dict[str, Any]:
         """Prepare request payload"""
@@ -76,12 +285,42 @@ class APIClient:
             payload['temperature'] = self.temperature
         return payload
 
-    def send_message(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    def _audit_entry(self, kind: str, url: str, payload: Dict[str, Any], body: bytes) -> Optional[Dict[str, Any]]:
+        """Request half of an audit record, or None when auditing is off"""
+        if self.audit is None:
+            return None
+        entry = {
+            'type': kind,
+            'time': time.time(),
+            'model': payload['model'],
+            'url': url,
+            'payload_sha256': payload_digest(body),
+            'payload_bytes': len(body),
+            'messages': len(payload['messages']),
+            'max_tokens': payload['max_tokens'],
+        }
+        if self.audit.bodies:
+            entry['request_body'] = redact(body.decode('utf-8'))
+        return entry
+
+    def _audit(self, entry: Optional[Dict[str, Any]], started: float, **fields):
+        """Complete an audit record and queue it (never blocks on disk)"""
+        if entry is None:
+            return
+        entry['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        entry.update((k, v) for k, v in fields.items() if v is not None)
+        self.audit.record(entry)
+
+    def send_message(self, messages: List[Dict[str, str]], priority: str = INTERACTIVE,
+                     deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         Send non-streaming message request
 
         Args:
             messages: Message list, format [{"role": "user", "content": "..."}]
+            priority: Scheduler class (scheduler.INTERACTIVE, BACKGROUND or IDLE);
+                None when the caller already holds a slot
+            deadline: Seconds to wait for a scheduler slot at most (None = no limit)
 
         Returns:
             Response data (converted to OpenAI format)
@@ -89,16 +328,25 @@ class APIClient:
         url = f"{self.base_url}/v1/messages"
         headers = self._prepare_headers()
         payload = self._prepare_payload(messages, stream=False)
+        # Serialized once - the same bytes are hashed for the audit log and sent
+        body = json.dumps(payload).encode('utf-8')
+        entry = self._audit_entry('message', url, payload, body)
+        started = time.perf_counter()
+        response = None
 
         try:
-            response = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            with self.scheduler.slot(priority, deadline) if priority is not None else contextlib.nullcontext():
+                response = self.session.post(
+                    url,
+                    headers=headers,
+                    data=body,
+                    timeout=(self.connect_timeout, self.timeout)
+                )
             response.raise_for_status()
             result = response.json()
+            self._audit(entry, started, status=response.status_code, outcome='ok', usage=result.get('usage'),
+                stop_reason=result.get('stop_reason'), message_id=result.get('id'),
+                response_body=redact(response.text) if entry and self.audit.bodies else None)
 
             # Convert to OpenAI format
             if 'content' in result:
@@ -118,74 +366,286 @@ class APIClient:
                     'usage': result.get('usage', {})
                 }
             return result
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"API request failed: {e}")
-
-    def send_message_stream(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if isinstance(e, requests.exceptions.ConnectTimeout):
+                count('connect_timeouts')
+            self._audit(entry, started, status=getattr(response, 'status_code', None), outcome='error', error=str(e))
+            if isinstance(e, requests.exceptions.RequestException):
+                raise Exception(f"API request failed: {e}")
+            raise
+
+    def send_message_stream(self, messages: List[Dict[str, str]], use_cache: bool = True,
+                            priority: str = INTERACTIVE) -> StreamResult:
         """
         Send streaming message request
 
         Args:
             messages: Message list
+            use_cache: Answer from the semantic cache if a near-duplicate
+                prompt is stored there (only when SEMANTIC_CACHE=1)
+            priority: Scheduler class; the slot is held until the stream ends.
+                A stream that can't get one within TTFT_TIMEOUT fails. None
+                when the caller already holds a slot.
+
+        Returns:
+            StreamResult - iterate it for the text; usage and stop reason
+            are available once iteration is done
+        """
+        result = StreamResult()
+        if use_cache and self.cache is not None:
+            result._deltas = self._cached_or_streamed(messages, result, priority)
+        else:
+            result._deltas = self._scheduled(messages, result, priority)
+        return result
+
+    def _cached_or_streamed(self, messages: List[Dict[str, str]], result: StreamResult,
+                            priority: str) -> Generator[str, None, None]:
+        """The cached answer, if there is one - looked up on the iterating thread"""
+        hit = self.cache.lookup(self.model, messages)
+        if hit is None:
+            yield from self._scheduled(messages, result, priority)
+            return
+        result.cache_hit = hit
+        result.model = self.model
+        for i in range(0, len(hit.answer), CACHE_REPLAY_CHARS):
+            yield hit.answer[i:i + CACHE_REPLAY_CHARS]
+        result.stop_reason = 'end_turn'
+
+    def _scheduled(self, messages: List[Dict[str, str]], result: StreamResult,
+                   priority: str) -> Generator[str, None, None]:
+        """_stream_deltas holding a scheduler slot (waited for on the iterating thread)"""
+        if priority is None:
+            yield from self._stream_deltas(messages, result)
+            return
+        with self.scheduler.slot(priority, self.ttft_timeout or None) as ticket:
+            result.queue_ms = ticket.wait_ms
+            yield from self._stream_deltas(messages, result)
+
+    def _stream_deltas(self, messages: List[Dict[str, str]], result: StreamResult) -> Generator[str, None, None]:
+        """
+        Stream deltas, resuming after a dropped connection
 
-        Yields:
-            Streaming response content
+        A resumed request carries the partial answer as an assistant prefill,
+        so the model continues where the text broke off; the continuation is
+        stitched into the same iteration. Usage of the broken attempts is
+        added to the final usage.
         """
+        received = ResponseBuffer()
+        spent: Dict[str, int] = {}
+        while True:
+            request = messages
+            partial = received.getvalue()
+            prefill = partial.rstrip()
+            if prefill:
+                # The API rejects a prefill ending in whitespace
+                request = list(messages) + [{"role": "assistant", "content": prefill}]
+            attempt_chars = 0
+            with contextlib.closing(self._stream_attempt(request, result)) as deltas:
+                if prefill:
+                    deltas = _continuation(deltas, received.tail(OVERLAP_CHARS), partial[len(prefill):])
+                try:
+                    for text in deltas:
+                        received.append(text)
+                        attempt_chars += len(text)
+                        yield text
+                    break
+                except StreamInterrupted as e:
+                    if result.aborted or result.resumes >= self.stream_resumes:
+                        raise Exception(f"Streaming API request failed: {e}")
+            result.resumes += 1
+            # The broken attempt's output is billed though message_delta never came
+            usage = dict(result.usage)
+            usage['output_tokens'] = max(usage.get('output_tokens', 0), attempt_chars // 4)
+            for key, value in usage.items():
+                spent[key] = spent.get(key, 0) + value
+            result.usage = {}
+        for key, value in spent.items():
+            result.usage[key] = result.usage.get(key, 0) + value
+        if self.cache is not None and result.stop_reason == 'end_turn' and not result.aborted:
+            self.cache.store(self.model, messages, received.getvalue())
+
+    def _stream_attempt(self, messages: List[Dict[str, str]], result: StreamResult) -> Generator[str, None, None]:
+        """One streaming request; raises StreamInterrupted if it breaks after the headers or misses a deadline"""
         url = f"{self.base_url}/v1/messages"
         headers = self._prepare_headers()
         payload = self._prepare_payload(messages, stream=True)
+        body = json.dumps(payload).encode('utf-8')
+        entry = self._audit_entry('stream', url, payload, body)
+        chunks = [] if entry is not None and self.audit.bodies else None
+        started = time.perf_counter()
+        status = None
+        outcome = 'error'
+        error = None
+        opened = False      # message_start seen
+        complete = False    # message_stop or [DONE] seen
+        deadline = None
 
         try:
-            with requests.post(
+            # Until the headers arrive the socket read timeout is the only
+            # deadline; after that the watchdog enforces first-token and idle
+            with self.session.post(
                 url,
                 headers=headers,
-                json=payload,
+                data=body,
                 stream=True,
-                timeout=self.timeout
+                timeout=(self.connect_timeout, (self.ttft_timeout and max(self.ttft_timeout, self.idle_timeout))
+                    or self.timeout)
             ) as response:
+                result._response = response
+                status = response.status_code
                 response.raise_for_status()
-
-                for line in response.iter_lines():
-                    if line:
-                        line_str = line.decode('utf-8')
-                        if line_str.startswith('data: '):
-                            data = line_str[6:]  # Remove 'data: ' prefix
-                            if data == '[DONE]':
-                                break
-                            try:
-                                # Anthropic streaming response format
-                                chunk = json.loads(data)
-                                if 'delta' in chunk:
-                                    delta = chunk['delta']
-                                    if 'text' in delta:
-                                        yield delta['text']
-                                elif 'content' in chunk:
-                                    # Non-streaming response format
-                                    yield chunk['content'][0]['text']
-                            except json.JSONDecodeError:
-                                continue
+                deadline = watchdog().watch(result, self.ttft_timeout, self.idle_timeout, started)
+
+                try:
+                    for line in response.iter_lines():
+                        if line:
+                            line_str = line.decode('utf-8')
+                            if line_str.startswith('data: '):
+                                data = line_str[6:]  # Remove 'data: ' prefix
+                                if data == '[DONE]':
+                                    complete = True
+                                    break
+                                try:
+                                    # Anthropic streaming response format
+                                    event = json.loads(data)
+                                    text = result.handle_event(event)
+                                    kind = event.get('type')
+                                except (json.JSONDecodeError, AttributeError, LookupError, TypeError):
+                                    continue
+                                opened = opened or kind == 'message_start'
+                                complete = complete or kind == 'message_stop' or 'content' in event
+                                if text:
+                                    deadline.text()
+                                    if chunks is not None:
+                                        chunks.append(text)
+                                    yield text
+                except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as e:
+                    if result.aborted:
+                        raise
+                    if not deadline.expired:
+                        reason = deadline.missed(time.perf_counter())
+                        if reason:
+                            # The socket read timeout fired before the watchdog
+                            watchdog().expire(deadline, reason)
+                    raise StreamInterrupted(deadline.describe() if deadline.expired else e)
+                if deadline.expired:
+                    raise StreamInterrupted(deadline.describe())
+                if opened and not complete and result.stop_reason is None and not result.aborted:
+                    # Connection closed cleanly in the middle of the message
+                    raise StreamInterrupted("stream ended before message_stop")
+            outcome = 'cancelled' if result.aborted else 'ok'
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        except StreamInterrupted as e:
+            outcome = 'interrupted'
+            error = str(e)
+            raise
         except requests.exceptions.RequestException as e:
+            error = str(e)
+            if isinstance(e, requests.exceptions.ConnectTimeout):
+                count('connect_timeouts')
+            elif isinstance(e, requests.exceptions.ReadTimeout):
+                # No headers within the first-token deadline - worth another try
+                count('ttft_timeouts')
+                outcome = 'interrupted'
+                raise StreamInterrupted(f"no response within {self.ttft_timeout:g}s")
             raise Exception(f"Streaming API request failed: {e}")
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if deadline is not None:
+                watchdog().unwatch(deadline)
+            self._audit(entry, started, status=status, outcome=outcome, error=error,
+                resume=result.resumes or None,
+                ttft_ms=round(result.ttft_ms, 1) if result.ttft_ms is not None else None,
+                usage=dict(result.usage) or None, stop_reason=result.stop_reason,
+                message_id=result.message_id, response_model=result.model,
+                response_body=redact(''.join(chunks)) if chunks is not None else None)
 
     def test_connection(self) -> bool:
         """
         Test API connection
 
+        Sends a one-token request (checks key and model) through the health
+        probe, so the status bar picks up the result too.
+
         Returns:
             Whether connection is successful
         """
-        test_messages = [{"role": "user", "content": "Hello"}]
+        return self.health.check(max_age=0, verify_model=True).ok
+
+    def batch_request(self, custom_id: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """
+        One entry of a message batch
+
+        Args:
+            custom_id: Caller's id for the request, echoed with its result
+            messages: Message list, as for send_message
+        """
+        return {'custom_id': custom_id, 'params': self._prepare_payload(messages, stream=False)}
+
+    def _batch_call(self, method: str, path: str, **kwargs) -> requests.Response:
+        url = f"{self.base_url}/v1/messages/batches{path}"
         try:
-            result = self.send_message(test_messages)
-            return 'choices' in result or 'error' not in result
-        except Exception:
-            return False
+            response = self.session.request(method, url, headers=self._prepare_headers(),
+                timeout=(self.connect_timeout, self.timeout), **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.ConnectTimeout):
+                count('connect_timeouts')
+            raise Exception(f"Batch API request failed: {e}")
+
+    def create_batch(self, batch_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Submit requests for asynchronous processing
+
+        Args:
+            batch_requests: Entries made with batch_request()
+
+        Returns:
+            The batch object (id, processing_status, request_counts, ...)
+        """
+        body = json.dumps({'requests': batch_requests}).encode('utf-8')
+        with self.scheduler.slot(BACKGROUND):
+            return self._batch_call('POST', '', data=body).json()
+
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Current state of a batch"""
+        with self.scheduler.slot(BACKGROUND):
+            return self._batch_call('GET', f"/{batch_id}").json()
+
+    def cancel_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Ask the provider to stop a batch; finished requests keep their results"""
+        with self.scheduler.slot(BACKGROUND):
+            return self._batch_call('POST', f"/{batch_id}/cancel").json()
+
+    def batch_results(self, batch_id: str) -> Generator[Dict[str, Any], None, None]:
+        """
+        Results of an ended batch, one per request
+
+        The JSONL result file is streamed and parsed line by line, so a large
+        batch never has to fit in memory. Each item has `custom_id` and
+        `result` (type succeeded with `message`, errored with `error`,
+        canceled or expired).
+        """
+        with self.scheduler.slot(BACKGROUND), \
+                self._batch_call('GET', f"/{batch_id}/results", stream=True) as response:
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as e:
+                raise Exception(f"Batch API request failed: {e}")
 
 
 class MockAPIClient:
     """Mock API client for testing"""
 
-    def send_message(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    def send_message(self, messages: List[Dict[str, str]], priority: str = INTERACTIVE,
+                     deadline: Optional[float] = None) -> Dict[str, Any]:
         """Mock non-streaming response"""
         last_message = messages[-1]['content']
 
@@ -209,15 +669,25 @@ class MockAPIClient:
             }
         }
 
-    def send_message_stream(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+    def send_message_stream(self, messages: List[Dict[str, str]], use_cache: bool = True,
+                            priority: str = INTERACTIVE) -> StreamResult:
         """Mock streaming response"""
         last_message = messages[-1]['content']
         response_text = f"This is a streaming mock response:\n\n{last_message}\n\nStreaming character by character..."
 
-        for char in response_text:
-            yield char
-            import time
-            time.sleep(0.02)  # Simulate delay
+        def deltas():
+            result.model = 'mock-model'
+            result.usage = {'input_tokens': sum(len(str(m['content'])) for m in messages) // 4,
+                            'output_tokens': 0}
+            for char in response_text:
+                yield char
+                result.usage['output_tokens'] += 1
+                time.sleep(0.02)  # Simulate delay
+            result.stop_reason = 'end_turn'
+
+        result = StreamResult()
+        result._deltas = deltas()
+        return result
 
     def test_connection(self) -> bool:
         """Mock connection test"""
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Attachments module
+Content-addressed storage for attached files and large pastes
+"""
+
+import difflib
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".aichat_attachments")
+
+READ_CHUNK = 1024 * 1024
+
+# Decoded attachment text kept in memory, shared by every turn that references it
+TEXT_CACHE_CHARS = 64 * 1024 * 1024
+
+# Anthropic allows 4 cache breakpoints per request; keep one for the caller
+MAX_CACHE_BREAKPOINTS = 3
+
+# A paste revises an earlier attachment when at least this share of their lines match
+REVISION_SIMILARITY = float(os.getenv('REVISION_SIMILARITY', '0.5'))
+# Larger texts are not compared, and a paste is compared with at most this
+# much earlier text in total (newest first) - diffing costs ~0.3 s per MB
+REVISION_MAX_BYTES = 2 * 1024 * 1024
+REVISION_BUDGET_BYTES = int(os.getenv('REVISION_BUDGET_BYTES', str(4 * 1024 * 1024)))
+DIFF_CONTEXT = 3
+
+
+class AttachmentError(Exception):
+    """Attachment can't be stored or sent"""
+
+
+class AttachmentStore:
+    """
+    Stores attachment bytes once per SHA-256 under ~/.aichat_attachments
+
+    Files are read in fixed-size chunks - hashed, scanned and copied in one
+    pass - so nothing large is ever held in memory or put into a widget.
+    Messages only carry a small reference dict:
+    {"hash", "name", "size", "lines"}. A paste that revises an earlier
+    attachment also has "base" (its hash), "diff" (hash of the stored
+    unified diff against it) and "diff_size".
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv('ATTACHMENTS_DIR', DEFAULT_ROOT)
+        os.makedirs(self.root, exist_ok=True)
+        self._text: OrderedDict = OrderedDict()
+        self._text_chars = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='attachments')
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def add_file(self, path: str) -> Dict[str, Any]:
+        """Store a text file; call from a worker thread for big files"""
+        with open(path, 'rb') as src:
+            return self._store(iter(lambda: src.read(READ_CHUNK), b''), os.path.basename(path))
+
+    def add_file_async(self, path: str) -> Future:
+        """add_file on a background thread"""
+        return self._executor.submit(self.add_file, path)
+
+    def add_text(self, text: str, name: str, earlier: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """
+        Store pasted text
+
+        If it revises one of the `earlier` refs (the conversation's attachments),
+        a diff against the most similar one is stored as well, when it is
+        smaller than the text; build_messages() sends it instead of the text.
+        """
+        data = text.encode('utf-8')
+        chunks = (data[i:i + READ_CHUNK] for i in range(0, len(data), READ_CHUNK))
+        ref = self._store(chunks, name)
+        if len(data) <= REVISION_MAX_BYTES:
+            ref.update(self._revision(text, ref, earlier))
+        return ref
+
+    def add_text_async(self, text: str, name: str, earlier: Iterable[Dict[str, Any]] = ()) -> Future:
+        """add_text on a background thread (pass a snapshot of earlier)"""
+        return self._executor.submit(self.add_text, text, name, list(earlier))
+
+    def _revision(self, text: str, ref: Dict[str, Any], earlier: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        lines = _diff_lines(text)
+        best = None
+        budget = REVISION_BUDGET_BYTES
+        for old in reversed(list(earlier)):
+            if old['hash'] == ref['hash'] or old['size'] > REVISION_MAX_BYTES \
+                    or not ref['size'] / 2 <= old['size'] <= ref['size'] * 2:
+                continue
+            budget -= old['size']
+            if budget < 0:
+                break
+            try:
+                old_lines = _diff_lines(self.read_text(old['hash']))
+            except AttachmentError:
+                continue
+            matcher = difflib.SequenceMatcher(None, old_lines, lines)
+            if matcher.quick_ratio() < REVISION_SIMILARITY:
+                continue
+            similarity = matcher.ratio()
+            # Newest first, so ties go to the latest version
+            if similarity >= REVISION_SIMILARITY and (best is None or similarity > best[0]):
+                best = (similarity, old, old_lines)
+        if best is None:
+            return {}
+        _, old, old_lines = best
+        diff = ''.join(difflib.unified_diff(old_lines, lines, f"{old['name']} (earlier version)", ref['name'],
+            n=DIFF_CONTEXT))
+        data = diff.encode('utf-8')
+        if len(data) >= ref['size']:
+            return {}
+        stored = self._store(iter((data,)), ref['name'])
+        return {'base': old['hash'], 'diff': stored['hash'], 'diff_size': stored['size']}
+
+    def _store(self, chunks, name: str) -> Dict[str, Any]:
+        digest = hashlib.sha256()
+        size = 0
+        lines = 0
+        last = b''
+        tmp = tempfile.NamedTemporaryFile(dir=self.root, delete=False)
+        try:
+            with tmp:
+                for chunk in chunks:
+                    if size == 0 and b'\0' in chunk[:8192]:
+                        raise AttachmentError(f"{name} looks like a binary file")
+                    digest.update(chunk)
+                    size += len(chunk)
+                    lines += chunk.count(b'\n')
+                    last = chunk[-1:]
+                    tmp.write(chunk)
+            if size and last != b'\n':
+                lines += 1
+
+            hexdigest = digest.hexdigest()
+            target = self.path(hexdigest)
+            if os.path.exists(target):
+                os.remove(tmp.name)  # Already stored - reference it
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp.name, target)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+        return {'hash': hexdigest, 'name': name, 'size': size, 'lines': lines}
+
+    def read_text(self, digest: str) -> str:
+        """Attachment text, decoded once and shared between turns"""
+        with self._lock:
+            text = self._text.get(digest)
+            if text is not None:
+                self._text.move_to_end(digest)
+                return text
+        try:
+            with open(self.path(digest), 'rb') as f:
+                text = f.read().decode('utf-8', errors='replace')
+        except OSError as e:
+            raise AttachmentError(f"Attachment {digest[:12]} is missing: {e}")
+        with self._lock:
+            if digest not in self._text:
+                self._text[digest] = text
+                self._text_chars += len(text)
+            while self._text_chars > TEXT_CACHE_CHARS and len(self._text) > 1:
+                _, old = self._text.popitem(last=False)
+                self._text_chars -= len(old)
+            return self._text.get(digest, text)
+
+    def content_blocks(self, text: str, refs: List[Dict[str, Any]],
+                       sent: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Anthropic content blocks for one user message: one block per attachment, then the text
+
+        A revision is sent as its diff if its base is in `sent` - the hashes
+        of the attachments earlier in the same request (updated here).
+        """
+        blocks = []
+        for ref in refs:
+            if sent is not None and ref.get('base') in sent:
+                body = self.read_text(ref['diff'])
+                blocks.append({'type': 'text', 'text': f'<file-diff name="{ref["name"]}">\n{body}</file-diff>'})
+            else:
+                body = self.read_text(ref['hash'])
+                blocks.append({'type': 'text', 'text': f'<file name="{ref["name"]}">\n{body}\n</file>'})
+            if sent is not None:
+                sent.add(ref['hash'])
+        if text:
+            blocks.append({'type': 'text', 'text': text})
+        return blocks
+
+    def build_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Resolve attachment references into API messages
+
+        Messages without attachments pass through unchanged. The last few
+        attachment blocks get cache breakpoints, so the (usually large) prefix
+        up to them is served from the provider's prompt cache on later turns.
+        Revisions are sent as diffs while the version they revise is part of
+        the request (it may have been compacted away or edited out).
+        """
+        result = []
+        attachment_blocks = []
+        sent = set()
+        for msg in messages:
+            refs = msg.get('attachments')
+            if not refs:
+                if 'attachments' in msg:
+                    msg = {k: v for k, v in msg.items() if k != 'attachments'}
+                result.append(msg)
+                continue
+            blocks = self.content_blocks(msg['content'], refs, sent)
+            attachment_blocks.extend(blocks[:len(refs)])
+            result.append({'role': msg['role'], 'content': blocks})
+        for block in attachment_blocks[-MAX_CACHE_BREAKPOINTS:]:
+            block['cache_control'] = {'type': 'ephemeral'}
+        return result
+
+
+def resolve_messages(store: Optional[AttachmentStore], messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """API messages for a conversation snapshot, with or without an attachment store"""
+    if store is not None:
+        return store.build_messages(messages)
+    return [{'role': m['role'], 'content': m['content']} for m in messages]
+
+
+def message_chars(message: Dict[str, Any]) -> int:
+    """Characters sent for a conversation message, attachments included (revisions as their diff)"""
+    return len(message['content']) + sum(ref.get('diff_size', ref['size']) for ref in message.get('attachments', ()))
+
+
+def _diff_lines(text: str) -> List[str]:
+    # Every line newline-terminated, so the diff's lines stay separate
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    return lines
+
+
+def format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    if size >= 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size} B"
+
+
+def describe(ref: Dict[str, Any]) -> str:
+    return f"📎 {ref['name']} · {format_size(ref['size'])} · {ref['lines']} lines"
+
+
+def describe_savings(ref: Dict[str, Any]) -> str:
+    """What sending a revision as a diff saves, per request that includes it"""
+    saved = ref['size'] - ref['diff_size']
+    return (f"✂️ Revision of an earlier attachment - sent as a {format_size(ref['diff_size'])} diff: "
+        f"{format_size(saved)} less upload, ~{saved // 4} fewer input tokens per turn")
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Audit log module
+Structured record of every API call, written off the request path
+"""
+
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".aichat_audit")
+
+# Under pressure: above HIGH_WATER of the ring only 1 in SAMPLE_EVERY records
+# is kept (without bodies); a full ring drops new records.
+HIGH_WATER = 0.75
+SAMPLE_EVERY = 4
+
+WRITE_INTERVAL = 1.0
+
+_SECRET = re.compile(r'(sk-[A-Za-z0-9_\-]{8,}|Bearer\s+[A-Za-z0-9._\-]{8,}|"(?:api[_-]?key|x-api-key)"\s*:\s*"[^"]*")',
+    re.IGNORECASE)
+
+
+def redact(text: str) -> str:
+    """Mask things that look like credentials"""
+    return _SECRET.sub('[REDACTED]', text)
+
+
+def payload_digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class AuditLog:
+    """
+    Bounded in-memory ring drained by a background writer
+
+    record() only appends to a deque under a lock, so the streaming path never
+    waits on disk. The writer thread batches records into gzip-compressed
+    JSONL segments (audit-<time>.jsonl.gz), starts a new segment once one
+    holds AUDIT_SEGMENT_BYTES of JSON, and keeps the newest AUDIT_KEEP
+    segments. When the disk can't keep up, records are sampled and then
+    dropped; the counts are written as a "dropped" record.
+
+    Environment: AUDIT_LOG (0 disables), AUDIT_DIR, AUDIT_BODIES (1 keeps
+    redacted request/response bodies), AUDIT_RING, AUDIT_SEGMENT_BYTES, AUDIT_KEEP.
+    """
+
+    def __init__(self, directory: Optional[str] = None, capacity: Optional[int] = None,
+                 segment_bytes: Optional[int] = None, keep: Optional[int] = None,
+                 bodies: Optional[bool] = None):
+        self.directory = directory or os.getenv('AUDIT_DIR', DEFAULT_DIR)
+        self.capacity = capacity or int(os.getenv('AUDIT_RING', '2048'))
+        self.segment_bytes = segment_bytes or int(os.getenv('AUDIT_SEGMENT_BYTES', str(4 * 1024 * 1024)))
+        self.keep = keep or int(os.getenv('AUDIT_KEEP', '20'))
+        self.bodies = bodies if bodies is not None else os.getenv('AUDIT_BODIES', '0') == '1'
+
+        self._ring: deque = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._sample_counter = 0
+        self.recorded = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self._reported_sampled = 0
+        self._reported_dropped = 0
+
+        self._segment = None
+        self._segment_path = None
+        self._segment_written = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name='audit-writer', daemon=True)
+        self._writer.start()
+
+    def record(self, entry: Dict[str, Any]):
+        """Queue a record (never blocks on I/O)"""
+        with self._cond:
+            if self._stopping:
+                return
+            depth = len(self._ring)
+            if depth >= self.capacity:
+                self.dropped += 1
+                return
+            if depth >= self.capacity * HIGH_WATER:
+                self._sample_counter += 1
+                if self._sample_counter % SAMPLE_EVERY:
+                    self.sampled_out += 1
+                    return
+                entry = {k: v for k, v in entry.items() if k not in ('request_body', 'response_body')}
+                entry['sampled'] = SAMPLE_EVERY
+            self._ring.append(entry)
+            self.recorded += 1
+
+    def close(self, timeout: float = 5.0):
+        """Write what is queued and stop the writer"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._writer.join(timeout)
+
+    # Writer thread
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if not self._ring and not self._stopping:
+                    self._cond.wait(WRITE_INTERVAL)
+                batch = list(self._ring)
+                self._ring.clear()
+                stopping = self._stopping
+                sampled, dropped = self.sampled_out, self.dropped
+            if sampled != self._reported_sampled or dropped != self._reported_dropped:
+                batch.append({'type': 'dropped', 'time': time.time(),
+                    'sampled_out': sampled - self._reported_sampled, 'dropped': dropped - self._reported_dropped})
+                self._reported_sampled, self._reported_dropped = sampled, dropped
+            if batch:
+                try:
+                    self._write(batch)
+                except OSError:
+                    pass
+            if stopping:
+                self._close_segment()
+                return
+
+    def _write(self, batch):
+        data = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in batch).encode('utf-8')
+        if self._segment is None or self._segment_written >= self.segment_bytes:
+            self._rotate()
+        self._segment.write(data)
+        self._segment.flush()  # Sync flush - what is on disk stays readable after a crash
+        self._segment_written += len(data)
+
+    def _rotate(self):
+        self._close_segment()
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self._segment_path = os.path.join(self.directory, f"audit-{stamp}.jsonl.gz")
+        self._segment = gzip.open(self._segment_path, 'wb', compresslevel=6)
+        self._segment_written = 0
+        segments = sorted(glob.glob(os.path.join(self.directory, 'audit-*.jsonl.gz')))
+        for old in segments[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _close_segment(self):
+        if self._segment is not None:
+            try:
+                self._segment.close()
+            except OSError:
+                pass
+            self._segment = None
+
+
+_shared: Optional[AuditLog] = None
+_shared_lock = threading.Lock()
+
+
+def shared_log() -> Optional[AuditLog]:
+    """Process-wide audit log, created on first use; None when AUDIT_LOG=0"""
+    global _shared
+    if os.getenv('AUDIT_LOG', '1') == '0':
+        return None
+    with _shared_lock:
+        if _shared is None:
+            try:
+                _shared = AuditLog()
+            except OSError:
+                return None
+        return _shared
+
+
+def close_shared():
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.close()
+            _shared = None
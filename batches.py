@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Message batches module
+Bulk offline jobs through the provider's asynchronous batch API, resumable across restarts
+
+Usage: python batches.py submit requests.jsonl job.json
+       python batches.py results job.json [output.jsonl]
+       python batches.py status job.json
+       python batches.py cancel job.json
+requests.jsonl has one {"custom_id", "prompt"} or {"custom_id", "messages"} per line.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Requests per submitted batch; the provider allows more, but smaller batches
+# end (and start returning results) sooner
+BATCH_CHUNK = int(os.getenv('BATCH_CHUNK', '5000'))
+POLL_MIN = float(os.getenv('BATCH_POLL_MIN', '5'))
+POLL_MAX = float(os.getenv('BATCH_POLL_MAX', '300'))
+POLL_BACKOFF = 1.5
+# Delivered results are written to the state file this often
+SAVE_EVERY = 200
+
+
+class BatchJob:
+    """
+    Many requests submitted as one or more provider batches
+
+    The job's state - batch ids, their last known status and which results
+    were already delivered - lives in a JSON file that is rewritten
+    atomically after every change. BatchJob.resume() picks a job up after a
+    restart: polling continues and results() only yields what was not
+    delivered before (if the process died mid-batch, at most the last
+    SAVE_EVERY results are repeated).
+    """
+
+    def __init__(self, client, path: str, state: Dict[str, Any]):
+        self.client = client
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def submit(cls, client, items: Iterable[Tuple[str, List[Dict[str, Any]]]], path: str,
+               chunk: int = BATCH_CHUNK) -> 'BatchJob':
+        """
+        Submit (custom_id, messages) pairs, BATCH_CHUNK per batch
+
+        The state file is saved after each batch is created, so a crash during
+        submission leaves a job that tracks the batches already submitted.
+        """
+        job = cls(client, path, {'version': 1, 'model': client.model, 'created': time.time(), 'batches': []})
+        pending = []
+        seen = set()
+        for custom_id, messages in items:
+            if custom_id in seen:
+                raise ValueError(f"Duplicate custom_id: {custom_id}")
+            seen.add(custom_id)
+            pending.append(client.batch_request(custom_id, messages))
+            if len(pending) >= chunk:
+                job._create(pending)
+                pending = []
+        if pending:
+            job._create(pending)
+        return job
+
+    @classmethod
+    def resume(cls, client, path: str) -> 'BatchJob':
+        """The job saved at path"""
+        with open(path, encoding='utf-8') as f:
+            return cls(client, path, json.load(f))
+
+    @property
+    def batches(self) -> List[Dict[str, Any]]:
+        return self.state['batches']
+
+    @property
+    def done(self) -> bool:
+        return all(b['collected'] for b in self.batches)
+
+    def counts(self) -> Dict[str, int]:
+        """Request counts summed over the job's batches (as of the last poll)"""
+        totals = {'requests': 0, 'processing': 0, 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0,
+            'delivered': 0}
+        for batch in self.batches:
+            totals['requests'] += batch['requests']
+            for key, value in (batch.get('request_counts') or {}).items():
+                if key in totals:
+                    totals[key] += value
+            totals['delivered'] += batch['requests'] if batch['collected'] else len(batch['delivered'])
+        return totals
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Refresh the status of unfinished batches; returns those that have ended"""
+        ended = []
+        for batch in self.batches:
+            if batch['status'] == 'ended':
+                if not batch['collected']:
+                    ended.append(batch)
+                continue
+            info = self.client.get_batch(batch['id'])
+            batch['status'] = info.get('processing_status', batch['status'])
+            batch['request_counts'] = info.get('request_counts') or batch.get('request_counts')
+            if batch['status'] == 'ended':
+                ended.append(batch)
+        self._save()
+        return ended
+
+    def results(self, wait: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Results as batches end, each {"custom_id", "result"}
+
+        Polls with exponential backoff (BATCH_POLL_MIN to BATCH_POLL_MAX
+        seconds, reset whenever a batch ends). With wait=False only the
+        results available now are yielded.
+        """
+        delay = POLL_MIN
+        while not self.done:
+            ended = self.poll()
+            for batch in ended:
+                yield from self._collect(batch)
+            if self.done or not wait:
+                return
+            if ended:
+                delay = POLL_MIN
+            time.sleep(delay * random.uniform(0.9, 1.1))
+            delay = min(POLL_MAX, delay * POLL_BACKOFF)
+
+    def cancel(self):
+        """Cancel every batch still processing"""
+        for batch in self.batches:
+            if batch['status'] != 'ended':
+                info = self.client.cancel_batch(batch['id'])
+                batch['status'] = info.get('processing_status', batch['status'])
+        self._save()
+
+    def _collect(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        delivered = set(batch['delivered'])
+        fresh = 0
+        try:
+            for item in self.client.batch_results(batch['id']):
+                if item.get('custom_id') in delivered:
+                    continue
+                yield item
+                delivered.add(item.get('custom_id'))
+                batch['delivered'].append(item.get('custom_id'))
+                fresh += 1
+                if fresh % SAVE_EVERY == 0:
+                    self._save()
+            # Ids are only needed while a batch is partly delivered
+            batch['collected'] = True
+            batch['delivered'] = []
+        finally:
+            # Also when the caller stops early - only a crash repeats results
+            self._save()
+
+    def _create(self, batch_requests: List[Dict[str, Any]]):
+        info = self.client.create_batch(batch_requests)
+        self.batches.append({
+            'id': info['id'],
+            'requests': len(batch_requests),
+            'status': info.get('processing_status', 'in_progress'),
+            'request_counts': info.get('request_counts'),
+            'collected': False,
+            'delivered': [],
+        })
+        self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False, suffix='.tmp')
+        try:
+            with tmp:
+                json.dump(self.state, tmp)
+            os.replace(tmp.name, self.path)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+
+
+def result_text(item: Dict[str, Any]) -> Optional[str]:
+    """Answer text of a succeeded result, else None"""
+    result = item.get('result') or {}
+    if result.get('type') != 'succeeded':
+        return None
+    return ''.join(block.get('text', '') for block in result['message'].get('content', ())
+        if block.get('type') == 'text')
+
+
+def read_requests(path: str) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            messages = entry.get('messages') or [{"role": "user", "content": entry['prompt']}]
+            yield str(entry.get('custom_id', number)), messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    submit = commands.add_parser('submit', help="submit a JSONL file of requests")
+    submit.add_argument('requests')
+    submit.add_argument('state', help="job state file to create")
+    results = commands.add_parser('results', help="wait for results and write them as JSONL")
+    results.add_argument('state')
+    results.add_argument('output', nargs='?', help="append results here (default stdout)")
+    results.add_argument('--no-wait', action='store_true', help="only what is available now")
+    for name in ('status', 'cancel'):
+        commands.add_parser(name).add_argument('state')
+    args = parser.parse_args()
+
+    from api_client import APIClient
+    client = APIClient(os.path.join(os.path.expanduser("~"), ".aichat_config.env"))
+
+    if args.command == 'submit':
+        job = BatchJob.submit(client, read_requests(args.requests), args.state)
+        print(f"Submitted {job.counts()['requests']} requests in {len(job.batches)} batches")
+        return
+    job = BatchJob.resume(client, args.state)
+    if args.command == 'cancel':
+        job.cancel()
+    if args.command in ('status', 'cancel'):
+        job.poll()
+        print(json.dumps(job.counts()))
+        return
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for item in job.results(wait=not args.no_wait):
+            out.write(json.dumps(item, ensure_ascii=False) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(job.counts()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the client worker process
+Frame times of a stand-in UI loop while fast streams are parsed in-process and in the worker (CLIENT_PROCESS=1)
+
+Usage: python benchmarks/bench_client_process.py [--streams 4] [--length 200000] [--delta-chars 2]
+                                                 [--work-ms 4] [--rounds 3] [--output report.json]
+
+The local stand-in server runs in its own process and sends deltas as fast
+as it can. The main thread plays the Tk main loop: every 16 ms it drains
+the streamed text (as StreamBridge does) and spends --work-ms of pure Python
+on "rendering". With the in-process client, SSE parsing on the stream
+threads competes with it for the GIL; frame intervals and the time the
+fixed work takes show how much. No display is needed.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_ui import git_commit, percentiles
+
+TICK_MS = 16
+
+
+def start_server(args):
+    """The stand-in in a child process, so its threads don't take the GIL from ours"""
+    process = subprocess.Popen([sys.executable, '-u', os.path.join(ROOT, 'local_server.py'), '--port', '0',
+        '--length', str(args.length), '--delay-ms', '0', '--delta-chars', str(args.delta_chars)],
+        stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Listening on '):
+        process.kill()
+        raise SystemExit("stand-in server did not start")
+    return process, line.split()[-1]
+
+
+def spin(ms):
+    """Fixed pure-Python work - takes longer when another thread holds the GIL"""
+    end = time.thread_time() + ms / 1000
+    n = 0
+    while time.thread_time() < end:
+        n += 1
+    return n
+
+
+def ui_loop(streams_done, texts, work_ms):
+    """Ticks every TICK_MS until the streams end; frame intervals and render durations"""
+    frames, renders = [], []
+    chars = 0
+    last = time.perf_counter()
+    next_at = last + TICK_MS / 1000
+    while not streams_done.is_set() or not texts.empty():
+        pause = next_at - time.perf_counter()
+        if pause > 0:
+            time.sleep(pause)
+        now = time.perf_counter()
+        frames.append((now - last) * 1000)
+        last = now
+        next_at = max(next_at + TICK_MS / 1000, now)
+        while True:
+            try:
+                chars += len(texts.get_nowait())
+            except queue.Empty:
+                break
+        spin(work_ms)
+        renders.append((time.perf_counter() - now) * 1000)
+    return frames, renders, chars
+
+
+def scenario(client, args):
+    messages = [{"role": "user", "content": "benchmark prompt"}]
+    texts = queue.Queue()
+    done = threading.Event()
+    errors = []
+
+    def consume(n):
+        try:
+            for text in client.send_message_stream(messages + [{"role": "user", "content": str(n)}]):
+                texts.put(text)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=consume, args=(n,), daemon=True) for n in range(args.streams)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    watcher = threading.Thread(target=lambda: ([t.join() for t in threads], done.set()), daemon=True)
+    watcher.start()
+    frames, renders, chars = ui_loop(done, texts, args.work_ms)
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise SystemExit(f"stream failed: {errors[0]}")
+    return {
+        'total_ms': round(elapsed * 1000, 3),
+        'chars_per_sec': round(chars / elapsed),
+        'frames': percentiles(frames),
+        'render': percentiles(renders),
+        'late_frames': sum(1 for f in frames if f > TICK_MS * 2),
+    }
+
+
+def make_client(mode):
+    if mode == 'process':
+        from client_process import ProcessClient
+        client = ProcessClient()
+    else:
+        from api_client import APIClient
+        client = APIClient()
+    # Warm up: connection, and for the worker its start-up
+    list(client.send_message_stream([{"role": "user", "content": "warm up"}]))
+    return client
+
+
+def run(args):
+    results = {}
+    for mode in ('in_process', 'process'):
+        client = make_client(mode)
+        runs = [scenario(client, args) for _ in range(args.rounds)]
+        if mode == 'process':
+            client.worker.stop()
+        runs.sort(key=lambda r: r['frames']['p95_ms'])
+        results[mode] = runs[len(runs) // 2]
+        print(f"  {mode:<12} frames p95 {results[mode]['frames']['p95_ms']} ms, "
+            f"render p95 {results[mode]['render']['p95_ms']} ms", file=sys.stderr)
+    return {
+        'benchmark': 'client_process',
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'streams': args.streams,
+        'length': args.length,
+        'delta_chars': args.delta_chars,
+        'work_ms': args.work_ms,
+        'rounds': args.rounds,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--streams', type=int, default=4, help="concurrent streams")
+    parser.add_argument('--length', type=int, default=200000, help="characters per answer")
+    parser.add_argument('--delta-chars', type=int, default=2, help="characters per SSE delta")
+    parser.add_argument('--work-ms', type=float, default=4, help="render work per frame")
+    parser.add_argument('--rounds', type=int, default=3, help="runs per mode (the median is reported)")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    server, url = start_server(args)
+    os.environ.update(API_BASE_URL=url, API_KEY='bench', AUDIT_LOG='0', SEMANTIC_CACHE='0', STREAM_RESUMES='0')
+    try:
+        report = run(args)
+    finally:
+        server.kill()
+        server.wait()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
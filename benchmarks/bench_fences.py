@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the markdown fence tokenizer
+Compares the old regex parser against FenceTokenizer on multi-MB inputs
+
+Usage: python benchmarks/bench_fences.py [size_mb]
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_fences import FenceTokenizer, parse_segments
+
+# The regex render_content used before the tokenizer
+OLD_PATTERN = re.compile(r'```(\w*)\n?(.*?)```', re.DOTALL)
+
+
+def old_parse(content):
+    segments = []
+    last_end = 0
+    for match in OLD_PATTERN.finditer(content):
+        segments.append(content[last_end:match.start()])
+        segments.append(match.group(2))
+        last_end = match.end()
+    segments.append(content[last_end:])
+    return segments
+
+
+def make_inputs(size):
+    """Pathological and typical inputs of roughly `size` characters"""
+    code_line = "    result = compute(value, other) + 1  # comment\n"
+    prose = "Some explanation about the code above, with `inline` bits.\n"
+    block = "```python\n" + code_line * 20 + "```\n" + prose * 3
+    return {
+        "unclosed fence, long tail": "intro\n```python\n" + code_line * (size // len(code_line)),
+        "many unclosed openers": "```x " * (size // 5),
+        "many small blocks": block * (size // len(block)),
+        "nested 4-tick fences": ("````md\n```python\n" + code_line * 5 + "```\n````\n") * (size // 300),
+        "tilde fences": ("~~~\n" + code_line * 10 + "~~~\n" + prose) * (size // 600),
+        "single huge line": "x" * size,
+        "backtick runs": "```" + "``a" * (size // 3),
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def tokenize(content):
+    tokenizer = FenceTokenizer()
+    tokenizer.feed(content)
+    return tokenizer.close()
+
+
+def tokenize_streamed(content, chunk=16):
+    tokenizer = FenceTokenizer()
+    for i in range(0, len(content), chunk):
+        tokenizer.feed(content[i:i + chunk])
+    return tokenizer.close()
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    size = int(size_mb * 1024 * 1024)
+
+    print(f"{'input':<28}{'size':>10}{'regex ms':>12}{'tokenize ms':>13}{'streamed ms':>13}{'cached ms':>11}")
+    for name, content in make_inputs(size).items():
+        old_ms = timed(old_parse, content)
+        new_ms = timed(tokenize, content)
+        streamed_ms = timed(tokenize_streamed, content)
+        parse_segments(content)
+        cached_ms = timed(parse_segments, content)
+        print(f"{name:<28}{len(content):>10}{old_ms:>12.1f}{new_ms:>13.1f}{streamed_ms:>13.1f}{cached_ms:>11.3f}")
+        assert tokenize(content) == tokenize_streamed(content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the conversation history store
+Fills a temporary database and times page loads and full-text search
+
+Usage: python benchmarks/bench_history.py [messages]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore
+
+WORDS = (
+    "python render stream token widget cache buffer socket thread queue parser index "
+    "layout window scroll latency request response model prompt answer error retry "
+    "数据库 查询 优化 测试 线程 缓存 渲染 网络 模型 回答"
+).split()
+
+
+def fake_message(rng):
+    text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 120)))
+    if rng.random() < 0.02:
+        text += "\n```python\n" + "value = compute(value)\n" * 400 + "```"
+    return text
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    per_session = 5000
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "history.db"))
+
+        start = time.perf_counter()
+        session_id = None
+        for i in range(total):
+            if i % per_session == 0:
+                session_id = store.create_session(f"session {i // per_session}")
+            store.append_message(session_id, "user" if i % 2 == 0 else "assistant", fake_message(rng))
+        store.flush()
+        elapsed = time.perf_counter() - start
+        size_mb = os.path.getsize(store.db_path) / 1024 / 1024
+        print(f"wrote {total} messages in {elapsed:.1f}s ({total / elapsed:.0f}/s), db {size_mb:.1f} MB")
+
+        _, ms = timed(store.list_sessions)
+        print(f"list_sessions (first page):        {ms:8.2f} ms")
+        page, ms = timed(store.load_messages, session_id)
+        print(f"load_messages ({per_session}-message session): {ms:8.2f} ms ({len(page)} rows)")
+        _, ms = timed(store.load_conversation, session_id)
+        print(f"load_conversation (full session):  {ms:8.2f} ms")
+
+        for query in ["render", "socket latency", "数据库", "查询优化", "value compute", "nomatch"]:
+            hits, ms = timed(store.search, query)
+            print(f"search {query!r:<20}{ms:8.2f} ms ({len(hits)} hits)")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the streamed response buffer
+Memory profile of a max-length answer: string concatenation vs ResponseBuffer
+
+Usage: python benchmarks/bench_response_buffer.py [tokens]
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_buffer import ResponseBuffer
+
+WORDS = (
+    "python render stream token widget cache buffer socket thread queue parser "
+    "数据库 查询 优化 测试 线程 缓存 渲染 网络"
+).split()
+
+
+def fake_deltas(tokens, rng):
+    """Stream deltas of a few characters each, ~4 characters per token"""
+    deltas = []
+    chars = 0
+    while chars < tokens * 4:
+        delta = ''.join(' ' + rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.05:
+            delta += '\n'
+        deltas.append(delta)
+        chars += len(delta)
+    return deltas
+
+
+class OldTab:
+    """What ChatTab did before: += on an attribute, plus a list while hidden"""
+
+    def __init__(self):
+        self.current_response = ""
+        self.unrendered = []
+
+
+def old_stream(deltas, hidden):
+    tab = OldTab()
+    for delta in deltas:
+        tab.current_response += delta
+        if hidden:
+            tab.unrendered.append(delta)
+    if hidden:
+        ''.join(tab.unrendered)
+    return tab.current_response
+
+
+def new_stream(deltas, spill_chars):
+    buffer = ResponseBuffer(spill_chars)
+    for delta in deltas:
+        buffer.append(delta)
+    streaming = tracemalloc.get_traced_memory()[0]
+    buffer.tail(32 * 1024)
+    content = buffer.getvalue()
+    buffer.close()
+    return content, streaming
+
+
+def profile(label, fn, *args):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    streaming = None
+    if isinstance(result, tuple):
+        result, streaming = result
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    held = f"{(streaming - base) / 1024:8.0f}" if streaming is not None else "       -"
+    print(f"{label:<34}{elapsed:9.1f} ms {(peak - base) / 1024:9.0f} KB {held} KB {(current - base) / 1024:8.0f} KB")
+    return result
+
+
+def main():
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 81920
+    deltas = fake_deltas(tokens, random.Random(0))
+    text = ''.join(deltas)
+    print(f"{tokens} tokens: {len(deltas)} deltas, {len(text)} chars, {len(text.encode('utf-8')) / 1024:.0f} KB UTF-8")
+    print(f"{'':<34}{'time':>12} {'peak':>12} {'streaming':>11} {'retained':>11}")
+
+    results = [
+        profile("str += (visible tab)", old_stream, deltas, False),
+        profile("str += and list (hidden tab)", old_stream, deltas, True),
+        profile("ResponseBuffer", new_stream, deltas, 0),
+        profile("ResponseBuffer, spill at 64K chars", new_stream, deltas, 64 * 1024),
+    ]
+    assert all(r == text for r in results)
+
+
+if __name__ == "__main__":
+    main()
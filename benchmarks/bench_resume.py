@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for resumed streams
+Cuts a stream from the local stand-in at every position and checks the stitched answer against the uncut one
+
+Usage: python benchmarks/bench_resume.py [--length 600] [--max-overlap 12] [--cut-step 1]
+
+For each overlap (characters the continuation repeats of the prefill) and
+cut position, one answer is streamed with a single dropped connection and
+compared with the answer the stand-in sends uncut. This runs twice: with
+the stand-in's usual words, and with words that go on with the letters a
+cut inside them ends with ("bana" + "na split", "cous" + "cous"), where a
+continuation that repeats nothing must be kept whole. Exits with status 1
+if any answer differs, except the known case below.
+
+Known limitation: a repeat shorter than api_client.MIN_OVERLAP characters
+is kept, as it can't be told from text like the above. An answer that has
+exactly such a repeat counts as "kept" and doesn't fail the run. Text that
+repeats itself for MIN_OVERLAP characters or more ("ha ha ha ha") can lose
+more than the continuation repeated; the word lists avoid it.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.update(API_KEY='bench', AUDIT_LOG='0', SEMANTIC_CACHE='0', STREAM_RESUMES='1')
+
+from local_server import WORDS, StandIn, answer_text, serve
+
+PROMPT = "resume check"
+# Words whose start repeats their end, or the end of the word before
+REPEATING_WORDS = (
+    "banana split couscous bonbon murmur tartar sauce mississippi cancan "
+    "papaya tsetse fly bye bye dodo"
+).split()
+
+
+def kept_repeat(answer, text, cut, overlap):
+    """text has the short repeat strip_overlap leaves alone"""
+    from api_client import MIN_OVERLAP
+    partial = answer[:cut]
+    prefill = partial.rstrip()
+    held = partial[len(prefill):]
+    # The stand-in starts over when the overlap is longer than the prefill
+    repeat = min(overlap, len(prefill))
+    continuation = answer[len(prefill) - repeat:]
+    if continuation.startswith(held):
+        continuation = continuation[len(held):]
+    return 0 < repeat < MIN_OVERLAP and text == partial + continuation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--length', type=int, default=600, help="answer length in characters")
+    parser.add_argument('--max-overlap', type=int, default=12, help="check overlaps 0 to this")
+    parser.add_argument('--cut-step', type=int, default=1, help="distance between cut positions")
+    args = parser.parse_args()
+
+    standin = StandIn(length=args.length, delay_ms=0, delta_chars=1)
+    server = serve(standin)
+    os.environ['API_BASE_URL'] = f'http://127.0.0.1:{server.server_port}'
+    from api_client import APIClient
+    client = APIClient()
+    messages = [{"role": "user", "content": PROMPT}]
+
+    wrong = 0
+    for name, vocabulary in (('usual words', WORDS), ('repeating words', REPEATING_WORDS)):
+        standin.vocabulary = vocabulary
+        answer = answer_text(PROMPT, args.length, vocabulary)
+        failures = []
+        kept = 0
+        runs = 0
+        started = time.perf_counter()
+        for overlap in range(args.max_overlap + 1):
+            for cut in range(1, args.length, args.cut_step):
+                standin.cut_after, standin.cuts, standin.overlap = cut, 1, overlap
+                result = client.send_message_stream(messages, use_cache=False)
+                text = ''.join(result)
+                runs += 1
+                if text == answer and result.resumes == 1:
+                    continue
+                if kept_repeat(answer, text, cut, overlap):
+                    kept += 1
+                    continue
+                failures.append((overlap, cut, len(text), result.resumes))
+        elapsed = time.perf_counter() - started
+
+        print(f"{name}: {runs} resumed answers, {runs - kept - len(failures)} exact, {kept} kept a short repeat, "
+            f"{len(failures)} wrong ({elapsed * 1000 / runs:.1f} ms per answer)")
+        for overlap, cut, length, resumes in failures[:20]:
+            print(f"  overlap {overlap} cut {cut}: {length} chars (expected {len(answer)}), {resumes} resumes")
+        wrong += len(failures)
+    server.shutdown()
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
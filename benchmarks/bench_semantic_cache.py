@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the semantic response cache
+Lookup latency and hit quality with a large on-disk index
+
+Usage: python benchmarks/bench_semantic_cache.py [entries] [lookups]
+"""
+
+import os
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache
+
+WORDS = (
+    "how do i write a python function that reads a csv file and sorts rows by date "
+    "explain the difference between threads and processes for network servers "
+    "what is the fastest way to parse json in rust or go with streaming input "
+    "summarize this article about database indexes caching and query planning "
+    "如何 优化 数据库 查询 性能 线程 缓存 网络 请求"
+).split()
+SYLLABLES = "ka ri to na me su lo pe di ga chu ran vin tor el is ap un ex om".split()
+MODEL = 'bench-model'
+BATCH = 20000
+
+
+def vocabulary(rng):
+    """The common words plus a few thousand made-up ones, weighted like natural text (Zipf)"""
+    words = list(dict.fromkeys(WORDS + [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        for _ in range(5000)]))
+    return words, list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+
+def prompt(rng, vocab):
+    words, cum_weights = vocab
+    return ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(8, 30)))
+
+
+def variant(text, rng, vocab):
+    """The same question typed differently: case, punctuation, spacing, one word"""
+    words = text.split()
+    kind = rng.randrange(4)
+    if kind == 0:
+        return '  '.join(words).upper() + '?'
+    if kind == 1:
+        return ', '.join(words) + '!!'
+    if kind == 2:
+        words[rng.randrange(len(words))] = rng.choice(vocab[0])
+        return ' '.join(words)
+    return ' '.join(words) + ' please'
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def report(label, times):
+    times = sorted(times)
+    p99 = times[int(len(times) * 0.99)]
+    print(f"  {label:<22} p50 {statistics.median(times):6.3f} ms   p99 {p99:6.3f} ms   max {times[-1]:6.3f} ms")
+    return p99
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(0)
+    vocab = vocabulary(rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SemanticCache(os.path.join(tmp, 'cache.db'), threshold=0.8, max_entries=entries)
+        start = time.perf_counter()
+        stored = []
+        for done in range(0, entries, BATCH):
+            batch = [prompt(rng, vocab) for _ in range(min(BATCH, entries - done))]
+            cache.store_many(MODEL, [([{"role": "user", "content": p}], f"answer {done + i}")
+                for i, p in enumerate(batch)])
+            stored.extend(rng.sample(batch, min(len(batch), lookups * BATCH // entries + 1)))
+        print(f"{entries} entries indexed in {time.perf_counter() - start:.1f} s, "
+              f"{os.path.getsize(cache.path) / 2 ** 20:.0f} MB")
+
+        kinds = {'exact': [], 'variant': [], 'unseen': []}
+        outcomes = {kind: 0 for kind in kinds}
+        for i in range(lookups):
+            original = stored[i % len(stored)]
+            for kind, text in (('exact', original), ('variant', variant(original, rng, vocab)),
+                               ('unseen', prompt(rng, vocab))):
+                hit, ms = timed(cache.lookup, MODEL, [{"role": "user", "content": text}])
+                kinds[kind].append(ms)
+                outcomes[kind] += hit is not None
+
+        print(f"{lookups} lookups of each kind:")
+        worst = max(report(kind, times) for kind, times in kinds.items())
+        for kind in kinds:
+            print(f"  {kind:<22} hit {outcomes[kind] / lookups:6.1%}")
+        quality = cache.quality()
+        print(f"quality: hit rate {quality['hit_rate']:.1%}, exact {quality['exact_hits']}, near {quality['near_hits']}, "
+              f"avg near similarity {quality['avg_near_similarity'] or 0:.2f}, min {quality['min_near_similarity'] or 0:.2f}")
+        print(f"p99 lookup {'under' if worst < 1 else 'OVER'} 1 ms")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
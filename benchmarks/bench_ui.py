@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the chat window
+Renders scripted conversations and synthetic streams in SimpleAIChat under a virtual X display
+
+Usage: python benchmarks/bench_ui.py [--output report.json] [--compare baseline.json]
+                                     [--scale 1.0] [--rounds 3] [--chars-per-sec 20000]
+
+Uses the current DISPLAY, or starts a virtual one (pyvirtualdisplay if it is
+installed, otherwise Xvfb). The app runs against a throwaway home directory
+and a scripted client, so no settings, history or network are touched. The
+JSON report (stdout, or --output) has per-scenario timings, frame-time
+percentiles, widget counts and memory; --compare prints the change of every
+timing against an earlier report.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROSE = (
+    "the window renders each answer as it streams in while the tokenizer splits "
+    "prose from code so that long replies stay responsive and scrolling keeps up "
+    "with the text even when a conversation grows to hundreds of messages"
+).split()
+CODE_LINES = [
+    "def handle(request, *, timeout=30):",
+    "    result = await client.fetch(request.url, timeout=timeout)",
+    "    if result.status != 200:  # retry once",
+    "        raise RuntimeError(f\"failed: {result.status}\")",
+    "    return {\"items\": [item.id for item in result.items]}",
+    "",
+    "class Cache(dict):",
+    "    \"\"\"Tiny LRU\"\"\"",
+    "    def get(self, key, default=None):",
+    "        return super().get(key, default)",
+]
+CJK = "流式输出的每个片段都会立即显示在窗口中，代码块与正文分开渲染。长对话需要保持滚动流畅，内存占用也要稳定。"
+
+
+def prose(rng, chars):
+    words = []
+    size = 0
+    while size < chars:
+        word = rng.choice(PROSE)
+        if rng.random() < 0.03:
+            word += ".\n\n"
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+
+def code(rng, lines):
+    return '\n'.join(rng.choice(CODE_LINES) for _ in range(lines))
+
+
+def corpus(scale):
+    """Answers that stress different parts of rendering"""
+    rng = random.Random(0)
+    blocks = []
+    for _ in range(max(1, int(30 * scale))):
+        blocks.append(prose(rng, 300))
+        blocks.append(f"```python\n{code(rng, 20)}\n```")
+    return {
+        'prose': prose(rng, int(40000 * scale)),
+        'code_blocks': '\n\n'.join(blocks),
+        'huge_block': f"Here is the file:\n\n```python\n{code(rng, int(5000 * scale))}\n```\n",
+        'cjk': ''.join(CJK for _ in range(int(20000 * scale) // len(CJK) + 1)),
+    }
+
+
+def isolate():
+    """Throwaway home and settings - call before importing the app"""
+    home = tempfile.mkdtemp(prefix='aichat-bench-')
+    os.environ.update(HOME=home, USERPROFILE=home, API_KEY='bench', API_BASE_URL='http://127.0.0.1:9',
+        HEALTH_INTERVAL='0', AUDIT_LOG='0', HEDGE='0', SEMANTIC_CACHE='0', COMPACT_TOKENS='0',
+        STALL_WATCHDOG='0')
+    return home
+
+
+@contextlib.contextmanager
+def virtual_display(width=1280, height=900):
+    """Yields how the display was provided"""
+    if os.environ.get('DISPLAY') or sys.platform in ('win32', 'darwin'):
+        yield 'existing'
+        return
+    try:
+        from pyvirtualdisplay import Display
+    except ImportError:
+        Display = None
+    if Display is not None:
+        with Display(visible=False, size=(width, height)):
+            yield 'pyvirtualdisplay'
+        return
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        raise SystemExit("No display: set DISPLAY, or install Xvfb (or pyvirtualdisplay)")
+    number = next(n for n in range(99, 300)
+        if not os.path.exists(f'/tmp/.X11-unix/X{n}') and not os.path.exists(f'/tmp/.X{n}-lock'))
+    process = subprocess.Popen([xvfb, f':{number}', '-screen', '0', f'{width}x{height}x24', '-nolisten', 'tcp'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(f'/tmp/.X11-unix/X{number}'):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise SystemExit("Xvfb did not start")
+        time.sleep(0.05)
+    os.environ['DISPLAY'] = f':{number}'
+    try:
+        yield 'xvfb'
+    finally:
+        del os.environ['DISPLAY']
+        process.terminate()
+        process.wait()
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+    return {'count': len(values), 'p50_ms': round(statistics.median(values), 3), 'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99), 'max_ms': round(values[-1], 3), 'total_ms': round(sum(values), 3)}
+
+
+class OpTimer:
+    """Wraps methods to collect their durations; restore() puts the originals back"""
+
+    def __init__(self):
+        self.durations = {}
+        self._patched = []
+
+    def wrap(self, cls, name, label=None):
+        original = getattr(cls, name)
+        samples = self.durations.setdefault(label or name, [])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append((time.perf_counter() - start) * 1000)
+
+        setattr(cls, name, timed)
+        self._patched.append((cls, name, original))
+
+    def reset(self):
+        for samples in self.durations.values():
+            samples.clear()
+
+    def report(self):
+        return {name: percentiles(samples) for name, samples in self.durations.items() if samples}
+
+    def restore(self):
+        for cls, name, original in reversed(self._patched):
+            setattr(cls, name, original)
+
+
+class FrameSampler:
+    """Asks for a callback every 16 ms and records how far apart they really ran"""
+
+    TICK_MS = 16
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.frames = []
+        self._job = None
+        self._last = None
+
+    def start(self):
+        self.frames = []
+        self._last = time.perf_counter()
+        self._job = self.widget.after(self.TICK_MS, self._tick)
+
+    def stop(self):
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        return self.frames
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.frames.append((now - self._last) * 1000)
+        self._last = now
+        self._job = self.widget.after(self.TICK_MS, self._tick)
+
+
+def pump(app, done, timeout=120):
+    """Run the event loop until done() is true"""
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("scenario did not finish")
+        app.update()
+        time.sleep(0.001)
+
+
+def settle(app, ms=200):
+    """Let pending after() work (highlighting, layout) finish"""
+    end = time.perf_counter() + ms / 1000
+    pump(app, lambda: time.perf_counter() > end)
+
+
+def snapshot(app, tab):
+    from perf_hud import count_widgets, process_rss
+    rss = process_rss()
+    return count_widgets(tab.chat_scroll), rss / 1024 / 1024 if rss is not None else None
+
+
+def scripted_client(chars_per_sec, delta_chars=8):
+    """An APIClient whose streams replay a prepared answer at a steady rate"""
+    from api_client import APIClient, StreamResult
+
+    class ScriptedClient(APIClient):
+        script = ''
+
+        def send_message_stream(self, messages, use_cache=True):
+            result = StreamResult()
+            result._deltas = self._replay(result, self.script)
+            return result
+
+        def _replay(self, result, script):
+            result.model = self.model
+            interval = delta_chars / chars_per_sec
+            next_at = time.perf_counter()
+            for i in range(0, len(script), delta_chars):
+                next_at += interval
+                pause = next_at - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+                yield script[i:i + delta_chars]
+            result.usage = {'input_tokens': 10, 'output_tokens': len(script) // 4}
+            result.stop_reason = 'end_turn'
+
+    client = ScriptedClient()
+    client.model = 'bench-scripted'
+    return client
+
+
+def render_scenario(app, tab, text):
+    """One finished answer rendered in one go (history, finish of a stream)"""
+    tab.clear()
+    settle(app, 50)
+    widgets_before, rss_before = snapshot(app, tab)
+    start = time.perf_counter()
+    tab.add_ai_message(text)
+    app.update_idletasks()
+    render_ms = (time.perf_counter() - start) * 1000
+    sampler = FrameSampler(app)
+    sampler.start()
+    settle(app, 300)
+    frames = sampler.stop()
+    widgets, rss = snapshot(app, tab)
+    return {'render_ms': round(render_ms, 3), 'frames': percentiles(frames),
+        'widgets': widgets - widgets_before, 'rss_delta_mb': round(rss - rss_before, 2) if rss else None}
+
+
+def stream_scenario(app, tab, text):
+    """The answer streamed in at the scripted rate, then rendered"""
+    tab.clear()
+    settle(app, 50)
+    widgets_before, rss_before = snapshot(app, tab)
+    app.client.script = text
+    sampler = FrameSampler(app)
+    sampler.start()
+    start = time.perf_counter()
+    tab.send("benchmark prompt")
+    pump(app, lambda: tab.first_text_at is not None)
+    first_paint_ms = (time.perf_counter() - start) * 1000
+    pump(app, lambda: not tab.is_streaming and not tab.pending_finish)
+    total_ms = (time.perf_counter() - start) * 1000
+    frames = sampler.stop()
+    widgets, rss = snapshot(app, tab)
+    return {'first_text_ms': round(first_paint_ms, 3), 'total_ms': round(total_ms, 3),
+        'frames': percentiles(frames), 'widgets': widgets - widgets_before,
+        'rss_delta_mb': round(rss - rss_before, 2) if rss else None}
+
+
+def expand_scenario(app, tab, text):
+    """Expand the first code block until it is fully inserted and highlighted"""
+    from ai_chat_simple import CodeBlock
+    tab.clear()
+    tab.add_ai_message(text)
+    blocks = [w for w in tab.chat_scroll.winfo_children() if isinstance(w, CodeBlock)]
+    block = blocks[0]
+    pump(app, lambda: block.tokens is not None)
+    sampler = FrameSampler(app)
+    sampler.start()
+    start = time.perf_counter()
+    block.toggle_expand()
+    pump(app, lambda: block.insert_job is None and block.tag_job is None and block.inserted == len(block.code))
+    total_ms = (time.perf_counter() - start) * 1000
+    return {'lines': block.total_lines, 'total_ms': round(total_ms, 3), 'frames': percentiles(sampler.stop())}
+
+
+def conversation_scenario(app, tab, texts, turns):
+    """A long scripted conversation, then scrolling to the end of it"""
+    tab.clear()
+    settle(app, 50)
+    widgets_before, rss_before = snapshot(app, tab)
+    kinds = list(texts)
+    start = time.perf_counter()
+    for i in range(turns):
+        tab.add_user_message(f"question {i}: how does part {i} work?")
+        tab.add_ai_message(texts[kinds[i % len(kinds)]][:4000])
+    app.update_idletasks()
+    build_ms = (time.perf_counter() - start) * 1000
+    scrolls = []
+    for _ in range(20):
+        tab.chat_scroll._parent_canvas.yview_moveto(0.0)
+        app.update()
+        scroll_start = time.perf_counter()
+        tab.scroll_to_bottom()
+        app.update_idletasks()
+        scrolls.append((time.perf_counter() - scroll_start) * 1000)
+    widgets, rss = snapshot(app, tab)
+    return {'turns': turns, 'build_ms': round(build_ms, 3), 'scroll': percentiles(scrolls),
+        'widgets': widgets - widgets_before, 'rss_delta_mb': round(rss - rss_before, 2) if rss else None}
+
+
+def median_run(runs):
+    """Element-wise median of the rounds' numeric results"""
+    first = runs[0]
+    merged = {}
+    for key, value in first.items():
+        if isinstance(value, dict):
+            merged[key] = median_run([run[key] for run in runs])
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values = [run[key] for run in runs if run[key] is not None]
+            merged[key] = round(statistics.median(values), 3) if values else None
+        else:
+            merged[key] = value
+    return merged
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+            text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args, display):
+    from ai_chat_simple import ChatTab, CodeBlock, SimpleAIChat
+
+    timer = OpTimer()
+    for cls, name in ((ChatTab, 'render_content'), (ChatTab, 'scroll_to_bottom'), (ChatTab, 'append_stream'),
+                      (ChatTab, 'finish_response'), (CodeBlock, '__init__'), (CodeBlock, 'insert_step'),
+                      (CodeBlock, 'apply_tags')):
+        timer.wrap(cls, name, f"{cls.__name__}.{name}")
+
+    app = SimpleAIChat()
+    try:
+        app.client = scripted_client(args.chars_per_sec)
+        app.update()
+        tab = app.active_tab
+        texts = corpus(args.scale)
+        scenarios = {}
+        for kind, text in texts.items():
+            scenarios[f"render/{kind}"] = lambda t=text: render_scenario(app, tab, t)
+            scenarios[f"stream/{kind}"] = lambda t=text: stream_scenario(app, tab, t)
+        scenarios["expand/huge_block"] = lambda: expand_scenario(app, tab, texts['huge_block'])
+        scenarios["conversation"] = lambda: conversation_scenario(app, tab, texts, int(40 * args.scale) or 1)
+
+        results = {}
+        for name, scenario in scenarios.items():
+            if args.only and args.only not in name:
+                continue
+            timer.reset()
+            runs = [scenario() for _ in range(args.rounds)]
+            results[name] = median_run(runs)
+            results[name]['ops'] = timer.report()
+            print(f"  {name:<24} done", file=sys.stderr)
+    finally:
+        timer.restore()
+        app.on_close()
+
+    return {
+        'benchmark': 'ui',
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'display': display,
+        'scale': args.scale,
+        'rounds': args.rounds,
+        'chars_per_sec': args.chars_per_sec,
+        'results': results,
+    }
+
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif key.endswith('_ms') and isinstance(value, (int, float)):
+            yield f"{prefix}{key}", value
+
+
+def compare(baseline, report):
+    """Every timing of the report next to the baseline's"""
+    old = dict(flatten(baseline['results']))
+    print(f"{'':<64}{baseline.get('commit') or 'baseline':>12}{report.get('commit') or 'current':>12}{'change':>9}")
+    for key, value in flatten(report['results']):
+        if key in old and '.ops.' not in key:
+            change = f"{(value - old[key]) / old[key]:+.0%}" if old[key] else "-"
+            print(f"{key:<64}{old[key]:>12.2f}{value:>12.2f}{change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--compare', help="JSON report of an earlier run to compare against")
+    parser.add_argument('--scale', type=float, default=1.0, help="size of the synthetic answers")
+    parser.add_argument('--rounds', type=int, default=3, help="runs per scenario (the median is reported)")
+    parser.add_argument('--chars-per-sec', type=int, default=20000, help="rate of the scripted streams")
+    parser.add_argument('--only', help="run only scenarios whose name contains this")
+    args = parser.parse_args()
+
+    home = isolate()
+    try:
+        with virtual_display() as display:
+            report = run(args, display)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
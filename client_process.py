@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Client process module
+Runs the API client's network reads, SSE parsing and JSON decoding in a worker process
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Generator, List, Optional, Tuple
+from dotenv import dotenv_values
+
+from api_client import APIClient, StreamResult
+from audit_log import close_shared
+from deadlines import count, counters
+from scheduler import INTERACTIVE
+
+# Text deltas are coalesced and sent at most this often (per worker, for all streams)
+FLUSH_MS = float(os.getenv('CLIENT_PROCESS_FLUSH_MS', '10'))
+# More crashes than this within CRASH_WINDOW seconds and requests run in-process again
+MAX_CRASHES = int(os.getenv('CLIENT_PROCESS_MAX_CRASHES', '5'))
+CRASH_WINDOW = 60.0
+# After an abort, wait this long for the worker's final usage
+ABORT_WAIT = 0.5
+
+# Metadata the worker reports at the end of a stream
+_META = ('usage', 'stop_reason', 'model', 'message_id', 'resumes')
+
+
+def enabled(config_path: Optional[str] = None) -> bool:
+    """CLIENT_PROCESS=1, read before APIClient has loaded the config file (whose settings win)"""
+    value = os.getenv('CLIENT_PROCESS', '0')
+    if config_path and os.path.exists(config_path):
+        value = dotenv_values(config_path).get('CLIENT_PROCESS', value)
+    return value == '1'
+
+
+class Outbox:
+    """
+    Worker-side sender
+
+    Text deltas are appended per request and sent together, one pipe message
+    per FLUSH_MS instead of one per delta; events (end of a stream, a reply)
+    go out at once, after any text queued before them.
+    """
+
+    def __init__(self, conn, interval: float):
+        self.conn = conn
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._text: Dict[int, List[str]] = {}
+        self._events: List[Tuple] = []
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ipc-outbox', daemon=True)
+        self._thread.start()
+
+    def text(self, request_id: int, text: str):
+        with self._cond:
+            if not self._text and not self._events:
+                self._cond.notify()
+            self._text.setdefault(request_id, []).append(text)
+
+    def event(self, message: Tuple):
+        with self._cond:
+            self._events.append(message)
+            self._cond.notify()
+
+    def close(self):
+        """Send what is queued and stop"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(5)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._text or self._events or self._closed):
+                    self._cond.wait()
+                if not self._events and not self._closed:
+                    # Let more deltas pile up; an event cuts the wait short
+                    self._cond.wait(self.interval)
+                text, self._text = self._text, {}
+                events, self._events = self._events, []
+                closed = self._closed
+            try:
+                if text:
+                    self.conn.send(('text', {rid: ''.join(parts) for rid, parts in text.items()}))
+                for message in events:
+                    self.conn.send(message)
+            except OSError:
+                # The app is gone; the main loop sees EOF and exits
+                return
+            if closed and not text and not events:
+                return
+
+
+def _meta(result: StreamResult) -> Dict[str, Any]:
+    return {name: getattr(result, name) for name in _META}
+
+
+def _pump(result: StreamResult, request_id: int, outbox: Outbox, streams: Dict[int, StreamResult]):
+    try:
+        for text in result:
+            outbox.text(request_id, text)
+        outbox.event(('done', request_id, _meta(result), counters()))
+    except Exception as e:
+        outbox.event(('error', request_id, str(e), _meta(result), counters()))
+    finally:
+        streams.pop(request_id, None)
+
+
+def _call(client: APIClient, request_id: int, messages: List[Dict[str, Any]], outbox: Outbox):
+    try:
+        outbox.event(('reply', request_id, client.send_message(messages, priority=None), counters()))
+    except Exception as e:
+        outbox.event(('error', request_id, str(e), {}, counters()))
+
+
+def serve(conn, config_path: Optional[str]):
+    """
+    Worker process entry point
+
+    Requests are ('stream' | 'message', id, model, base_url, messages) and
+    ('abort', id); None stops the worker once its streams have ended. The
+    app's process holds the scheduler slots, so requests run unscheduled here.
+    Replies end with the worker's timeout counters.
+    """
+    client = APIClient(config_path)
+    clients = {(client.model, client.base_url): client}
+    outbox = Outbox(conn, FLUSH_MS / 1000)
+    streams: Dict[int, StreamResult] = {}
+    threads: List[threading.Thread] = []
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                # The app exited or crashed - nobody is reading any more
+                for result in list(streams.values()):
+                    result.abort()
+                return
+            if request is None:
+                break
+            op, request_id = request[0], request[1]
+            if op == 'abort':
+                result = streams.get(request_id)
+                if result is not None:
+                    result.abort()
+                continue
+            model, base_url, messages = request[2:]
+            target = clients.get((model, base_url))
+            if target is None:
+                target = clients[(model, base_url)] = client.with_model(model, base_url)
+            if op == 'stream':
+                result = target.send_message_stream(messages, use_cache=False, priority=None)
+                streams[request_id] = result
+                thread = threading.Thread(target=_pump, args=(result, request_id, outbox, streams), daemon=True)
+            else:
+                thread = threading.Thread(target=_call, args=(target, request_id, messages, outbox), daemon=True)
+            thread.start()
+            threads = [t for t in threads if t.is_alive()] + [thread]
+        for thread in threads:
+            thread.join()
+    finally:
+        outbox.close()
+        close_shared()
+
+
+class RemoteStream(StreamResult):
+    """StreamResult of a request running in the worker; abort() reaches it there"""
+
+    def __init__(self, worker: 'ClientProcess'):
+        super().__init__()
+        self.worker = worker
+        self.request_id: Optional[int] = None
+
+    def shutdown(self):
+        if self.request_id is not None:
+            self.worker.abort(self.request_id)
+        else:
+            super().shutdown()
+
+    def merge(self, meta: Dict[str, Any]):
+        for name, value in meta.items():
+            if value is not None:
+                setattr(self, name, value)
+
+
+class ClientProcess:
+    """
+    The worker process, seen from the app
+
+    One duplex pipe carries every request; a reader thread hands each
+    reply to the queue of the request it belongs to, so the app's process
+    only unpickles one message per flush instead of parsing every SSE event.
+    A worker that dies is restarted at once and its requests fail with an
+    error; after MAX_CRASHES within a minute `disabled` is set and the
+    client runs requests in-process.
+    """
+
+    def __init__(self, config_path: Optional[str] = None):
+        self.config_path = config_path
+        self.disabled = False
+        self.restarts = 0
+        self._counters: Dict[str, int] = {}     # of the running worker
+        self._retired: Dict[str, int] = {}      # of the workers before it
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Tuple[Any, queue.Queue]] = {}
+        self._crashes: deque = deque()
+        self._stopping = False
+        self._process = None
+        self._conn = None
+        self._start()
+
+    def counters(self) -> Dict[str, int]:
+        """Timeout counters of the worker processes (deadlines.counters() of the app's own process misses them)"""
+        with self._lock:
+            total = dict(self._retired)
+            for name, value in self._counters.items():
+                total[name] = total.get(name, 0) + value
+        return total
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    def _start(self):
+        # spawn: forking a process that runs Tk and threads is unsafe
+        context = multiprocessing.get_context('spawn')
+        conn, child = context.Pipe()
+        process = context.Process(target=serve, args=(child, self.config_path), name='api-client', daemon=True)
+        process.start()
+        child.close()
+        self._process, self._conn = process, conn
+        threading.Thread(target=self._read, args=(conn, process), name='ipc-reader', daemon=True).start()
+
+    def _read(self, conn, process):
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == 'text':
+                    for request_id, text in message[1].items():
+                        self._deliver(request_id, ('text', text), False)
+                else:
+                    self._counters = message[-1]
+                    self._deliver(message[1], message[0:1] + message[2:-1], True)
+        except (EOFError, OSError):
+            pass
+        self._exited(conn, process)
+
+    def _deliver(self, request_id: int, item: Tuple, last: bool):
+        with self._lock:
+            entry = self._pending.pop(request_id, None) if last else self._pending.get(request_id)
+        if entry is not None:
+            entry[1].put(item)
+
+    def _exited(self, conn, process):
+        process.join(1)
+        conn.close()
+        with self._lock:
+            lost = [rid for rid, (c, _) in self._pending.items() if c is conn]
+            queues = [self._pending.pop(rid)[1] for rid in lost]
+            if self._conn is conn:
+                self._process = self._conn = None
+                for name, value in self._counters.items():
+                    self._retired[name] = self._retired.get(name, 0) + value
+                self._counters = {}
+            restart = not self._stopping and self._process is None
+            if restart:
+                now = time.monotonic()
+                self._crashes.append(now)
+                while self._crashes and now - self._crashes[0] > CRASH_WINDOW:
+                    self._crashes.popleft()
+                if len(self._crashes) > MAX_CRASHES:
+                    self.disabled = True
+                else:
+                    count('client_process_restarts')
+                    self.restarts += 1
+                    self._start()
+        for q in queues:
+            q.put(('error', f"API client process exited (code {process.exitcode})", {}))
+
+    def _request(self, op: str, client: APIClient, messages: List[Dict[str, Any]]) -> Tuple[int, queue.Queue]:
+        request_id = next(self._ids)
+        replies: queue.Queue = queue.Queue()
+        with self._lock:
+            if self._conn is None:
+                raise Exception("API client process is not running")
+            conn = self._conn
+            self._pending[request_id] = (conn, replies)
+        self._send(conn, (op, request_id, client.model, client.base_url, messages))
+        return request_id, replies
+
+    def _send(self, conn, message):
+        try:
+            with self._send_lock:
+                conn.send(message)
+        except (OSError, ValueError):
+            # Died meanwhile - the reader fails the request
+            pass
+
+    def stream(self, client: APIClient, messages: List[Dict[str, Any]],
+               result: RemoteStream) -> Generator[str, None, None]:
+        """Text of a stream run by the worker; result gets its metadata at the end"""
+        request_id, replies = self._request('stream', client, messages)
+        result.request_id = request_id
+        ended = False
+        try:
+            while True:
+                item = replies.get()
+                if item[0] == 'text':
+                    yield item[1]
+                    continue
+                ended = True
+                if item[0] == 'done':
+                    result.merge(item[1])
+                    return
+                result.merge(item[2])
+                raise Exception(item[1])
+        finally:
+            if not ended:
+                # Closed early: stop the worker's stream and keep its usage, if it comes soon
+                self.abort(request_id)
+                deadline = time.monotonic() + ABORT_WAIT
+                try:
+                    while True:
+                        item = replies.get(timeout=max(0.0, deadline - time.monotonic()))
+                        if item[0] != 'text':
+                            result.merge(item[-1])
+                            break
+                except queue.Empty:
+                    pass
+                with self._lock:
+                    self._pending.pop(request_id, None)
+
+    def call(self, client: APIClient, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Non-streaming request run by the worker"""
+        _, replies = self._request('message', client, messages)
+        item = replies.get()
+        if item[0] == 'reply':
+            return item[1]
+        raise Exception(item[1])
+
+    def abort(self, request_id: int):
+        with self._lock:
+            conn = self._conn
+        if conn is not None:
+            self._send(conn, ('abort', request_id))
+
+    def stop(self):
+        """Let running streams end, then stop the worker (no restart)"""
+        with self._lock:
+            self._stopping = True
+            conn = self._conn
+        if conn is not None:
+            self._send(conn, None)
+
+
+class ProcessClient(APIClient):
+    """
+    APIClient whose requests run in a ClientProcess (CLIENT_PROCESS=1)
+
+    Scheduling and the semantic cache lookup stay in the app's process; the
+    worker does the HTTP, SSE parsing and JSON decoding, so the Tk main loop
+    no longer competes with them for the GIL during fast streams. Batches,
+    connection tests and health probes still run in-process.
+    """
+
+    def __init__(self, config_path: Optional[str] = None):
+        super().__init__(config_path)
+        self.worker = ClientProcess(config_path)
+
+    def send_message(self, messages: List[Dict[str, str]], priority: str = INTERACTIVE,
+                     deadline: Optional[float] = None) -> Dict[str, Any]:
+        if self.worker.disabled:
+            return super().send_message(messages, priority, deadline)
+        if priority is None:
+            return self.worker.call(self, messages)
+        with self.scheduler.slot(priority, deadline):
+            return self.worker.call(self, messages)
+
+    def send_message_stream(self, messages: List[Dict[str, str]], use_cache: bool = True,
+                            priority: str = INTERACTIVE) -> StreamResult:
+        result = RemoteStream(self.worker)
+        if use_cache and self.cache is not None:
+            result._deltas = self._cached_or_streamed(messages, result, priority)
+        else:
+            result._deltas = self._scheduled(messages, result, priority)
+        return result
+
+    def _scheduled(self, messages: List[Dict[str, str]], result: StreamResult,
+                   priority: str) -> Generator[str, None, None]:
+        if self.worker.disabled:
+            yield from super()._scheduled(messages, result, priority)
+            return
+        if priority is None:
+            yield from self.worker.stream(self, messages, result)
+            return
+        with self.scheduler.slot(priority, self.ttft_timeout or None) as ticket:
+            result.queue_ms = ticket.wait_ms
+            yield from self.worker.stream(self, messages, result)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation compaction module
+Summarizes older turns so long sessions stop resending their full history
+"""
+
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from attachments import message_chars
+from scheduler import BACKGROUND
+
+SUMMARY_PROMPT = (
+    "You compress chat history. Summarize the conversation you are given so that "
+    "an assistant can continue it without the original messages. Keep facts, "
+    "decisions, names, code identifiers, file names, numbers, open questions and "
+    "the user's stated preferences. Be concise and do not add commentary."
+)
+
+
+class Compaction:
+    """Summary standing in for conversation[:upto] in the outgoing payload"""
+
+    def __init__(self, upto: int, summary: str, tokens_before: int, tokens_after: int,
+                 summary_ms: float, usage: Optional[Dict[str, Any]] = None):
+        self.upto = upto
+        self.summary = summary
+        self.tokens_before = tokens_before    # estimate for the replaced messages
+        self.tokens_after = tokens_after      # estimate for the summary
+        self.summary_ms = summary_ms
+        self.usage = usage or {}
+        # Filled in by the caller: the last prompt before compaction, for the report
+        self.prompt_tokens_before: Optional[int] = None
+        self.ttft_before_ms: Optional[float] = None
+
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(message_chars(m) for m in messages) // 4
+
+
+class Compactor:
+    """
+    Decides when to compact and produces summaries in the background
+
+    Disabled unless COMPACT_TOKENS is set. Once a prompt passes that many
+    tokens, everything but the last COMPACT_KEEP_MESSAGES messages is
+    summarized through the API client; the summary then goes into the system
+    prompt and the raw turns are left out of the payload. The conversation
+    itself is never modified.
+    """
+
+    def __init__(self, threshold: Optional[int] = None, keep: Optional[int] = None):
+        self.threshold = threshold if threshold is not None else int(os.getenv('COMPACT_TOKENS', '0'))
+        self.keep = keep if keep is not None else int(os.getenv('COMPACT_KEEP_MESSAGES', '6'))
+        self.idle_ms = int(os.getenv('COMPACT_IDLE_MS', '2000'))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compaction')
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def cut_point(self, conversation: List[Dict[str, Any]], current: Optional[Compaction],
+                  prompt_tokens: Optional[int] = None) -> Optional[int]:
+        """
+        Index to summarize up to, or None if no compaction is due
+
+        Args:
+            conversation: Full conversation (without the system prompt)
+            current: Compaction already in effect, if any
+            prompt_tokens: Exact input tokens of the last request, when known
+        """
+        if not self.enabled:
+            return None
+        start = current.upto if current else 0
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(conversation[start:]) + (current.tokens_after if current else 0)
+        if prompt_tokens < self.threshold:
+            return None
+        # The kept tail has to start with a user message
+        cut = len(conversation) - self.keep
+        while cut > start and conversation[cut]['role'] != 'user':
+            cut -= 1
+        return cut if cut > start else None
+
+    def summarize(self, client, conversation: List[Dict[str, Any]], cut: int,
+                  current: Optional[Compaction]) -> Compaction:
+        """Summarize conversation[:cut] (blocking - runs on the worker, as background work)"""
+        start = current.upto if current else 0
+        lines = []
+        if current:
+            lines.append(f"Summary of the conversation so far:\n{current.summary}\n\nContinuation:")
+        for msg in conversation[start:cut]:
+            speaker = "User" if msg['role'] == 'user' else "Assistant"
+            for ref in msg.get('attachments', ()):
+                lines.append(f"{speaker}: [attached file {ref['name']}, {ref['lines']} lines]")
+            if msg['content']:
+                lines.append(f"{speaker}: {msg['content']}")
+
+        began = time.perf_counter()
+        response = client.send_message([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": '\n\n'.join(lines)},
+        ], priority=BACKGROUND)
+        summary_ms = (time.perf_counter() - began) * 1000
+        summary = response['choices'][0]['message']['content'].strip()
+        if not summary:
+            raise ValueError("Empty summary")
+
+        tokens_before = estimate_tokens(conversation[start:cut]) + (current.tokens_after if current else 0)
+        return Compaction(cut, summary, tokens_before, len(summary) // 4, summary_ms, response.get('usage'))
+
+    def summarize_async(self, client, conversation: List[Dict[str, Any]], cut: int,
+                        current: Optional[Compaction]) -> Future:
+        """summarize on a background thread (pass a snapshot of the conversation)"""
+        return self._executor.submit(self.summarize, client, conversation, cut, current)
+
+    @staticmethod
+    def apply(system_prompt: str, conversation: List[Dict[str, Any]],
+              compaction: Optional[Compaction]) -> List[Dict[str, Any]]:
+        """Outgoing messages: system prompt (+ summary) and the raw turns after it"""
+        if compaction is None:
+            return [{"role": "system", "content": system_prompt}] + list(conversation)
+        system = f"{system_prompt}\n\nSummary of the earlier conversation:\n{compaction.summary}"
+        return [{"role": "system", "content": system}] + conversation[compaction.upto:]
+
+
+def describe(compaction: Compaction) -> str:
+    return (f"🗜 Compacted {compaction.upto} earlier messages: ~{compaction.tokens_before} → "
+            f"~{compaction.tokens_after} tokens (summary took {compaction.summary_ms / 1000:.1f}s). "
+            f"Full history is still shown here.")
+
+
+def describe_effect(compaction: Compaction, prompt_tokens: Optional[int], ttft_ms: Optional[float]) -> str:
+    """Before/after of the first turn sent with the summary"""
+    parts = []
+    if compaction.prompt_tokens_before and prompt_tokens:
+        parts.append(f"input tokens {compaction.prompt_tokens_before} → {prompt_tokens}")
+    if compaction.ttft_before_ms is not None and ttft_ms is not None:
+        parts.append(f"TTFT {compaction.ttft_before_ms:.0f} → {ttft_ms:.0f} ms")
+    return "🗜 After compaction: " + ', '.join(parts) if parts else ""
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation tree module
+Branching conversations: edits and regenerated answers become siblings that share their prefix
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Parent seq of the first message in the history store
+ROOT_SEQ = -1
+
+
+class Node:
+    """One message; its children are the alternative continuations"""
+
+    __slots__ = ('message', 'parent', 'children', 'active', 'seq', 'created')
+
+    def __init__(self, message: Optional[Dict[str, Any]], parent: Optional['Node'], seq: Optional[int] = None,
+                 created: Optional[float] = None):
+        self.message = message
+        self.parent = parent
+        self.children: List['Node'] = []
+        self.active: Optional['Node'] = None   # the child the conversation continues with
+        self.seq = seq                         # row in the history store, once persisted
+        self.created = created if created is not None else time.time()
+
+    @property
+    def siblings(self) -> List['Node']:
+        return self.parent.children if self.parent is not None else [self]
+
+
+class ConversationTree:
+    """
+    Every version of a conversation, with one branch selected
+
+    Branches share the Node objects - and so the very message dicts - of
+    their common prefix, so it is kept once and every branch sends it
+    byte-for-byte the same way, which keeps the provider's prompt cache warm.
+    `messages` is the selected branch as the plain list the rest of the app
+    sends; it is a new list after rewind() and switch(), so holders of the
+    old one can tell the branch changed.
+    """
+
+    def __init__(self):
+        self.root = Node(None, None, ROOT_SEQ)
+        self.path: List[Node] = []
+        self.messages: List[Dict[str, Any]] = []
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int, float, Dict[str, Any]]],
+                  head: Optional[int] = None) -> 'ConversationTree':
+        """
+        Rebuild a stored tree
+
+        Args:
+            rows: (seq, parent seq, created, message) with parents before their children
+            head: seq of the selected branch's last message (None = the newest message)
+        """
+        tree = cls()
+        nodes = {ROOT_SEQ: tree.root}
+        last = None
+        for seq, parent_seq, created, message in rows:
+            parent = nodes.get(parent_seq, tree.root)
+            node = Node(message, parent, seq, created)
+            parent.children.append(node)
+            parent.active = node
+            nodes[seq] = node
+            last = node
+        selected = nodes.get(head, last) if head is not None else last
+        if selected is not None:
+            tree.switch(selected)
+        return tree
+
+    def __len__(self) -> int:
+        return len(self.path)
+
+    @property
+    def head(self) -> Node:
+        return self.path[-1] if self.path else self.root
+
+    def append(self, message: Dict[str, Any], seq: Optional[int] = None, created: Optional[float] = None) -> Node:
+        """Continue the selected branch; after rewind() this starts a new sibling"""
+        parent = self.head
+        node = Node(message, parent, seq, created)
+        parent.children.append(node)
+        parent.active = node
+        self.path.append(node)
+        self.messages.append(message)
+        return node
+
+    def pop(self) -> Node:
+        """Remove the last message of the branch (it must have no continuations)"""
+        node = self.path.pop()
+        self.messages.pop()
+        parent = node.parent
+        parent.children.remove(node)
+        parent.active = parent.children[-1] if parent.children else None
+        return node
+
+    def rewind(self, length: int):
+        """Select the first `length` messages, ready to append an alternative to the next one"""
+        self.path = self.path[:length]
+        self.messages = [node.message for node in self.path]
+
+    def switch(self, node: Node) -> int:
+        """
+        Select the branch through node, continuing with the last-used children below it
+
+        Returns:
+            How many leading messages the new branch shares with the old one
+        """
+        above = []
+        current = node
+        while current.parent is not None:
+            current.parent.active = current
+            above.append(current)
+            current = current.parent
+        path = above[::-1]
+        current = node
+        while current.active is not None:
+            current = current.active
+            path.append(current)
+
+        shared = common_prefix(self.path, path)
+        self.path = path
+        self.messages = [n.message for n in path]
+        return shared
+
+    def index(self, node: Node) -> Optional[int]:
+        """Position of node in the selected branch, if it is on it"""
+        for i in range(len(self.path) - 1, -1, -1):
+            if self.path[i] is node:
+                return i
+        return None
+
+
+def common_prefix(a: List[Node], b: List[Node]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x is not y:
+            break
+        n += 1
+    return n
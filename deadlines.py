@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Stream deadlines module
+First-token and idle deadlines for streaming requests, and timeout/hedge counters
+"""
+
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Set
+
+CHECK_INTERVAL = 0.1
+
+_counters: Counter = Counter()
+_counters_lock = threading.Lock()
+
+
+def count(name: str, n: int = 1):
+    with _counters_lock:
+        _counters[name] += n
+
+
+def counters() -> Dict[str, int]:
+    """connect/ttft/idle timeouts, hedges sent/won/wasted so far"""
+    with _counters_lock:
+        return dict(_counters)
+
+
+class Deadline:
+    """
+    Deadlines of one streaming attempt
+
+    The stream calls text() for every text delta. Until the first one the
+    first-token deadline applies (counted from the request), after it the
+    idle deadline (counted from the last delta).
+    """
+
+    __slots__ = ('result', 'ttft_s', 'idle_s', 'started', 'last', 'texted', 'expired')
+
+    def __init__(self, result, ttft_s: Optional[float], idle_s: Optional[float], started: Optional[float] = None):
+        self.result = result
+        self.ttft_s = ttft_s
+        self.idle_s = idle_s
+        self.started = started or time.perf_counter()
+        self.last = self.started
+        self.texted = False
+        self.expired: Optional[str] = None   # 'ttft' or 'idle' once missed
+
+    def text(self):
+        self.texted = True
+        self.last = time.perf_counter()
+
+    def missed(self, now: float) -> Optional[str]:
+        if not self.texted:
+            return 'ttft' if self.ttft_s and now - self.started > self.ttft_s else None
+        return 'idle' if self.idle_s and now - self.last > self.idle_s else None
+
+    def describe(self) -> str:
+        if self.expired == 'ttft':
+            return f"no first token within {self.ttft_s:g}s"
+        return f"no data for {self.idle_s:g}s"
+
+
+class DeadlineWatchdog:
+    """
+    One background thread checking every watched stream
+
+    A stream that misses a deadline has its socket shut down (without
+    marking it aborted), so the blocked read fails and the client can treat
+    it as an interrupted stream. The thread sleeps while nothing is watched.
+    """
+
+    def __init__(self, interval: float = CHECK_INTERVAL):
+        self.interval = interval
+        self._watched: Set[Deadline] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, result, ttft_s: Optional[float], idle_s: Optional[float],
+              started: Optional[float] = None) -> Deadline:
+        deadline = Deadline(result, ttft_s, idle_s, started)
+        with self._cond:
+            self._watched.add(deadline)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='stream-deadlines', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return deadline
+
+    def unwatch(self, deadline: Deadline):
+        with self._cond:
+            self._watched.discard(deadline)
+
+    def expire(self, deadline: Deadline, reason: str):
+        """Record a missed deadline (also used when the socket timeout fired first)"""
+        deadline.expired = reason
+        self.unwatch(deadline)
+        count(f'{reason}_timeouts')
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._watched:
+                    self._cond.wait()
+                watched = list(self._watched)
+            now = time.perf_counter()
+            for deadline in watched:
+                reason = deadline.missed(now)
+                if reason:
+                    self.expire(deadline, reason)
+                    deadline.result.shutdown()
+            time.sleep(self.interval)
+
+
+_watchdog: Optional[DeadlineWatchdog] = None
+_watchdog_lock = threading.Lock()
+
+
+def watchdog() -> DeadlineWatchdog:
+    """Process-wide watchdog, started on first use"""
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            _watchdog = DeadlineWatchdog()
+        return _watchdog
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-model module
+Sends one prompt to several models: side by side (fan-out) or racing for the first token
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from deadlines import count
+
+# Race losers keep streaming this long after the winner's first token (for
+# their timings), then are cancelled
+DEFAULT_GRACE_MS = 300
+
+
+def parse_targets(spec: str) -> List[Tuple[str, Optional[str]]]:
+    """"model[@base_url],..." -> [(model, base_url or None)]"""
+    targets = []
+    for item in spec.split(','):
+        model, _, base_url = item.strip().partition('@')
+        if model.strip():
+            targets.append((model.strip(), base_url.strip() or None))
+    return targets
+
+
+def target_clients(client) -> List:
+    """The configured client first, then one per FANOUT_MODELS entry"""
+    clients = [client]
+    seen = {(client.model, client.base_url)}
+    for model, base_url in parse_targets(os.getenv('FANOUT_MODELS', '')):
+        key = (model, (base_url or client.base_url).rstrip('/'))
+        if key not in seen:
+            seen.add(key)
+            clients.append(client.with_model(model, base_url))
+    return clients
+
+
+def throughput(stream, finished_at: Optional[float] = None) -> Optional[float]:
+    """Output tokens per second after the first token, or None if unknown"""
+    output = (stream.usage or {}).get('output_tokens')
+    finished_at = finished_at or stream.finished_at
+    if not output or stream.ttft_ms is None or finished_at is None:
+        return None
+    duration = finished_at - stream.started - stream.ttft_ms / 1000
+    return output / duration if duration > 0 else None
+
+
+class Run:
+    """One model's attempt in a race"""
+
+    def __init__(self, client, delay_ms: float = 0):
+        self.client = client
+        self.model = client.model
+        self.delay_ms = delay_ms    # start only if nobody has produced text by then (a hedge)
+        self.stream = None
+        self.error: Optional[Exception] = None
+        self.outcome = 'pending'    # won, lost (finished within the grace period), cancelled, error, skipped
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        return self.stream.ttft_ms if self.stream is not None else None
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        if self.stream is None or self.finished_at is None:
+            return None
+        return throughput(self.stream, self.finished_at)
+
+    @property
+    def output_tokens(self) -> int:
+        return (self.stream.usage or {}).get('output_tokens', 0) if self.stream is not None else 0
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.stream is not None:
+            self.stream.abort()
+
+
+class Race:
+    """
+    Streams one prompt from several clients; the first to produce text wins
+
+    Only the winner's deltas reach the bridge. The others keep going for the
+    grace period - so their TTFT is still measured - and are then cancelled,
+    or as soon as the winner finishes. run() blocks (call it on a worker).
+
+    A run with a delay is a hedge: it starts only if no text has arrived by
+    then (or at once when another run fails), and is skipped otherwise.
+    With use_cache the first run may be answered from the semantic cache.
+    """
+
+    def __init__(self, clients: List, grace_ms: Optional[int] = None, delays: Optional[List[float]] = None,
+                 use_cache: bool = False):
+        self.runs = [Run(c, d) for c, d in zip(clients, delays or [0] * len(clients))]
+        self.use_cache = use_cache
+        self.grace_ms = grace_ms if grace_ms is not None else int(os.getenv('RACE_GRACE_MS', str(DEFAULT_GRACE_MS)))
+        self.winner: Optional[Run] = None
+        self._lock = threading.Lock()
+        self._settled = threading.Event()
+        self._wake = threading.Event()     # text arrived or a run failed - hedges stop waiting
+        self._remaining = len(self.runs)
+        self._timer: Optional[threading.Timer] = None
+
+    @property
+    def hedged(self) -> bool:
+        return any(run.delay_ms for run in self.runs)
+
+    def run(self, messages, bridge) -> Run:
+        threads = [threading.Thread(target=self._pump, args=(run, messages, bridge), daemon=True)
+            for run in self.runs]
+        for thread in threads:
+            thread.start()
+        while not self._settled.wait(0.1):
+            if bridge.closed:
+                break
+        if self._timer is not None:
+            self._timer.cancel()
+        self.cancel_losers(everyone=bridge.closed)
+        deadline = time.monotonic() + 1
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+        if self.winner is None:
+            errors = [run.error for run in self.runs if run.error is not None]
+            raise errors[0] if errors else Exception("No model produced an answer")
+        if self.winner.error is not None:
+            raise self.winner.error
+        return self.winner
+
+    def cancel_losers(self, everyone: bool = False):
+        with self._lock:
+            losers = [run for run in self.runs
+                if (everyone or run is not self.winner) and run.outcome == 'pending']
+            for run in losers:
+                run.outcome = 'cancelled'
+        for run in losers:
+            run.cancel()
+
+    def _pump(self, run: Run, messages, bridge):
+        try:
+            if run.delay_ms:
+                self._wake.wait(run.delay_ms / 1000)
+                with self._lock:
+                    if self.winner is not None or bridge.closed:
+                        run.outcome = 'skipped'
+                        return
+                count('hedges_sent')
+            run.stream = run.client.send_message_stream(messages, use_cache=self.use_cache and run is self.runs[0])
+            if run.cancelled.is_set():
+                return
+            for text in run.stream:
+                if run.cancelled.is_set() or bridge.closed:
+                    break
+                with self._lock:
+                    if self.winner is None:
+                        self.winner = run
+                        self._wake.set()
+                        if run.delay_ms:
+                            count('hedges_won')
+                        self._timer = threading.Timer(self.grace_ms / 1000, self.cancel_losers)
+                        self._timer.daemon = True
+                        self._timer.start()
+                if run is self.winner and not bridge.put(text):
+                    break
+        except Exception as e:
+            run.error = e
+            self._wake.set()
+        finally:
+            if run.stream is not None:
+                run.stream.close()
+            run.finished_at = time.perf_counter()
+            with self._lock:
+                if run.outcome == 'pending':
+                    run.outcome = 'error' if run.error else ('won' if run is self.winner else 'lost')
+                if run.delay_ms and run.outcome in ('lost', 'cancelled'):
+                    count('hedges_lost')
+                self._remaining -= 1
+                if run is self.winner or (self.winner is None and self._remaining == 0):
+                    self._settled.set()
+
+
+def describe_race(race: Race) -> str:
+    """Caption line, e.g. "🏁 model-a won (412 ms) · model-b 655 ms · model-c cancelled" """
+    parts = []
+    for run in sorted(race.runs, key=lambda r: r is not race.winner):
+        ttft = f"{run.ttft_ms:.0f} ms" if run.ttft_ms is not None else None
+        if run is race.winner:
+            parts.append(f"🏁 {run.model} won ({ttft})")
+        elif ttft and run.outcome != 'error':
+            parts.append(f"{run.model} {ttft}")
+        else:
+            parts.append(f"{run.model} {run.outcome}")
+    return ' · '.join(parts)
+
+
+def describe_hedge(race: Race) -> str:
+    """Caption line for a hedged turn, empty if the hedge wasn't needed"""
+    hedge = race.runs[-1]
+    if hedge.outcome == 'skipped' or race.winner is None:
+        return ""
+    who = "the hedge" if race.winner is hedge else "the original request"
+    return f"⑂ Hedged after {hedge.delay_ms:.0f} ms - {who} answered first"
+
+
+class HedgePolicy:
+    """
+    When to send a hedged duplicate of a single-model request
+
+    Enabled with HEDGE=1. A request with no first token by the
+    HEDGE_PERCENTILE (default 95th) of the model's recent TTFTs gets a second
+    copy - on another pooled connection, or to HEDGE_BASE_URL when set - and
+    the slower one is cancelled. Needs HEDGE_MIN_SAMPLES timings of the model
+    first; HEDGE_MIN_MS is the lowest delay used.
+    """
+
+    SAMPLES = 200
+
+    def __init__(self, load_samples: Optional[Callable[[str, int], List[float]]] = None):
+        """
+        Args:
+            load_samples: (model, limit) -> earlier TTFTs in ms, to start from
+        """
+        self.enabled = os.getenv('HEDGE', '0') == '1'
+        self.percentile = float(os.getenv('HEDGE_PERCENTILE', '95'))
+        self.min_samples = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+        self.min_ms = float(os.getenv('HEDGE_MIN_MS', '250'))
+        self.base_url = os.getenv('HEDGE_BASE_URL') or None
+        self.load_samples = load_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def _model_samples(self, model: str) -> Deque[float]:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = deque(maxlen=self.SAMPLES)
+            if self.load_samples is not None:
+                samples.extend(self.load_samples(model, self.SAMPLES))
+            self._samples[model] = samples
+        return samples
+
+    def record(self, model: str, ttft_ms: Optional[float]):
+        if ttft_ms is not None and model:
+            self._model_samples(model).append(ttft_ms)
+
+    def delay_ms(self, model: str) -> Optional[float]:
+        """How long to wait for the first token before hedging, or None for no hedge"""
+        if not self.enabled:
+            return None
+        samples = sorted(self._model_samples(model))
+        if len(samples) < self.min_samples:
+            return None
+        rank = max(1, math.ceil(self.percentile / 100 * len(samples)))
+        return max(self.min_ms, samples[rank - 1])
+
+    def clients(self, client) -> List:
+        """The original client and the one the hedge goes through"""
+        return [client, client.with_model(client.model, self.base_url)]
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Health probe module
+Cheap endpoint checks with cached results and jittered background probing
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from scheduler import IDLE
+
+PROBE_TIMEOUT = 10
+JITTER = 0.2
+
+
+class Health:
+    """Outcome of one probe"""
+
+    def __init__(self, status: str, latency_ms: Optional[float], detail: str = "", method: str = "",
+                 code: Optional[int] = None):
+        self.status = status            # ok, degraded (429/5xx), auth, error, down
+        self.latency_ms = latency_ms
+        self.code = code                # HTTP status
+        self.detail = detail
+        self.method = method            # models, reach or message
+        self.checked = time.monotonic()
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 'ok'
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.checked
+
+
+def probe(base_url: str, headers: Dict[str, str], model: str, method: str = 'models',
+          session: Optional[requests.Session] = None, connect_timeout: float = 5) -> Health:
+    """
+    One request against the endpoint
+
+    Args:
+        base_url: API base URL
+        headers: Request headers including authorization
+        model: Model name (only sent by the message probe)
+        method: "models" lists models (free, checks the key), "reach" only
+            checks that the server answers, "message" asks the model for one
+            token (checks key and model, costs a few tokens)
+        session: Session to reuse pooled connections from
+        connect_timeout: Connect timeout in seconds
+    """
+    http = session or requests
+    base_url = base_url.rstrip('/')
+    timeout = (connect_timeout, PROBE_TIMEOUT)
+    started = time.perf_counter()
+    try:
+        if method == 'message':
+            response = http.post(f"{base_url}/v1/messages", headers=headers, timeout=timeout,
+                json={'model': model, 'max_tokens': 1, 'messages': [{"role": "user", "content": "."}]})
+        elif method == 'reach':
+            response = http.head(f"{base_url}/v1/messages", headers=headers, timeout=timeout)
+        else:
+            response = http.get(f"{base_url}/v1/models", headers=headers, params={'limit': 1}, timeout=timeout)
+        response.close()
+    except requests.exceptions.RequestException as e:
+        return Health('down', None, str(e), method)
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    code = response.status_code
+    if method == 'reach':
+        # Any answer but a server error means it is up (HEAD on an endpoint is usually 404/405/501)
+        up = code < 500 or code == 501
+        return Health('ok' if up else 'degraded', latency_ms, f"HTTP {code}", method, code)
+    if code == 200:
+        return Health('ok', latency_ms, "", method, code)
+    if code in (401, 403):
+        return Health('auth', latency_ms, f"HTTP {code}: check the API key", method, code)
+    if code == 429 or (code >= 500 and code != 501):
+        return Health('degraded', latency_ms, f"HTTP {code}", method, code)
+    return Health('error', latency_ms, f"HTTP {code}", method, code)
+
+
+class HealthProbe:
+    """
+    Cached, periodically refreshed health of one client's endpoint
+
+    check() returns the last result while it is younger than HEALTH_TTL
+    seconds. Background probing runs every HEALTH_INTERVAL seconds (0
+    disables) with ±20% jitter, so several windows don't probe in step. The
+    background probe uses the free models endpoint and, where the server has
+    none, a plain reachability request - it never spends tokens. Only a
+    check with verify_model sends a one-token message. Background probes
+    run in the scheduler's idle class and are skipped while it has no free
+    slot (e.g. during a chat turn), keeping the last result.
+    """
+
+    def __init__(self, client, ttl: Optional[float] = None, interval: Optional[float] = None):
+        self.client = client
+        self.ttl = ttl if ttl is not None else float(os.getenv('HEALTH_TTL', '30'))
+        self.interval = interval if interval is not None else float(os.getenv('HEALTH_INTERVAL', '60'))
+        self.latest: Optional[Health] = None
+        self.method = 'models'           # falls back to 'reach' if the server has no models endpoint
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self, max_age: Optional[float] = None, verify_model: bool = False) -> Health:
+        """Cached health, probing if the cache is older than max_age (default HEALTH_TTL)"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            latest = self.latest
+            if latest is not None and latest.age <= max_age and (latest.method == 'message' or not verify_model):
+                return latest
+            health = self._probe('message' if verify_model else self.method)
+            if health.method == 'models' and health.code in (404, 405, 501):
+                # No models endpoint - fall back to checking reachability
+                self.method = 'reach'
+                health = self._probe('reach')
+            self.latest = health
+            return health
+
+    def start(self):
+        """Probe now and then periodically in the background"""
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(self._stop,), name='health-probe', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self, stop: threading.Event):
+        delay = random.uniform(0, 1)
+        while not stop.wait(delay):
+            scheduler = self.client.scheduler
+            ticket = scheduler.try_acquire(IDLE)
+            if ticket is not None:
+                try:
+                    self.check(max_age=0)
+                finally:
+                    scheduler.release(ticket)
+            delay = self.interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _probe(self, method: str) -> Health:
+        client = self.client
+        return probe(client.base_url, client._prepare_headers(), client.model, method,
+            session=client.session, connect_timeout=client.connect_timeout)
+
+
+def describe(health: Optional[Health]) -> str:
+    """Status bar text, e.g. "● Connected · 142 ms" """
+    if health is None:
+        return "● Checking..."
+    latency = f" · {health.latency_ms:.0f} ms" if health.latency_ms is not None else ""
+    if health.status == 'ok':
+        return f"● Connected{latency}"
+    if health.status == 'degraded':
+        return f"● Degraded ({health.detail}){latency}"
+    if health.status == 'auth':
+        return "● Key rejected"
+    if health.status == 'down':
+        return "● Unreachable"
+    return f"● Error ({health.detail})"
+
+
+STATUS_COLORS = {'ok': "#50fa7b", 'degraded': "#f0ad4e", 'auth': "#ff5555", 'error': "#ff5555", 'down': "#ff5555"}
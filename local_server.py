@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Local API stand-in
+Anthropic-style /v1/messages (and message batches) endpoints for trying the client against failures
+
+Usage: python local_server.py [--port 8765] [--length 4000] [--cut-after 1500]
+                              [--cuts 1] [--overlap 0] [--delay-ms 5] [--delta-chars 8]
+                              [--ttft-ms 0] [--slow-every 0] [--slow-ttft-ms 3000]
+                              [--stall-after 0] [--stall-ms 0] [--stalls 1]
+                              [--batch-ms 20] [--batch-error-every 0]
+Then run the app with API_BASE_URL=http://127.0.0.1:8765 and any API_KEY.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "the stream carries each token of the answer from the model to the window "
+    "while the client keeps the partial text so that a broken connection costs "
+    "only the missing part of the reply"
+).split()
+
+
+def answer_text(prompt: str, length: int, vocabulary=WORDS) -> str:
+    """Deterministic answer, so a resumed request can continue it exactly"""
+    words = []
+    size = 0
+    i = 0
+    while size < length:
+        word = vocabulary[(i + len(prompt)) % len(vocabulary)]
+        if i % 17 == 16:
+            word += f" ({i // 17 + 1}).\n"
+        words.append(word)
+        size += len(word) + 1
+        i += 1
+    return ' '.join(words)[:length]
+
+
+def iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+
+
+class StandIn:
+    """Server-wide behaviour; cuts are shared by all connections"""
+
+    def __init__(self, length=4000, cut_after=0, cuts=0, overlap=0, delay_ms=5, delta_chars=8,
+                 ttft_ms=0, slow_every=0, slow_ttft_ms=3000, stall_after=0, stall_ms=0, stalls=0,
+                 batch_ms=20, batch_error_every=0, vocabulary=WORDS):
+        self.length = length
+        self.vocabulary = vocabulary    # words of the answers
+        self.cut_after = cut_after      # drop streaming connections after this many characters
+        self.cuts = cuts                # ... this many times
+        self.overlap = overlap          # continuations repeat this many characters of the prefill
+        self.delay_ms = delay_ms
+        self.delta_chars = delta_chars
+        self.ttft_ms = ttft_ms          # pause between message_start and the first delta
+        self.slow_every = slow_every    # every Nth request waits slow_ttft_ms instead
+        self.slow_ttft_ms = slow_ttft_ms
+        self.stall_after = stall_after  # go quiet for stall_ms after this many characters
+        self.stall_ms = stall_ms
+        self.stalls = stalls            # ... this many times
+        self.batch_ms = batch_ms        # batch requests finish one after another, this far apart
+        self.batch_error_every = batch_error_every  # every Nth batch request fails
+        self.requests = 0
+        self.batches = {}
+        self.batch_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def take_cut(self) -> bool:
+        with self.lock:
+            if self.cut_after > 0 and self.cuts > 0:
+                self.cuts -= 1
+                return True
+            return False
+
+    def take_stall(self) -> bool:
+        with self.lock:
+            if self.stall_ms > 0 and self.stalls > 0:
+                self.stalls -= 1
+                return True
+            return False
+
+    def first_token_ms(self, request: int) -> int:
+        if self.slow_every and request % self.slow_every == 0:
+            return self.slow_ttft_ms
+        return self.ttft_ms
+
+    def create_batch(self, requests) -> dict:
+        with self.lock:
+            batch_id = f"msgbatch_local{next(self.batch_ids):06d}"
+            self.batches[batch_id] = {'id': batch_id, 'requests': requests, 'created': time.time(),
+                'canceled_at': None}
+        return self.batch_info(batch_id)
+
+    def finished(self, batch) -> int:
+        """Requests of a batch processed by now"""
+        done = int((time.time() - batch['created']) * 1000 / self.batch_ms) if self.batch_ms else len(batch['requests'])
+        return min(done, len(batch['requests']))
+
+    def batch_info(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        total = len(batch['requests'])
+        done = self.finished(batch)
+        canceled = 0
+        if batch['canceled_at'] is not None:
+            done = min(done, batch['canceled_before'])
+            canceled = total - done
+        errored = done // self.batch_error_every if self.batch_error_every else 0
+        ended = done + canceled == total
+        ended_at = (batch['canceled_at'] or batch['created'] + total * self.batch_ms / 1000) if ended else None
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else ('canceling' if batch['canceled_at'] else 'in_progress'),
+            'request_counts': {'processing': total - done - canceled, 'succeeded': done - errored,
+                'errored': errored, 'canceled': canceled, 'expired': 0},
+            'created_at': iso(batch['created']),
+            'ended_at': iso(ended_at),
+            'expires_at': iso(batch['created'] + 86400),
+            'cancel_initiated_at': iso(batch['canceled_at']),
+            'results_url': f"/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def cancel_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is not None and batch['canceled_at'] is None:
+                batch['canceled_before'] = self.finished(batch)
+                batch['canceled_at'] = time.time()
+        return self.batch_info(batch_id)
+
+    def batch_result(self, batch, index) -> dict:
+        request = batch['requests'][index]
+        custom_id = request.get('custom_id')
+        if batch['canceled_at'] is not None and index >= batch['canceled_before']:
+            return {'custom_id': custom_id, 'result': {'type': 'canceled'}}
+        if self.batch_error_every and (index + 1) % self.batch_error_every == 0:
+            return {'custom_id': custom_id, 'result': {'type': 'errored', 'error': {'type': 'error',
+                'error': {'type': 'api_error', 'message': 'stand-in failure'}}}}
+        params = request.get('params') or {}
+        messages = params.get('messages') or [{'role': 'user', 'content': ''}]
+        text = answer_text(text_of(messages[-1].get('content', '')), min(self.length, params.get('max_tokens', 4096) * 4),
+            self.vocabulary)
+        return {'custom_id': custom_id, 'result': {'type': 'succeeded', 'message': {
+            'id': f"msg_local_{batch['id']}_{index}", 'type': 'message', 'role': 'assistant',
+            'model': params.get('model'), 'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn',
+            'usage': {'input_tokens': len(json.dumps(params)) // 4, 'output_tokens': len(text) // 4}}}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def standin(self) -> StandIn:
+        return self.server.standin
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path.startswith('/v1/messages/batches/'):
+            self.get_batch(path[len('/v1/messages/batches/'):])
+            return
+        if path != '/v1/models':
+            self.not_found()
+            return
+        self.send_json(200, {'data': [{'type': 'model', 'id': 'local-model'}], 'has_more': False})
+
+    def not_found(self):
+        self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+
+    def get_batch(self, rest):
+        batch_id, _, action = rest.partition('/')
+        info = self.standin.batch_info(batch_id)
+        if info is None or action not in ('', 'results'):
+            self.not_found()
+        elif not action:
+            self.send_json(200, info)
+        elif info['processing_status'] != 'ended':
+            self.send_json(400, {'type': 'error', 'error': {'type': 'invalid_request_error',
+                'message': f"Batch {batch_id} is still processing"}})
+        else:
+            # JSONL in chunks, like the real result file
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/binary')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            batch = self.standin.batches[batch_id]
+            try:
+                for index in range(len(batch['requests'])):
+                    data = (json.dumps(self.standin.batch_result(batch, index)) + '\n').encode('utf-8')
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # client stopped reading
+
+    def do_HEAD(self):
+        self.send_response(405)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if path == '/v1/messages/batches':
+            requests = payload.get('requests')
+            if not requests:
+                self.send_json(400, {'type': 'error', 'error': {'type': 'invalid_request_error',
+                    'message': 'requests: at least one request is required'}})
+                return
+            self.send_json(200, self.standin.create_batch(requests))
+            return
+        if path.startswith('/v1/messages/batches/') and path.endswith('/cancel'):
+            info = self.standin.cancel_batch(path[len('/v1/messages/batches/'):-len('/cancel')])
+            if info is None:
+                self.not_found()
+            else:
+                self.send_json(200, info)
+            return
+        if path != '/v1/messages':
+            self.not_found()
+            return
+        with self.standin.lock:
+            self.standin.requests += 1
+            self.request_number = self.standin.requests
+        usage = {'input_tokens': len(json.dumps(payload)) // 4, 'output_tokens': 0}
+        messages = list(payload.get('messages') or [{'role': 'user', 'content': ''}])
+        prefill = ''
+        if messages[-1].get('role') == 'assistant':
+            prefill = text_of(messages.pop()['content'])
+        prompt = text_of(messages[-1].get('content', '')) if messages else ''
+        answer = answer_text(prompt, min(self.standin.length, payload.get('max_tokens', 4096) * 4), self.standin.vocabulary)
+        start = len(prefill) if answer.startswith(prefill) else 0
+        if start:
+            start = max(0, start - self.standin.overlap)
+        text = answer[start:]
+        if payload.get('stream'):
+            try:
+                self.stream(payload, text, usage)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # client gave up (cancelled, timed out)
+        else:
+            usage['output_tokens'] = len(text) // 4
+            self.send_json(200, {'id': 'msg_local', 'type': 'message', 'role': 'assistant',
+                'model': payload.get('model'), 'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn', 'usage': usage})
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, payload, text, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        cut = self.standin.cut_after if self.standin.take_cut() else None
+        stall = self.standin.stall_after if self.standin.take_stall() else None
+        self.event('message_start', {'message': {'id': 'msg_local', 'model': payload.get('model'),
+            'usage': dict(usage, output_tokens=1)}})
+        self.event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        first_ms = self.standin.first_token_ms(self.request_number)
+        if first_ms:
+            time.sleep(first_ms / 1000)
+        step = self.standin.delta_chars
+        for i in range(0, len(text), step):
+            if cut is not None and i >= cut:
+                # Drop the connection without the terminating chunk
+                self.close_connection = True
+                return
+            if stall is not None and i >= stall:
+                stall = None
+                time.sleep(self.standin.stall_ms / 1000)
+            self.event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': text[i:i + step]}})
+            if self.standin.delay_ms:
+                time.sleep(self.standin.delay_ms / 1000)
+        self.event('content_block_stop', {'index': 0})
+        self.event('message_delta', {'delta': {'stop_reason': 'end_turn'},
+            'usage': {'output_tokens': max(1, len(text) // 4)}})
+        self.event('message_stop', {})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def event(self, kind, body):
+        data = f"event: {kind}\ndata: {json.dumps(dict(body, type=kind))}\n\n".encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+
+def serve(standin: StandIn, port: int = 0) -> ThreadingHTTPServer:
+    """Start the stand-in on a daemon thread; server.server_port has the port"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    server.standin = standin
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--length', type=int, default=4000, help="answer length in characters")
+    parser.add_argument('--cut-after', type=int, default=0, help="drop streams after this many characters")
+    parser.add_argument('--cuts', type=int, default=1, help="how many streams to drop")
+    parser.add_argument('--overlap', type=int, default=0, help="characters a continuation repeats")
+    parser.add_argument('--delay-ms', type=int, default=5, help="pause between deltas")
+    parser.add_argument('--delta-chars', type=int, default=8, help="characters per delta")
+    parser.add_argument('--ttft-ms', type=int, default=0, help="pause before the first delta")
+    parser.add_argument('--slow-every', type=int, default=0, help="every Nth request is slow to start")
+    parser.add_argument('--slow-ttft-ms', type=int, default=3000, help="first-delta pause of slow requests")
+    parser.add_argument('--stall-after', type=int, default=0, help="stall streams after this many characters")
+    parser.add_argument('--stall-ms', type=int, default=0, help="length of a stall")
+    parser.add_argument('--stalls', type=int, default=1, help="how many streams to stall")
+    parser.add_argument('--batch-ms', type=int, default=20, help="processing time per batch request")
+    parser.add_argument('--batch-error-every', type=int, default=0, help="every Nth batch request fails")
+    args = parser.parse_args()
+    standin = StandIn(args.length, args.cut_after, args.cuts, args.overlap, args.delay_ms,
+        delta_chars=args.delta_chars, ttft_ms=args.ttft_ms, slow_every=args.slow_every, slow_ttft_ms=args.slow_ttft_ms,
+        stall_after=args.stall_after, stall_ms=args.stall_ms, stalls=args.stalls,
+        batch_ms=args.batch_ms, batch_error_every=args.batch_error_every)
+    server = serve(standin, args.port)
+    print(f"Listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
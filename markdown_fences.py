@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown fence tokenizer
+Splits message text into prose and fenced code segments in a single pass
+"""
+
+import threading
+from collections import OrderedDict, namedtuple
+from typing import List, Optional, Tuple
+
+TEXT = 'text'
+CODE = 'code'
+
+# kind: TEXT or CODE, closed: False only for a code fence that never ended
+Segment = namedtuple('Segment', ['kind', 'text', 'language', 'closed'])
+
+
+def _parse_fence(line: str) -> Optional[Tuple[str, int, str]]:
+    """Return (char, length, info) if line is a fence line, else None"""
+    stripped = line.lstrip(' ')
+    if not stripped or len(line) - len(stripped) > 3:
+        return None
+    char = stripped[0]
+    if char != '`' and char != '~':
+        return None
+    rest = stripped.lstrip(char)
+    length = len(stripped) - len(rest)
+    if length < 3:
+        return None
+    info = rest.strip()
+    # A backtick fence may not carry backticks in its info string (inline code)
+    if char == '`' and '`' in info:
+        return None
+    return char, length, info
+
+
+class FenceTokenizer:
+    """
+    Incremental fenced-code tokenizer
+
+    Follows the CommonMark fence rules: a fence is 3+ backticks or tildes
+    indented by at most 3 spaces, and it is closed only by a fence of the same
+    character that is at least as long and has nothing after it. A ```` fence
+    can therefore contain ``` lines, and an unclosed fence runs to the end.
+
+    Every character is visited a constant number of times, so the cost is
+    linear in the input no matter how many fences are left open. Text can be
+    fed in arbitrary pieces (e.g. stream deltas); feeding a message in parts
+    gives the same segments as feeding it at once.
+    """
+
+    def __init__(self):
+        self._segments: List[Segment] = []
+        self._lines: List[str] = []
+        self._partial: List[str] = []
+        self._fence: Optional[Tuple[str, int]] = None
+        self._language = ''
+        self._closed = False
+
+    def feed(self, text: str):
+        """Consume more text"""
+        if not text:
+            return
+        start = 0
+        newline = text.find('\n')
+        while newline != -1:
+            if self._partial:
+                self._partial.append(text[start:newline])
+                line = ''.join(self._partial)
+                self._partial = []
+            else:
+                line = text[start:newline]
+            self._process_line(line)
+            start = newline + 1
+            newline = text.find('\n', start)
+        if start < len(text):
+            self._partial.append(text[start:])
+
+    def segments(self) -> Tuple[Segment, ...]:
+        """Segments parsed so far, including the one still in progress"""
+        pending = self._pending_segment()
+        if pending is None:
+            return tuple(self._segments)
+        return tuple(self._segments) + (pending,)
+
+    def close(self) -> Tuple[Segment, ...]:
+        """Finish parsing and return all segments"""
+        if not self._closed:
+            if self._partial:
+                line = ''.join(self._partial)
+                self._partial = []
+                self._process_line(line)
+            self._flush()
+            self._closed = True
+        return tuple(self._segments)
+
+    def _process_line(self, line: str):
+        if self._fence is None:
+            fence = _parse_fence(line)
+            if fence is None:
+                self._lines.append(line)
+                return
+            self._flush()
+            char, length, info = fence
+            self._fence = (char, length)
+            self._language = info.split()[0] if info else ''
+            return
+
+        char, length = self._fence
+        fence = _parse_fence(line)
+        if fence and fence[0] == char and fence[1] >= length and not fence[2]:
+            self._segments.append(Segment(CODE, '\n'.join(self._lines), self._language, True))
+            self._lines = []
+            self._fence = None
+            self._language = ''
+            return
+        self._lines.append(line)
+
+    def _pending_segment(self) -> Optional[Segment]:
+        lines = self._lines + [''.join(self._partial)] if self._partial else self._lines
+        if self._fence is not None:
+            return Segment(CODE, '\n'.join(lines), self._language, False)
+        if lines:
+            return Segment(TEXT, '\n'.join(lines), '', True)
+        return None
+
+    def _flush(self):
+        """Emit the segment being built (text, or an unclosed code block)"""
+        pending = self._pending_segment()
+        if pending is not None:
+            self._segments.append(pending)
+        self._lines = []
+        self._partial = []
+
+
+class SegmentCache:
+    """Thread-safe LRU of parsed segments keyed by message text"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content: str) -> Optional[Tuple[Segment, ...]]:
+        with self._lock:
+            segments = self._entries.get(content)
+            if segments is not None:
+                self._entries.move_to_end(content)
+            return segments
+
+    def put(self, content: str, segments: Tuple[Segment, ...]):
+        with self._lock:
+            self._entries[content] = segments
+            self._entries.move_to_end(content)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = SegmentCache()
+
+
+def parse_segments(content: str) -> Tuple[Segment, ...]:
+    """
+    Split content into text/code segments, memoized per message
+
+    Args:
+        content: Full message text
+
+    Returns:
+        Tuple of Segment
+    """
+    segments = _cache.get(content)
+    if segments is None:
+        tokenizer = FenceTokenizer()
+        tokenizer.feed(content)
+        segments = tokenizer.close()
+        _cache.put(content, segments)
+    return segments
+
+
+def remember_segments(content: str, segments: Tuple[Segment, ...]):
+    """Seed the cache with segments parsed incrementally (e.g. while streaming)"""
+    _cache.put(content, tuple(segments))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Paste classification module
+Decides whether pasted text looks like code, cheaply enough for huge pastes
+"""
+
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+# Fraction of lines that must look like code
+CODE_RATIO = 0.3
+
+# Above this many lines, classify an evenly spaced sample instead of every line
+SAMPLE_THRESHOLD = 2000
+SAMPLE_SIZE = 1000
+
+# Pastes above this size are never inserted into the input textbox
+INTERCEPT_CHARS = 20000
+INTERCEPT_LINES = 500
+
+# All code indicators in one precompiled pattern, applied per line
+CODE_LINE_PATTERN = re.compile(
+    r'^\s*(?:def |class |import |from |if |for |while |return |async |await )'  # Python
+    r'|^\s*(?:function |const |let |var |export )'  # JS
+    r'|^\s*(?:<\?php|<\w+>|<\w+\s)'  # PHP/HTML/XML
+    r'|[{}\[\]();]'  # Brackets common in code
+    r'|^\s*#include|^\s*using namespace'  # C/C++
+    r'|=>|->|\$\w+|@\w+'  # Arrow functions, variables
+)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='paste-classifier')
+
+
+def _sample(lines: List[str]) -> List[str]:
+    if len(lines) <= SAMPLE_THRESHOLD:
+        return lines
+    step = len(lines) / SAMPLE_SIZE
+    return [lines[int(i * step)] for i in range(SAMPLE_SIZE)]
+
+
+def is_code_content(text: str) -> bool:
+    """Check if text looks like code (more than 30% of lines match)"""
+    # Already has code fence
+    if '```' in text:
+        return False
+
+    lines = text.strip().split('\n')
+    if len(lines) < 2:
+        return False
+
+    lines = _sample(lines)
+    total = len(lines)
+    needed = CODE_RATIO * total
+    search = CODE_LINE_PATTERN.search
+    code_lines = 0
+    for index, line in enumerate(lines, 1):
+        if search(line):
+            code_lines += 1
+            if code_lines > needed:
+                return True
+        # Even if every remaining line matched, the threshold is out of reach
+        if code_lines + (total - index) <= needed:
+            return False
+    return False
+
+
+def is_oversized(text: str) -> bool:
+    """Whether a paste is too big to insert into a textbox"""
+    return len(text) > INTERCEPT_CHARS or text.count('\n') >= INTERCEPT_LINES
+
+
+def classify_paste(text: str) -> dict:
+    """
+    Classify pasted text
+
+    Returns:
+        {"text", "lines", "is_code", "has_fence"}
+    """
+    text = text.strip()
+    has_fence = '```' in text
+    return {
+        'text': text,
+        'lines': text.count('\n') + 1 if text else 0,
+        'is_code': has_fence or is_code_content(text),
+        'has_fence': has_fence,
+    }
+
+
+def classify_paste_async(text: str) -> Future:
+    """Classify on a worker thread; poll the returned Future from the UI thread"""
+    return _executor.submit(classify_paste, text)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Performance HUD module
+Event-loop, memory and widget metrics for the performance overlay
+"""
+
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class LoopMonitor:
+    """
+    Measures Tk event-loop responsiveness with a self-rescheduling tick
+
+    Each tick asks for a callback TICK_MS later; how late it actually runs is
+    the event-loop lag, and ticks delivered per second approximate the frame
+    rate the UI can sustain. Only runs between start() and stop(), so it costs
+    nothing while the HUD is hidden.
+    """
+
+    TICK_MS = 16
+
+    def __init__(self, widget):
+        self.widget = widget
+        self._job = None
+        self._last = None
+        self._window_start = 0.0
+        self._window_ticks = 0
+        self.fps = 0.0
+        self.lag_ms = 0.0        # smoothed
+        self.max_lag_ms = 0.0    # worst since start()
+
+    @property
+    def running(self) -> bool:
+        return self._job is not None
+
+    def start(self):
+        if self._job is None:
+            self._last = None
+            self.max_lag_ms = 0.0
+            self._window_start = time.perf_counter()
+            self._window_ticks = 0
+            self._job = self.widget.after(self.TICK_MS, self._tick)
+
+    def stop(self):
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+
+    def _tick(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            lag = max(0.0, (now - self._last) * 1000 - self.TICK_MS)
+            self.lag_ms = 0.8 * self.lag_ms + 0.2 * lag
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+        self._last = now
+
+        self._window_ticks += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.fps = self._window_ticks / elapsed
+            self._window_start = now
+            self._window_ticks = 0
+        self._job = self.widget.after(self.TICK_MS, self._tick)
+
+
+def process_rss() -> Optional[int]:
+    """Resident set size in bytes, or None where it can't be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def count_widgets(widget) -> int:
+    """Widgets below (not including) widget"""
+    count = 0
+    stack = list(widget.winfo_children())
+    while stack:
+        child = stack.pop()
+        count += 1
+        stack.extend(child.winfo_children())
+    return count
+
+
+def export_snapshot(metrics: Dict[str, Any], directory: Optional[str] = None) -> str:
+    """Write metrics as JSON and return the file path"""
+    directory = directory or os.getenv('PERF_SNAPSHOT_DIR', os.path.expanduser("~"))
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"aichat_perf_{stamp}.json")
+    snapshot = {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'metrics': metrics,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2, default=str)
+    return path
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Response buffer module
+Append-only text buffer for long streamed answers
+"""
+
+import bisect
+import os
+import tempfile
+from typing import List, Optional
+
+# Small deltas are merged into blocks of about this size, so a long answer is
+# a few dozen strings rather than tens of thousands
+BLOCK_CHARS = 16 * 1024
+MAX_PIECES = 512
+
+
+class ResponseBuffer:
+    """
+    Chunk list with O(1) appends and sliced reads
+
+    append() only adds to a list; pieces are merged into BLOCK_CHARS blocks
+    as they accumulate, so every character is copied a constant number of
+    times however the answer arrives. slice() and tail() read just the blocks
+    they cover. getvalue() joins once and caches the result until the next
+    append.
+
+    With RESPONSE_SPILL_CHARS set (0, the default, disables it), blocks beyond
+    that many characters are moved to an anonymous temporary file while the
+    answer streams, keeping the in-memory part bounded.
+    """
+
+    def __init__(self, spill_chars: Optional[int] = None):
+        self.spill_chars = spill_chars if spill_chars is not None else int(os.getenv('RESPONSE_SPILL_CHARS', '0'))
+        self._blocks: List[str] = []
+        self._starts: List[int] = []     # char offset of each in-memory block
+        self._pieces: List[str] = []     # not yet merged into a block
+        self._pieces_chars = 0
+        self._length = 0
+        self._joined: Optional[str] = None
+
+        # Spilled prefix: UTF-8 blocks on disk, indexed by (char offset, byte offset)
+        self._file = None
+        self._spilled_chars = 0
+        self._spilled_bytes = 0
+        self._file_chars: List[int] = []
+        self._file_bytes: List[int] = []
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+    @property
+    def spilled_chars(self) -> int:
+        return self._spilled_chars
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._pieces.append(text)
+        self._pieces_chars += len(text)
+        self._length += len(text)
+        self._joined = None
+        if self._pieces_chars >= BLOCK_CHARS or len(self._pieces) >= MAX_PIECES:
+            self._merge()
+
+    def getvalue(self) -> str:
+        """The whole text (joined once, then cached)"""
+        if self._joined is None:
+            self._merge()
+            parts = [self._read(0, self._spilled_chars)] if self._spilled_chars else []
+            self._joined = ''.join(parts + self._blocks)
+            if not self._spilled_chars:
+                # Keep one copy: the joined string becomes the only block
+                self._blocks = [self._joined] if self._joined else []
+                self._starts = [0] if self._joined else []
+        return self._joined
+
+    def slice(self, start: int, end: Optional[int] = None) -> str:
+        """text[start:end] without joining the rest"""
+        end = self._length if end is None else min(end, self._length)
+        start = max(0, start)
+        if start >= end:
+            return ''
+        if self._joined is not None:
+            return self._joined[start:end]
+        self._merge()
+        parts = []
+        if start < self._spilled_chars:
+            parts.append(self._read(start, min(end, self._spilled_chars)))
+            start = self._spilled_chars
+        if start < end:
+            i = bisect.bisect_right(self._starts, start) - 1
+            while i < len(self._blocks) and self._starts[i] < end:
+                offset = self._starts[i]
+                parts.append(self._blocks[i][max(0, start - offset):end - offset])
+                i += 1
+        return ''.join(parts)
+
+    def tail(self, chars: int) -> str:
+        """The last chars characters"""
+        return self.slice(self._length - chars)
+
+    def close(self):
+        """Drop the spill file (the cached text, if any, stays readable)"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _merge(self):
+        if not self._pieces:
+            return
+        block = ''.join(self._pieces)
+        self._starts.append(self._length - len(block))
+        self._blocks.append(block)
+        self._pieces = []
+        self._pieces_chars = 0
+        if self.spill_chars > 0 and self._length - self._spilled_chars > self.spill_chars:
+            self._spill()
+
+    def _spill(self):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        self._file.seek(0, os.SEEK_END)
+        for start, block in zip(self._starts, self._blocks):
+            data = block.encode('utf-8')
+            self._file.write(data)
+            self._file_chars.append(start)
+            self._file_bytes.append(self._spilled_bytes)
+            self._spilled_chars = start + len(block)
+            self._spilled_bytes += len(data)
+        self._blocks = []
+        self._starts = []
+
+    def _read(self, start: int, end: int) -> str:
+        """Characters [start, end) of the spilled prefix"""
+        first = bisect.bisect_right(self._file_chars, start) - 1
+        last = bisect.bisect_left(self._file_chars, end)
+        begin = self._file_bytes[first]
+        stop = self._file_bytes[last] if last < len(self._file_bytes) else self._spilled_bytes
+        self._file.seek(begin)
+        text = self._file.read(stop - begin).decode('utf-8')
+        offset = self._file_chars[first]
+        return text[start - offset:end - offset]
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Request scheduler module
+Priority classes in front of the API client, so background work never starves a chat turn
+"""
+
+import contextlib
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+INTERACTIVE = 'interactive'     # chat turns, hedges, fan-out, connection tests
+BACKGROUND = 'background'       # compaction summaries, batch jobs
+IDLE = 'idle'                   # periodic health probes, pre-warming
+CLASSES = (INTERACTIVE, BACKGROUND, IDLE)
+
+# Recent queue waits kept per class for the percentiles
+WAIT_SAMPLES = 500
+
+
+class SchedulerTimeout(Exception):
+    """The request's deadline passed before a slot was free"""
+
+
+class Ticket:
+    """One request waiting for or holding a slot"""
+
+    __slots__ = ('priority', 'rank', 'deadline', 'order', 'queued', 'admitted')
+
+    def __init__(self, priority: str, deadline: Optional[float], order: int):
+        self.priority = priority
+        self.rank = CLASSES.index(priority)
+        self.deadline = deadline        # monotonic, None = none
+        self.order = order
+        self.queued = time.monotonic()
+        self.admitted: Optional[float] = None
+
+    @property
+    def key(self):
+        # Class first, then earliest deadline, then arrival
+        return (self.rank, self.deadline if self.deadline is not None else float('inf'), self.order)
+
+    @property
+    def wait_ms(self) -> float:
+        return ((self.admitted or time.monotonic()) - self.queued) * 1000
+
+
+class Scheduler:
+    """
+    Concurrency slots shared by every request of one client (and its with_model copies)
+
+    At most `total` requests run at once - the size of the connection pool -
+    and each class has its own cap (SCHED_INTERACTIVE_MAX, SCHED_BACKGROUND_MAX,
+    SCHED_IDLE_MAX). Other classes always leave SCHED_INTERACTIVE_RESERVE
+    slots (default 1) free, so a chat turn finds a connection even when
+    background work arrived first. Waiting requests are admitted best class
+    first, then earliest deadline, then first come.
+
+    While interactive work is queued or running, the other classes are
+    throttled to SCHED_BACKGROUND_BUSY / SCHED_IDLE_BUSY slots (default 0):
+    requests already running finish, new ones wait. A request that has
+    waited SCHED_MAX_WAIT seconds is let through anyway, within its class cap,
+    so a long chat session can't starve compaction for good.
+    """
+
+    def __init__(self, total: int, caps: Optional[Dict[str, int]] = None, busy_caps: Optional[Dict[str, int]] = None,
+                 max_wait: Optional[float] = None):
+        self.total = max(1, total)
+        self.caps = caps or {
+            INTERACTIVE: int(os.getenv('SCHED_INTERACTIVE_MAX', str(self.total))),
+            BACKGROUND: int(os.getenv('SCHED_BACKGROUND_MAX', '2')),
+            IDLE: int(os.getenv('SCHED_IDLE_MAX', '1')),
+        }
+        self.busy_caps = busy_caps or {
+            BACKGROUND: int(os.getenv('SCHED_BACKGROUND_BUSY', '0')),
+            IDLE: int(os.getenv('SCHED_IDLE_BUSY', '0')),
+        }
+        self.reserve = min(self.total - 1, int(os.getenv('SCHED_INTERACTIVE_RESERVE', '1')))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('SCHED_MAX_WAIT', '30'))
+        self._cond = threading.Condition()
+        self._order = itertools.count()
+        self._waiting: List[Ticket] = []
+        self._running = dict.fromkeys(CLASSES, 0)
+        self._waits = {c: deque(maxlen=WAIT_SAMPLES) for c in CLASSES}
+        self._counts = {c: {'requests': 0, 'expired': 0, 'skipped': 0} for c in CLASSES}
+
+    @contextlib.contextmanager
+    def slot(self, priority: str = INTERACTIVE, deadline: Optional[float] = None) -> Iterator[Ticket]:
+        """Hold a slot for the duration of a request (deadline: seconds to wait at most)"""
+        ticket = self.acquire(priority, deadline)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def acquire(self, priority: str = INTERACTIVE, deadline: Optional[float] = None) -> Ticket:
+        """
+        Wait for a slot
+
+        Raises:
+            SchedulerTimeout: deadline seconds passed before one was free
+        """
+        with self._cond:
+            ticket = Ticket(priority, time.monotonic() + deadline if deadline is not None else None,
+                next(self._order))
+            self._waiting.append(ticket)
+            while not self._admissible(ticket):
+                now = time.monotonic()
+                if ticket.deadline is not None and now >= ticket.deadline:
+                    self._waiting.remove(ticket)
+                    self._counts[priority]['expired'] += 1
+                    self._cond.notify_all()
+                    raise SchedulerTimeout(f"{priority} request waited {ticket.wait_ms / 1000:.1f}s for a slot")
+                self._cond.wait(self._timeout(ticket, now))
+            self._admit(ticket)
+            return ticket
+
+    def try_acquire(self, priority: str = IDLE) -> Optional[Ticket]:
+        """A slot if one is free right now, else None (for work that is fine to skip)"""
+        with self._cond:
+            ticket = Ticket(priority, None, next(self._order))
+            self._waiting.append(ticket)
+            if not self._admissible(ticket):
+                self._waiting.remove(ticket)
+                self._counts[priority]['skipped'] += 1
+                return None
+            self._admit(ticket)
+            return ticket
+
+    def release(self, ticket: Ticket):
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per class: requests, running, queued, queue wait (avg/p95/max ms), expired and skipped"""
+        with self._cond:
+            result = {}
+            for c in CLASSES:
+                waits = sorted(self._waits[c])
+                result[c] = dict(self._counts[c],
+                    running=self._running[c],
+                    queued=sum(1 for t in self._waiting if t.priority == c),
+                    avg_wait_ms=sum(waits) / len(waits) if waits else None,
+                    p95_wait_ms=waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else None,
+                    max_wait_ms=waits[-1] if waits else None)
+            return result
+
+    def _admit(self, ticket: Ticket):
+        self._waiting.remove(ticket)
+        ticket.admitted = time.monotonic()
+        self._running[ticket.priority] += 1
+        self._counts[ticket.priority]['requests'] += 1
+        self._waits[ticket.priority].append(ticket.wait_ms)
+        # The next waiter in line may fit too
+        self._cond.notify_all()
+
+    def _cap(self, ticket: Ticket, now: float) -> int:
+        cap = self.caps[ticket.priority]
+        if ticket.priority == INTERACTIVE or now - ticket.queued >= self.max_wait:
+            return cap
+        interactive = self._running[INTERACTIVE] or any(t.priority == INTERACTIVE for t in self._waiting)
+        return min(cap, self.busy_caps[ticket.priority]) if interactive else cap
+
+    def _admissible(self, ticket: Ticket) -> bool:
+        """Whether ticket is the best waiting request that has room"""
+        if sum(self._running.values()) >= self.total:
+            return False
+        now = time.monotonic()
+        # Other classes must leave the reserved slots free
+        shared_full = self.total - sum(self._running.values()) <= self.reserve
+        best = None
+        for t in self._waiting:
+            if t.priority != INTERACTIVE and shared_full:
+                continue
+            if self._running[t.priority] < self._cap(t, now) and (best is None or t.key < best.key):
+                best = t
+        return best is ticket
+
+    def _timeout(self, ticket: Ticket, now: float) -> Optional[float]:
+        # Wake for our own deadline, and when some throttled request ages past max_wait
+        wakes = [t.queued + self.max_wait for t in self._waiting
+            if t.priority != INTERACTIVE and t.queued + self.max_wait > now]
+        if ticket.deadline is not None:
+            wakes.append(ticket.deadline)
+        return max(0.0, min(wakes) - now) if wakes else None
+
+
+def describe(stats: Dict[str, Dict[str, Any]]) -> str:
+    """One line per class for the performance overlay"""
+    lines = []
+    for c in CLASSES:
+        s = stats[c]
+        if not s['requests'] and not s['queued']:
+            continue
+        p95 = f"{s['p95_wait_ms']:.0f}" if s['p95_wait_ms'] is not None else "-"
+        lines.append(f"{c:<12}{s['running']} run {s['queued']} queued, wait p95 {p95} ms")
+    return '\n'.join(lines)
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic response cache module
+Reuses answers to near-duplicate prompts, found with MinHash bands in SQLite
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".aichat_semantic_cache.db")
+
+SHINGLE = 4          # characters per shingle
+BINS = 16            # one-permutation MinHash: the minimum hash in each of 16 bins
+BAND_BINS = 4        # 4 bands of 4 bins; a near-duplicate shares at least one band
+BANDS = BINS // BAND_BINS
+MAX_CANDIDATES = 32
+ESTIMATE_SLACK = 0.25  # candidates whose signature estimate is this far below the threshold are skipped
+FLUSH_EVENTS = 256
+_EMPTY = 1 << 28     # bin with no shingle (hash values are 28 bits)
+_SIGNATURE = struct.Struct(f'<{BINS}I')
+
+# Prose punctuation only - operators and brackets change what code or maths means
+_PUNCT = re.compile(r'[.,!?;:"\'`…“”‘’«»，。！？；：、「」]+')
+_SPACE = re.compile(r'\s+')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    key INTEGER NOT NULL,
+    b0 INTEGER NOT NULL,
+    b1 INTEGER NOT NULL,
+    b2 INTEGER NOT NULL,
+    b3 INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    prompt TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_key ON entries(key);
+CREATE INDEX IF NOT EXISTS entries_b0 ON entries(b0);
+CREATE INDEX IF NOT EXISTS entries_b1 ON entries(b1);
+CREATE INDEX IF NOT EXISTS entries_b2 ON entries(b2);
+CREATE INDEX IF NOT EXISTS entries_b3 ON entries(b3);
+CREATE TABLE IF NOT EXISTS events (
+    time REAL NOT NULL,
+    kind TEXT NOT NULL,
+    similarity REAL
+);
+"""
+
+
+def normalize(text: str) -> str:
+    """Case, width, prose punctuation and whitespace folded away"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _SPACE.sub(' ', _PUNCT.sub(' ', text)).strip()
+
+
+def shingles(text: str) -> set:
+    """Every SHINGLE-character window of normalized text"""
+    if len(text) <= SHINGLE:
+        return {text}
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def signature(grams: Iterable[str]) -> List[int]:
+    """Minimum crc32 in each bin; the low bits pick the bin, the rest is the value"""
+    mins = [_EMPTY] * BINS
+    for gram in grams:
+        h = zlib.crc32(gram.encode('utf-8'))
+        b = h & (BINS - 1)
+        v = h >> 4
+        if v < mins[b]:
+            mins[b] = v
+    return mins
+
+
+def estimate(a: List[int], b: List[int]) -> float:
+    """Similarity estimated from two signatures: the share of bins with the same minimum"""
+    filled = same = 0
+    for x, y in zip(a, b):
+        if x != _EMPTY or y != _EMPTY:
+            filled += 1
+            same += x == y
+    return same / filled if filled else 1.0
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash64(*parts: bytes) -> int:
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        h.update(part)
+    return int.from_bytes(h.digest(), 'little', signed=True)
+
+
+def _split_content(content: Any) -> Tuple[str, bytes]:
+    """Text of a message, and its other blocks (images, documents) serialized"""
+    if isinstance(content, str):
+        return content, b''
+    texts = []
+    other = []
+    for block in content or ():
+        if isinstance(block, dict) and block.get('type', 'text') == 'text':
+            texts.append(block.get('text', ''))
+        else:
+            other.append(block)
+    return '\n'.join(texts), json.dumps(other, sort_keys=True).encode('utf-8') if other else b''
+
+
+def split_prompt(model: str, messages: List[Dict[str, Any]]) -> Tuple[int, str]:
+    """
+    (context hash, normalized prompt) of an outgoing request
+
+    The prompt is the text of the last user message; everything else -
+    model, system prompt, earlier turns and any non-text blocks - has to
+    match exactly (after normalization) for an answer to be reused.
+    """
+    context = hashlib.blake2b(model.encode('utf-8'), digest_size=8)
+    for msg in messages[:-1]:
+        text, other = _split_content(msg['content'])
+        context.update(b'\0' + msg['role'].encode('utf-8') + b'\0' + normalize(text).encode('utf-8') + other)
+    text, other = _split_content(messages[-1]['content'])
+    context.update(b'\0' + other)
+    return int.from_bytes(context.digest(), 'little', signed=True), normalize(text)
+
+
+class CacheHit:
+    """A stored answer offered for a prompt"""
+
+    def __init__(self, entry_id: int, answer: str, similarity: float):
+        self.entry_id = entry_id
+        self.answer = answer
+        self.similarity = similarity
+
+    @property
+    def exact(self) -> bool:
+        return self.similarity >= 1.0
+
+
+class SemanticCache:
+    """
+    On-disk near-duplicate answer cache
+
+    Prompts are normalized and cut into character shingles; a one-permutation
+    MinHash signature (BINS minima) is split into BANDS band keys, each
+    indexed in SQLite. A lookup probes the exact key and the band keys, then
+    confirms candidates with the exact Jaccard similarity of the shingle sets,
+    so the threshold (SEMANTIC_CACHE_THRESHOLD, default 0.9) means what it
+    says. Every lookup and every rejected hit is logged for quality().
+
+    Opt-in with SEMANTIC_CACHE=1. SEMANTIC_CACHE_PATH and SEMANTIC_CACHE_MAX
+    (entries kept, default 1,000,000) configure the store.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.path = path or os.getenv('SEMANTIC_CACHE_PATH', DEFAULT_PATH)
+        self.threshold = threshold if threshold is not None else float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+        self.max_entries = max_entries or int(os.getenv('SEMANTIC_CACHE_MAX', '1000000'))
+        self._lock = threading.Lock()
+        self._events: List[Tuple[float, str, Optional[float]]] = []
+        self._hits: List[Tuple[int]] = []
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _keys(context: int, prompt: str) -> Tuple[int, List[int], List[int], set]:
+        grams = shingles(prompt)
+        mins = signature(grams)
+        ctx = struct.pack('<q', context)
+        key = _hash64(ctx, prompt.encode('utf-8'))
+        bands = [_hash64(ctx, bytes([b]), struct.pack(f'<{BAND_BINS}I', *mins[b * BAND_BINS:(b + 1) * BAND_BINS]))
+            for b in range(BANDS)]
+        return key, bands, mins, grams
+
+    def lookup(self, model: str, messages: List[Dict[str, Any]]) -> Optional[CacheHit]:
+        """Best stored answer at or above the threshold, or None"""
+        context, prompt = split_prompt(model, messages)
+        if not prompt:
+            return None
+        key, bands, mins, grams = self._keys(context, prompt)
+        with self._lock:
+            row = self._conn.execute('SELECT id, prompt FROM entries WHERE key = ? ORDER BY id DESC LIMIT 1',
+                (key,)).fetchone()
+            best = (row[0], 1.0) if row is not None and row[1] == prompt else None
+            if best is None:
+                rows = self._conn.execute(
+                    'SELECT id, signature FROM entries WHERE b0 = ? OR b1 = ? OR b2 = ? OR b3 = ? LIMIT ?',
+                    (*bands, MAX_CANDIDATES)).fetchall()
+                # The signature estimate weeds out chance band collisions; survivors get the exact Jaccard
+                floor = self.threshold - ESTIMATE_SLACK
+                for entry_id, stored in rows:
+                    if estimate(mins, _SIGNATURE.unpack(stored)) < floor:
+                        continue
+                    candidate = self._conn.execute('SELECT prompt FROM entries WHERE id = ?', (entry_id,)).fetchone()[0]
+                    similarity = jaccard(grams, shingles(candidate))
+                    if similarity >= self.threshold and (best is None or similarity > best[1]):
+                        best = (entry_id, similarity)
+            if best is None:
+                self._event('miss', None)
+                return None
+            answer = self._conn.execute('SELECT answer FROM entries WHERE id = ?', (best[0],)).fetchone()[0]
+            self._event('exact' if best[1] >= 1.0 else 'near', best[1], best[0])
+        return CacheHit(best[0], answer, best[1])
+
+    def store(self, model: str, messages: List[Dict[str, Any]], answer: str):
+        """Remember the answer to a request (replacing one to the same prompt)"""
+        self.store_many(model, [(messages, answer)])
+
+    def store_many(self, model: str, items: Iterable[Tuple[List[Dict[str, Any]], str]]):
+        """Remember many (messages, answer) pairs in one transaction"""
+        rows = []
+        now = time.time()
+        for messages, answer in items:
+            context, prompt = split_prompt(model, messages)
+            if prompt and answer:
+                key, bands, mins, _ = self._keys(context, prompt)
+                rows.append((now, key, *bands, _SIGNATURE.pack(*mins), prompt, answer))
+        if not rows:
+            return
+        with self._lock:
+            self._flush()
+            # A fresh answer to the same prompt replaces the stored one
+            self._conn.executemany('DELETE FROM entries WHERE key = ?', [(row[1],) for row in rows])
+            self._conn.executemany('INSERT INTO entries (created, key, b0, b1, b2, b3, signature, prompt, answer) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            # Ids only grow, so everything max_entries below the newest is the oldest
+            self._conn.execute('DELETE FROM entries WHERE id <= (SELECT MAX(id) FROM entries) - ?',
+                (self.max_entries,))
+            self._conn.commit()
+
+    def reject(self, hit: CacheHit):
+        """The user asked the model instead - forget the entry and count it"""
+        with self._lock:
+            self._event('rejected', hit.similarity)
+            self._flush()
+            self._conn.execute('DELETE FROM entries WHERE id = ?', (hit.entry_id,))
+            self._conn.commit()
+
+    def quality(self, days: int = 30) -> Dict[str, Any]:
+        """Lookups, hit rate, similarity of hits and how often hits were rejected"""
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+            rows = dict((r[0], r[1:]) for r in self._conn.execute(
+                'SELECT kind, COUNT(*), AVG(similarity), MIN(similarity) FROM events WHERE time > ? GROUP BY kind',
+                (time.time() - days * 86400,)))
+            entries = self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        exact = rows.get('exact', (0, None, None))[0]
+        near, avg_near, min_near = rows.get('near', (0, None, None))
+        lookups = exact + near + rows.get('miss', (0,))[0]
+        rejected = rows.get('rejected', (0,))[0]
+        hits = exact + near
+        return {
+            'entries': entries,
+            'lookups': lookups,
+            'hits': hits,
+            'exact_hits': exact,
+            'near_hits': near,
+            'hit_rate': hits / lookups if lookups else None,
+            'avg_near_similarity': avg_near,
+            'min_near_similarity': min_near,
+            'rejected': rejected,
+            'rejection_rate': rejected / hits if hits else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+            self._conn.close()
+
+    def _event(self, kind: str, similarity: Optional[float], entry_id: Optional[int] = None):
+        # Lookups only read; their events and hit counts are written in batches
+        self._events.append((time.time(), kind, similarity))
+        if entry_id is not None:
+            self._hits.append((entry_id,))
+        if len(self._events) >= FLUSH_EVENTS:
+            self._flush()
+            self._conn.commit()
+
+    def _flush(self):
+        if self._events:
+            self._conn.executemany('INSERT INTO events (time, kind, similarity) VALUES (?, ?, ?)', self._events)
+            self._conn.executemany('UPDATE entries SET hits = hits + 1 WHERE id = ?', self._hits)
+            self._events = []
+            self._hits = []
+
+
+def describe(hit: CacheHit) -> str:
+    if hit.exact:
+        return "♻ Answer from the response cache (same prompt as before)"
+    return f"♻ Answer from the response cache ({hit.similarity:.0%} similar to an earlier prompt)"
@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation history store
+SQLite (WAL) persistence with batched background writes and full-text search
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from conversation_tree import ROOT_SEQ, ConversationTree
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), ".aichat_history.db")
+
+# Bodies larger than this are stored zlib-compressed
+COMPRESS_THRESHOLD = 2048
+
+# Writer batching: flush after this many operations or this long
+BATCH_SIZE = 200
+BATCH_WINDOW = 0.05
+
+PAGE_SIZE = 50
+
+# Longest a background read waits for queued writes to be committed
+FLUSH_TIMEOUT = 10
+
+_log = logging.getLogger('aichat.history')
+
+# CJK characters are indexed one per token so that substring search works
+# without a segmenter (the unicode61 tokenizer treats a CJK run as one word)
+_CJK = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    head INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions(updated DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    created REAL NOT NULL,
+    compressed INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    attachments TEXT,
+    parent INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_session_seq ON messages(session_id, seq);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(body, content='');
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT,
+    created REAL NOT NULL,
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cache_write_tokens INTEGER NOT NULL,
+    cache_read_tokens INTEGER NOT NULL,
+    cost REAL,
+    stop_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS usage_day ON usage(day);
+CREATE INDEX IF NOT EXISTS usage_session ON usage(session_id);
+CREATE TABLE IF NOT EXISTS timings (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    model TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    ttft_ms REAL,
+    tokens_per_sec REAL,
+    output_tokens INTEGER NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_model ON timings(model);
+"""
+
+
+def _storable(text: str) -> str:
+    """Text SQLite accepts: lone surrogates (some pastes have them) become U+FFFD"""
+    try:
+        text.encode('utf-8')
+        return text
+    except UnicodeEncodeError:
+        return text.encode('utf-8', 'surrogatepass').decode('utf-8', 'replace')
+
+
+def _encode(text: str) -> Tuple[int, Any]:
+    if len(text) > COMPRESS_THRESHOLD:
+        return 1, zlib.compress(text.encode('utf-8'), 6)
+    return 0, text
+
+
+def _decode(compressed: int, body: Any) -> str:
+    if compressed:
+        return zlib.decompress(body).decode('utf-8')
+    return body
+
+
+# seq of the selected branch's last message: the stored head, else the newest message
+_HEAD = ('SELECT COALESCE((SELECT head FROM sessions WHERE id = :sid), '
+         '(SELECT MAX(seq) FROM messages WHERE session_id = :sid))')
+
+# The selected branch, walked up from its head (parents always have smaller seqs).
+# n counts the messages below :bound; the walk stops at :floor or after :limit of them
+_PATH = (f'path(seq, n) AS (SELECT s, s < :bound FROM ({_HEAD} AS s) UNION ALL '
+         'SELECT COALESCE(m.parent, m.seq - 1), path.n + (COALESCE(m.parent, m.seq - 1) < :bound) '
+         'FROM path JOIN messages m ON m.session_id = :sid AND m.seq = path.seq '
+         'WHERE COALESCE(m.parent, m.seq - 1) > :floor AND path.n < :limit)')
+
+
+def _with_attachments(message: Dict[str, Any], refs: Optional[str]) -> Dict[str, Any]:
+    if refs:
+        message['attachments'] = json.loads(refs)
+    return message
+
+
+def _index_text(text: str) -> str:
+    return _CJK.sub(r' \1 ', text)
+
+
+def _fts_query(query: str) -> str:
+    """Turn user input into an FTS5 query: every term is a quoted phrase"""
+    terms = []
+    for term in query.split():
+        term = ' '.join(_index_text(term).split()).replace('"', '""')
+        if term:
+            terms.append(f'"{term}"')
+    return ' '.join(terms)
+
+
+class SessionStore:
+    """
+    Persistent conversation store
+
+    Writes are queued and committed in batches by a background thread, so the
+    UI never waits on disk. Reads use a per-thread connection and only fetch
+    what is displayed (a page of sessions or messages).
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv('HISTORY_DB', DEFAULT_DB_PATH)
+        self._local = threading.local()
+        self._queue: queue.Queue = queue.Queue()
+        self._seq: Dict[str, int] = {}
+        self._seq_lock = threading.Lock()
+        # (session, seq) -> seq a message was stored under instead (writer thread only)
+        self._moved: Dict[Tuple[str, int], int] = {}
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-store-reader')
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(messages)')}
+        if 'attachments' not in columns:
+            conn.execute('ALTER TABLE messages ADD COLUMN attachments TEXT')
+        # Branching: NULL parent (older rows) means the previous message, NULL head the newest one
+        if 'parent' not in columns:
+            conn.execute('ALTER TABLE messages ADD COLUMN parent INTEGER')
+        if 'head' not in {row[1] for row in conn.execute('PRAGMA table_info(sessions)')}:
+            conn.execute('ALTER TABLE sessions ADD COLUMN head INTEGER')
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name='session-store-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # Writes (queued)
+
+    def create_session(self, title: str) -> str:
+        """Create a session and return its id (the insert is queued)"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        title = ' '.join(title.split())[:80] or 'Untitled'
+        with self._seq_lock:
+            self._seq[session_id] = 0
+        self._queue.put(('session', (session_id, title, now)))
+        return session_id
+
+    def append_message(self, session_id: str, role: str, content: str,
+                       attachments: Optional[List[Dict[str, Any]]] = None, parent: Optional[int] = None) -> int:
+        """
+        Queue a completed message for persistence (attachments are stored as references)
+
+        The message becomes the head of the session's selected branch. parent
+        is the seq it follows (ROOT_SEQ for a first message, None for the
+        previous message). Returns the message's seq.
+        """
+        with self._seq_lock:
+            seq = self._seq.get(session_id)
+            if seq is None:
+                seq = self._next_seq(session_id)
+            self._seq[session_id] = seq + 1
+        refs = json.dumps(attachments) if attachments else None
+        if parent is None:
+            parent = seq - 1
+        self._queue.put(('message', (session_id, seq, role, time.time(), content, refs, parent)))
+        return seq
+
+    def record_usage(self, session_id: Optional[str], model: str, usage: Dict[str, int],
+                     cost: Optional[float], stop_reason: Optional[str] = None):
+        """Queue one turn's usage for the ledger"""
+        now = time.time()
+        day = time.strftime('%Y-%m-%d', time.localtime(now))
+        self._queue.put(('usage', (session_id, now, day, model,
+            usage.get('input_tokens', 0), usage.get('output_tokens', 0),
+            usage.get('cache_creation_input_tokens', 0), usage.get('cache_read_input_tokens', 0),
+            cost, stop_reason)))
+
+    def update_message(self, session_id: str, seq: int, content: str):
+        """Queue replacing the body of a stored message"""
+        self._queue.put(('update', (session_id, seq, content)))
+
+    def set_head(self, session_id: str, seq: int):
+        """Queue selecting the branch that ends at seq"""
+        self._queue.put(('head', (session_id, seq)))
+
+    def record_timing(self, model: str, mode: str, ttft_ms: Optional[float], tokens_per_sec: Optional[float],
+                      output_tokens: int, outcome: str):
+        """Queue one model's latency and throughput for a turn"""
+        self._queue.put(('timing', (time.time(), model, mode, ttft_ms, tokens_per_sec, output_tokens, outcome)))
+
+    def delete_session(self, session_id: str):
+        """Queue removal of a session and its messages"""
+        self._queue.put(('delete', session_id))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far is committed"""
+        done = Future()
+        self._queue.put(('flush', done))
+        try:
+            done.result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        """Flush pending writes and stop the writer"""
+        self._reader.shutdown(wait=False)
+        if self._writer.is_alive():
+            self._queue.put(('stop', None))
+            self._writer.join(timeout=10)
+
+    def _next_seq(self, session_id: str) -> int:
+        # Resumed session not loaded with load_tree: continue after what is on
+        # disk. Nothing of it can still be queued - queuing a message records its seq.
+        row = self._connect().execute(
+            'SELECT MAX(seq) FROM messages WHERE session_id = ?', (session_id,)).fetchone()
+        return row[0] + 1 if row and row[0] is not None else 0
+
+    def _write_loop(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            ops = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW
+            while len(ops) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    ops.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            waiters = [arg for kind, arg in ops if kind == 'flush']
+            stop = any(kind == 'stop' for kind, _ in ops)
+            writes = [op for op in ops if op[0] not in ('flush', 'stop')]
+            try:
+                try:
+                    with conn:
+                        for op in writes:
+                            self._apply(conn, *op)
+                except Exception:
+                    # One bad operation must not cost the rest of the batch
+                    for op in writes:
+                        try:
+                            with conn:
+                                self._apply(conn, *op)
+                        except Exception:
+                            _log.exception("History write %s failed", op[0])
+            finally:
+                for waiter in waiters:
+                    waiter.set_result(True)
+        conn.close()
+
+    def _apply(self, conn, kind, arg):
+        if kind == 'session':
+            session_id, title, now = arg
+            conn.execute('INSERT OR IGNORE INTO sessions (id, title, created, updated) '
+                'VALUES (?, ?, ?, ?)', (session_id, _storable(title), now, now))
+        elif kind == 'message':
+            self._write_message(conn, *arg)
+        elif kind == 'usage':
+            conn.execute('INSERT INTO usage (session_id, created, day, model, input_tokens, '
+                'output_tokens, cache_write_tokens, cache_read_tokens, cost, stop_reason) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', arg)
+        elif kind == 'timing':
+            conn.execute('INSERT INTO timings (created, model, mode, ttft_ms, tokens_per_sec, '
+                'output_tokens, outcome) VALUES (?, ?, ?, ?, ?, ?, ?)', arg)
+        elif kind == 'update':
+            session_id, seq, content = arg
+            self._update_message(conn, session_id, self._moved.get((session_id, seq), seq), content)
+        elif kind == 'head':
+            session_id, seq = arg
+            conn.execute('UPDATE sessions SET head = ? WHERE id = ?',
+                (self._moved.get((session_id, seq), seq), session_id))
+        elif kind == 'delete':
+            self._delete_session(conn, arg)
+
+    def _write_message(self, conn, session_id, seq, role, created, content, attachments, parent):
+        content = _storable(content)
+        compressed, body = _encode(content)
+        parent = self._moved.get((session_id, parent), parent)
+        insert = ('INSERT INTO messages (session_id, seq, role, created, compressed, body, attachments, parent) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+        try:
+            cursor = conn.execute(insert, (session_id, seq, role, created, compressed, body, attachments, parent))
+        except sqlite3.IntegrityError:
+            # Another window or process appended to the session with the same
+            # seq: keep both, this one after the last stored message
+            stored = conn.execute('SELECT MAX(seq) FROM messages WHERE session_id = ?', (session_id,)).fetchone()[0]
+            _log.warning("History message %s of session %s stored as %s", seq, session_id, stored + 1)
+            self._moved[(session_id, seq)] = seq = stored + 1
+            with self._seq_lock:
+                self._seq[session_id] = max(self._seq.get(session_id, 0), seq + 1)
+            cursor = conn.execute(insert, (session_id, seq, role, created, compressed, body, attachments, parent))
+        conn.execute('INSERT INTO messages_fts (rowid, body) VALUES (?, ?)',
+            (cursor.lastrowid, _index_text(content)))
+        conn.execute('UPDATE sessions SET updated = ?, message_count = message_count + 1, head = ? WHERE id = ?',
+            (created, seq, session_id))
+
+    @staticmethod
+    def _update_message(conn, session_id, seq, content):
+        row = conn.execute('SELECT id, compressed, body FROM messages WHERE session_id = ? AND seq = ?',
+            (session_id, seq)).fetchone()
+        if row is None:
+            return
+        rowid, old_compressed, old_body = row
+        content = _storable(content)
+        conn.execute("INSERT INTO messages_fts (messages_fts, rowid, body) VALUES ('delete', ?, ?)",
+            (rowid, _index_text(_decode(old_compressed, old_body))))
+        compressed, body = _encode(content)
+        conn.execute('UPDATE messages SET compressed = ?, body = ? WHERE id = ?', (compressed, body, rowid))
+        conn.execute('INSERT INTO messages_fts (rowid, body) VALUES (?, ?)', (rowid, _index_text(content)))
+
+    @staticmethod
+    def _delete_session(conn, session_id):
+        # Contentless FTS rows can only be removed by replaying their text
+        for rowid, compressed, body in conn.execute(
+                'SELECT id, compressed, body FROM messages WHERE session_id = ?', (session_id,)):
+            conn.execute("INSERT INTO messages_fts (messages_fts, rowid, body) VALUES ('delete', ?, ?)",
+                (rowid, _index_text(_decode(compressed, body))))
+        conn.execute('DELETE FROM messages WHERE session_id = ?', (session_id,))
+        conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+
+    # Reads (lazy, one page at a time)
+
+    def list_sessions(self, limit: int = PAGE_SIZE, offset: int = 0) -> List[Dict[str, Any]]:
+        """Most recently updated sessions first"""
+        rows = self._connect().execute(
+            'SELECT id, title, created, updated, message_count FROM sessions '
+            'ORDER BY updated DESC LIMIT ? OFFSET ?', (limit, offset)).fetchall()
+        return [{'id': r[0], 'title': r[1], 'created': r[2], 'updated': r[3], 'message_count': r[4]}
+            for r in rows]
+
+    def message_count(self, session_id: str) -> int:
+        row = self._connect().execute(
+            'SELECT COUNT(*) FROM messages WHERE session_id = ?', (session_id,)).fetchone()
+        return row[0]
+
+    def head(self, session_id: str) -> Optional[int]:
+        """seq of the last message on the selected branch"""
+        return self._connect().execute(_HEAD, {'sid': session_id}).fetchone()[0]
+
+    def load_messages(self, session_id: str, before_seq: Optional[int] = None,
+                      limit: int = PAGE_SIZE, after_seq: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Load one page of the selected branch, in chronological order
+
+        Args:
+            session_id: Session id
+            before_seq: Only messages older than this seq (None = newest page)
+            limit: Page size
+            after_seq: Instead, the first messages newer than this seq
+
+        Returns:
+            [{"seq", "parent", "role", "content", "created"}], plus "attachments" where present
+        """
+        # Walking up from the head costs one lookup per message, so stop as
+        # soon as the page is complete
+        params = {'sid': session_id, 'bound': 1 << 62, 'floor': ROOT_SEQ, 'limit': 1 << 62, 'page': limit}
+        if after_seq is not None:
+            where, order = 'm.seq > :floor', 'ASC'
+            params['floor'] = after_seq
+        else:
+            where, order = 'm.seq < :bound', 'DESC'
+            params['limit'] = limit
+            if before_seq is not None:
+                params['bound'] = before_seq
+        rows = self._connect().execute(
+            f'WITH RECURSIVE {_PATH} SELECT m.seq, COALESCE(m.parent, m.seq - 1), m.role, m.created, '
+            'm.compressed, m.body, m.attachments '
+            'FROM path JOIN messages m ON m.session_id = :sid AND m.seq = path.seq '
+            f'WHERE {where} ORDER BY m.seq {order} LIMIT :page', params).fetchall()
+        if order == 'DESC':
+            rows.reverse()
+        return [_with_attachments({'seq': r[0], 'parent': r[1], 'role': r[2], 'created': r[3],
+            'content': _decode(r[4], r[5])}, r[6]) for r in rows]
+
+    def load_tree(self, session_id: str) -> ConversationTree:
+        """Every branch of a session, the selected one active - call from a worker thread for big sessions"""
+        conn = self._connect()
+        rows = conn.execute(
+            'SELECT seq, COALESCE(parent, seq - 1), created, role, compressed, body, attachments FROM messages '
+            'WHERE session_id = ? ORDER BY seq', (session_id,)).fetchall()
+        head = conn.execute(_HEAD, {'sid': session_id}).fetchone()[0]
+        with self._seq_lock:
+            # Messages appended to the session later go after these (unless some are queued already)
+            self._seq.setdefault(session_id, rows[-1][0] + 1 if rows else 0)
+        return ConversationTree.from_rows(
+            ((r[0], r[1], r[2], _with_attachments({'role': r[3], 'content': _decode(r[4], r[5])}, r[6]))
+             for r in rows), head)
+
+    def load_tree_async(self, session_id: str) -> Future:
+        """load_tree on a background thread"""
+        return self._reader.submit(self.load_tree, session_id)
+
+    def load_conversation(self, session_id: str) -> List[Dict[str, Any]]:
+        """The selected branch as API messages - call from a worker thread for big sessions"""
+        return self.load_tree(session_id).messages
+
+    def load_conversation_async(self, session_id: str) -> Future:
+        """load_conversation on a background thread"""
+        return self._reader.submit(self.load_conversation, session_id)
+
+    def read_async(self, read: Callable[[], Any]) -> Future:
+        """read() on a background thread, once everything queued so far is committed"""
+        def run():
+            self.flush(FLUSH_TIMEOUT)
+            return read()
+        return self._reader.submit(run)
+
+    def search(self, query: str, limit: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+        """
+        Full-text search across all sessions
+
+        Newest matches first: ordering by rowid lets FTS5 stop after `limit`
+        hits instead of scoring every match, which keeps common terms fast.
+
+        Returns:
+            [{"session_id", "title", "seq", "role", "snippet"}]
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        try:
+            rows = self._connect().execute(
+                'SELECT m.session_id, s.title, m.seq, m.role, m.compressed, m.body '
+                'FROM (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? '
+                '      ORDER BY rowid DESC LIMIT ?) AS hits '
+                'JOIN messages m ON m.id = hits.rowid '
+                'JOIN sessions s ON s.id = m.session_id '
+                'ORDER BY m.id DESC', (match, limit)).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        terms = query.split()
+        return [{'session_id': r[0], 'title': r[1], 'seq': r[2], 'role': r[3],
+                 'snippet': _snippet(_decode(r[4], r[5]), terms)} for r in rows]
+
+    def usage_by_day(self, days: int = 14) -> List[Dict[str, Any]]:
+        """Token and cost totals per day, newest first"""
+        since = time.strftime('%Y-%m-%d', time.localtime(time.time() - days * 86400))
+        rows = self._connect().execute(
+            'SELECT day, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cache_write_tokens), '
+            'SUM(cache_read_tokens), SUM(cost) FROM usage WHERE day > ? GROUP BY day ORDER BY day DESC',
+            (since,)).fetchall()
+        return [_usage_row(r[0], r[1:]) for r in rows]
+
+    def usage_by_session(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Sessions that spent the most, most expensive first"""
+        rows = self._connect().execute(
+            "SELECT u.session_id, COALESCE(s.title, '(unsaved)'), COUNT(*), SUM(u.input_tokens), "
+            'SUM(u.output_tokens), SUM(u.cache_write_tokens), SUM(u.cache_read_tokens), SUM(u.cost) '
+            'FROM usage u LEFT JOIN sessions s ON s.id = u.session_id GROUP BY u.session_id '
+            'ORDER BY COALESCE(SUM(u.cost), 0) DESC, '
+            'SUM(u.input_tokens + u.output_tokens + u.cache_write_tokens + u.cache_read_tokens) DESC '
+            'LIMIT ?', (limit,)).fetchall()
+        result = []
+        for r in rows:
+            row = _usage_row(r[1], r[2:])
+            row['session_id'] = r[0]
+            result.append(row)
+        return result
+
+    def session_usage(self, session_id: str) -> Dict[str, Any]:
+        row = self._connect().execute(
+            'SELECT COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cache_write_tokens), '
+            'SUM(cache_read_tokens), SUM(cost) FROM usage WHERE session_id = ?', (session_id,)).fetchone()
+        return _usage_row(session_id, row)
+
+    def timing_by_model(self, days: int = 30) -> List[Dict[str, Any]]:
+        """Latency and throughput per model, fastest average TTFT first"""
+        rows = self._connect().execute(
+            "SELECT model, COUNT(*), SUM(outcome = 'won'), SUM(outcome = 'error'), AVG(ttft_ms), MIN(ttft_ms), "
+            'AVG(tokens_per_sec) FROM timings WHERE created > ? GROUP BY model '
+            'ORDER BY AVG(ttft_ms) IS NULL, AVG(ttft_ms)', (time.time() - days * 86400,)).fetchall()
+        return [{'model': r[0], 'runs': r[1], 'wins': r[2] or 0, 'errors': r[3] or 0, 'avg_ttft_ms': r[4],
+                 'min_ttft_ms': r[5], 'avg_tokens_per_sec': r[6]} for r in rows]
+
+    def recent_ttfts(self, model: str, limit: int = 200) -> List[float]:
+        """The model's latest first-token times in ms, newest last"""
+        rows = self._connect().execute(
+            'SELECT ttft_ms FROM timings WHERE model = ? AND ttft_ms IS NOT NULL ORDER BY id DESC LIMIT ?',
+            (model, limit)).fetchall()
+        return [r[0] for r in reversed(rows)]
+
+
+def _usage_row(label, values) -> Dict[str, Any]:
+    turns, input_tokens, output_tokens, cache_write, cache_read, cost = values
+    return {
+        'label': label,
+        'turns': turns or 0,
+        'input_tokens': input_tokens or 0,
+        'output_tokens': output_tokens or 0,
+        'cache_creation_input_tokens': cache_write or 0,
+        'cache_read_input_tokens': cache_read or 0,
+        'cost': cost,
+    }
+
+
+def _snippet(text: str, terms: List[str], width: int = 120) -> str:
+    lowered = text.lower()
+    pos = -1
+    for term in terms:
+        pos = lowered.find(term.lower())
+        if pos != -1:
+            break
+    start = max(0, pos - width // 3) if pos != -1 else 0
+    snippet = ' '.join(text[start:start + width].split())
+    return ('...' if start else '') + snippet + ('...' if start + width < len(text) else '')
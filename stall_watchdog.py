@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+UI stall watchdog module
+Detects a blocked Tk main loop and records what the main thread was doing
+"""
+
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional, Tuple
+
+DEFAULT_LOG_PATH = os.path.join(os.path.expanduser("~"), ".aichat_stalls.log")
+
+HEARTBEAT_MS = 50
+SAMPLE_MS = 10          # stack sampling interval while stalled
+IDLE_CHECK_MS = 50      # watchdog wake-up interval otherwise
+STACK_DEPTH = 25
+WORST_KEPT = 10
+STACKS_REPORTED = 3
+
+_Stack = Tuple[Tuple[str, int, str], ...]
+
+
+class Stall:
+    """One main-loop stall and the stacks sampled while it lasted"""
+
+    def __init__(self, started: float, beat: float):
+        self.started = started
+        self.beat = beat          # last heartbeat before the stall
+        self.duration_ms = 0.0
+        self.samples: Counter = Counter()
+
+    def __lt__(self, other):
+        return self.duration_ms < other.duration_ms
+
+    def format(self) -> str:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))
+        total = sum(self.samples.values())
+        lines = [f"Stall of {self.duration_ms:.0f} ms at {when} ({total} samples)"]
+        for stack, count in self.samples.most_common(STACKS_REPORTED):
+            lines.append(f"  {count * 100 // max(total, 1)}% of samples:")
+            for filename, lineno, name in stack:
+                lines.append(f"    {os.path.basename(filename)}:{lineno} {name}")
+        return '\n'.join(lines)
+
+
+class StallWatchdog:
+    """
+    Heartbeat on the Tk main loop, checked by a background thread
+
+    The main loop only stamps a timestamp every HEARTBEAT_MS. When the stamp
+    is older than the threshold, the watchdog samples the main thread's stack
+    via sys._current_frames() every SAMPLE_MS until the loop recovers, then
+    writes the stall with its most frequent stacks to a rotating log. The
+    worst stalls of the session are summarized again on stop().
+
+    Configured with STALL_WATCHDOG (0 disables), STALL_THRESHOLD_MS and STALL_LOG.
+    """
+
+    def __init__(self, widget, threshold_ms: Optional[int] = None, log_path: Optional[str] = None):
+        self.widget = widget
+        self.threshold_ms = threshold_ms or int(os.getenv('STALL_THRESHOLD_MS', '100'))
+        self.log_path = log_path or os.getenv('STALL_LOG', DEFAULT_LOG_PATH)
+        self.enabled = os.getenv('STALL_WATCHDOG', '1') != '0'
+        self.stall_count = 0
+        self.worst: List[Stall] = []   # min-heap of the WORST_KEPT longest stalls
+        self._beat = time.monotonic()
+        self._job = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._main_ident = threading.main_thread().ident
+        self._log: Optional[logging.Logger] = None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._log = logging.getLogger('aichat.stalls')
+        self._log.propagate = False
+        if not self._log.handlers:
+            try:
+                handler = RotatingFileHandler(self.log_path, maxBytes=1024 * 1024, backupCount=3, encoding='utf-8')
+            except OSError:
+                self.enabled = False
+                return
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._log.addHandler(handler)
+            self._log.setLevel(logging.INFO)
+        self._beat = time.monotonic()
+        self._job = self.widget.after(HEARTBEAT_MS, self._heartbeat)
+        self._thread = threading.Thread(target=self._watch, name='stall-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching and write a summary of the worst stalls"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+        if self.worst:
+            worst = sorted(self.worst, reverse=True)
+            self._write(f"=== Worst {len(worst)} of {self.stall_count} stalls this session ===\n"
+                + '\n'.join(s.format() for s in worst))
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+        self._job = self.widget.after(HEARTBEAT_MS, self._heartbeat)
+
+    def _watch(self):
+        # A beat is due every HEARTBEAT_MS, so only lateness beyond that counts
+        limit = (HEARTBEAT_MS + self.threshold_ms) / 1000
+        stall: Optional[Stall] = None
+        while not self._stop.is_set():
+            beat = self._beat
+            late = time.monotonic() - beat
+            if late > limit:
+                if stall is None:
+                    stall = Stall(time.time() - late, beat)
+                stack = self._sample()
+                if stack:
+                    stall.samples[stack] += 1
+                stall.duration_ms = (late - HEARTBEAT_MS / 1000) * 1000
+                self._stop.wait(SAMPLE_MS / 1000)
+                continue
+            if stall is not None:
+                # The first beat after recovery gives the exact length
+                stall.duration_ms = max(stall.duration_ms, (beat - stall.beat) * 1000 - HEARTBEAT_MS)
+                self._record(stall)
+                stall = None
+            self._stop.wait(IDLE_CHECK_MS / 1000)
+
+    def _sample(self) -> Optional[_Stack]:
+        frame = sys._current_frames().get(self._main_ident)
+        if frame is None:
+            return None
+        summary = traceback.extract_stack(frame, limit=STACK_DEPTH)
+        return tuple((f.filename, f.lineno, f.name) for f in reversed(summary))
+
+    def _record(self, stall: Stall):
+        self.stall_count += 1
+        if len(self.worst) < WORST_KEPT:
+            heapq.heappush(self.worst, stall)
+        elif stall.duration_ms > self.worst[0].duration_ms:
+            heapq.heapreplace(self.worst, stall)
+        self._write(stall.format())
+
+    def _write(self, text: str):
+        if self._log is not None:
+            self._log.info(text + '\n')
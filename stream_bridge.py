@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Stream hand-off module
+Moves streamed text from a network thread to the Tk main loop
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Marks the end of a stream in the queue
+_DONE = object()
+
+
+class StreamBridge:
+    """
+    Producer/consumer bridge between a worker thread and the Tk main loop
+
+    The worker calls put() for every delta and finish() at the end; it never
+    touches Tk. A single poller on the main loop drains the bounded queue once
+    per frame, hands the batch to on_text and keeps its own work within the
+    frame budget. Batch size adapts to the measured cost of on_text, and a full
+    queue blocks the producer (backpressure) instead of flooding the event loop.
+    Closing it makes put() return False and calls the producer's cancel hook,
+    so a worker waiting on the network stops too.
+    """
+
+    def __init__(self, widget, on_text: Callable[[str], None], on_done: Callable[[Optional[Exception], Any], None],
+                 max_chunks: int = 4096, frame_ms: int = 16):
+        """
+        Args:
+            widget: Any Tk widget, used for after() scheduling
+            on_text: Called on the main loop with each coalesced batch
+            on_done: Called on the main loop once, with (error or None, result passed to finish)
+            max_chunks: Queue bound; the producer blocks beyond this
+            frame_ms: Frame budget for one poll
+        """
+        self.widget = widget
+        self.on_text = on_text
+        self.on_done = on_done
+        self.frame_ms = frame_ms
+        self._queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self._closed = threading.Event()
+        self._cancel: Optional[Callable[[], None]] = None
+        self._job = None
+        self._carry = ''
+        self._done = False
+        self._error: Optional[Exception] = None
+        self._result: Any = None
+
+        # Adaptive batching: chars per frame from the measured render cost
+        self.min_batch = 64
+        self.max_batch = 64 * 1024
+        self.batch_chars = 1024
+        self.ms_per_char = 0.0
+
+        # Telemetry - each counter has a single writer thread
+        self.chunks_in = 0
+        self.chars_in = 0
+        self.producer_blocks = 0
+        self.producer_blocked_ms = 0.0
+        self.frames = 0
+        self.chars_rendered = 0
+        self.max_depth = 0
+        self.render_ms = 0.0
+        self.max_render_ms = 0.0
+        self.over_budget_frames = 0
+
+    # Producer side (worker thread)
+
+    def put(self, text: str) -> bool:
+        """Queue a delta; blocks while the queue is full. False once closed."""
+        if self._closed.is_set():
+            return False
+        if not text:
+            return True
+        self.chunks_in += 1
+        self.chars_in += len(text)
+        try:
+            self._queue.put_nowait(text)
+            return True
+        except queue.Full:
+            pass
+
+        self.producer_blocks += 1
+        start = time.perf_counter()
+        try:
+            while not self._closed.is_set():
+                try:
+                    self._queue.put(text, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.producer_blocked_ms += (time.perf_counter() - start) * 1000
+
+    def cancel_on_close(self, cancel: Callable[[], None]):
+        """Have close() call cancel (e.g. StreamResult.abort) - at once if already closed"""
+        self._cancel = cancel
+        if self._closed.is_set():
+            cancel()
+
+    def finish(self, error: Optional[Exception] = None, result: Any = None):
+        """Signal the end of the stream, handing over e.g. the StreamResult"""
+        self._error = error
+        self._result = result
+        while not self._closed.is_set():
+            try:
+                self._queue.put(_DONE, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    # Consumer side (main loop)
+
+    def start(self):
+        """Start polling on the main loop"""
+        if self._job is None and not self._done:
+            self._job = self.widget.after(self.frame_ms, self._poll)
+
+    def close(self):
+        """Stop polling, release a blocked producer and cancel its work (e.g. window closed)"""
+        self._closed.set()
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+        cancel, self._cancel = self._cancel, None
+        if cancel is not None:
+            cancel()
+
+    @property
+    def pending_chars(self) -> int:
+        """Characters received but not rendered yet"""
+        return self.chars_in - self.chars_rendered
+
+    def _poll(self):
+        self._job = None
+        if self._closed.is_set():
+            return
+        start = time.perf_counter()
+        deadline = start + self.frame_ms / 1000
+
+        pieces = [self._carry] if self._carry else []
+        size = len(self._carry)
+        self._carry = ''
+        finished = False
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+        while size < self.batch_chars:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                finished = True
+                break
+            pieces.append(item)
+            size += len(item)
+
+        if pieces:
+            text = ''.join(pieces)
+            if not finished and len(text) > self.batch_chars:
+                text, self._carry = text[:self.batch_chars], text[self.batch_chars:]
+            self._render(text)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > self.frame_ms:
+            self.over_budget_frames += 1
+
+        if finished:
+            self._done = True
+            self._cancel = None
+            self._closed.set()
+            self.on_done(self._error, self._result)
+            return
+
+        # Backlog left: come back as soon as Tk has handled other events
+        backlog = bool(self._carry) or not self._queue.empty()
+        delay = 1 if backlog and time.perf_counter() < deadline else self.frame_ms
+        self._job = self.widget.after(delay, self._poll)
+
+    def _render(self, text: str):
+        start = time.perf_counter()
+        try:
+            self.on_text(text)
+        finally:
+            cost = (time.perf_counter() - start) * 1000
+            self.frames += 1
+            self.chars_rendered += len(text)
+            self.render_ms += cost
+            self.max_render_ms = max(self.max_render_ms, cost)
+            self._adapt(cost, len(text))
+
+    def _adapt(self, cost_ms: float, chars: int):
+        """Size the next batch so rendering it fits in about half a frame"""
+        per_char = cost_ms / max(chars, 1)
+        if self.ms_per_char:
+            self.ms_per_char = 0.8 * self.ms_per_char + 0.2 * per_char
+        else:
+            self.ms_per_char = per_char
+        if self.ms_per_char > 0:
+            target = int((self.frame_ms / 2) / self.ms_per_char)
+            self.batch_chars = max(self.min_batch, min(self.max_batch, target))
+
+    def stats(self) -> Dict[str, float]:
+        """Backpressure and rendering telemetry"""
+        return {
+            'chunks_in': self.chunks_in,
+            'chars_in': self.chars_in,
+            'chars_rendered': self.chars_rendered,
+            'pending_chars': self.pending_chars,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_depth,
+            'producer_blocks': self.producer_blocks,
+            'producer_blocked_ms': round(self.producer_blocked_ms, 1),
+            'frames': self.frames,
+            'avg_render_ms': round(self.render_ms / self.frames, 2) if self.frames else 0.0,
+            'max_render_ms': round(self.max_render_ms, 2),
+            'over_budget_frames': self.over_budget_frames,
+            'batch_chars': self.batch_chars,
+        }
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Syntax highlighting module
+Regex tokenizer that runs off the UI thread, with results cached by content hash
+"""
+
+import bisect
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+# Tag name -> foreground color
+TAG_COLORS = {
+    'keyword': '#c678dd',
+    'string': '#98c379',
+    'comment': '#6a737d',
+    'number': '#d19a66',
+    'function': '#61afef',
+}
+
+_PYTHON_KEYWORDS = (
+    'False None True and as assert async await break class continue def del elif else except '
+    'finally for from global if import in is lambda nonlocal not or pass raise return try while '
+    'with yield self print'
+)
+_JS_KEYWORDS = (
+    'async await break case catch class const continue default delete do else export extends '
+    'false finally for function if import in instanceof let new null return static super switch '
+    'this throw true try typeof undefined var void while yield interface type enum implements'
+)
+_C_KEYWORDS = (
+    'auto bool break case char class const continue default delete do double else enum extern '
+    'false final float for func go if impl import int long match mod mut namespace new nil null '
+    'package private protected public return self short signed sizeof static struct super switch '
+    'this throw throws true try typedef unsigned use using var void volatile while fn let pub '
+    'string String include define'
+)
+_SHELL_KEYWORDS = (
+    'if then else elif fi for while do done case esac function in return export local echo '
+    'exit set unset source alias cd'
+)
+_SQL_KEYWORDS = (
+    'select from where insert into values update set delete create table drop alter index join '
+    'left right inner outer on group by order having limit offset and or not null as distinct '
+    'union primary key foreign references default'
+)
+
+# language -> (keywords, line comment, has /* */ block comments, case-insensitive keywords)
+_LANGUAGES = {
+    'python': (_PYTHON_KEYWORDS, '#', False, False),
+    'javascript': (_JS_KEYWORDS, '//', True, False),
+    'c': (_C_KEYWORDS, '//', True, False),
+    'shell': (_SHELL_KEYWORDS, '#', False, False),
+    'sql': (_SQL_KEYWORDS, '--', True, True),
+}
+_ALIASES = {
+    'py': 'python', 'python3': 'python',
+    'js': 'javascript', 'jsx': 'javascript', 'ts': 'javascript', 'tsx': 'javascript',
+    'typescript': 'javascript', 'json': 'javascript',
+    'cpp': 'c', 'c++': 'c', 'h': 'c', 'hpp': 'c', 'cs': 'c', 'csharp': 'c', 'java': 'c',
+    'kotlin': 'c', 'go': 'c', 'golang': 'c', 'rust': 'c', 'rs': 'c', 'swift': 'c', 'php': 'c',
+    'sh': 'shell', 'bash': 'shell', 'zsh': 'shell', 'powershell': 'shell', 'ps1': 'shell',
+    'mysql': 'sql', 'postgresql': 'sql', 'sqlite': 'sql',
+}
+
+CACHE_ENTRIES = 128
+
+# (tag, start index, end index) with Tk "line.col" indices
+Token = Tuple[str, str, str]
+
+_compiled: Dict[str, 're.Pattern'] = {}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='highlighter')
+
+
+def _language_key(language: str) -> str:
+    language = (language or '').lower()
+    language = _ALIASES.get(language, language)
+    return language if language in _LANGUAGES else ''
+
+
+def _pattern(language: str) -> 're.Pattern':
+    """Combined token pattern for a language ('' = generic)"""
+    pattern = _compiled.get(language)
+    if pattern is not None:
+        return pattern
+
+    if language:
+        keywords, line_comment, block_comments, ignore_case = _LANGUAGES[language]
+        comments = [re.escape(line_comment) + r'[^\n]*']
+    else:
+        # Unknown language: accept every comment style and keyword set
+        keywords = ' '.join(spec[0] for spec in _LANGUAGES.values() if not spec[3])
+        comments = [r'(?<![:\w])//[^\n]*', r'(?:^|(?<=\s))#[^\n]*']
+        block_comments, ignore_case = True, False
+    if block_comments:
+        comments.insert(0, r'/\*.*?(?:\*/|\Z)')
+
+    words = sorted(set(keywords.split()), key=len, reverse=True)
+    flags = re.MULTILINE | re.DOTALL | (re.IGNORECASE if ignore_case else 0)
+    pattern = re.compile(
+        r'(?P<comment>' + '|'.join(comments) + r')'
+        r'|(?P<string>"""[\s\S]*?(?:"""|\Z)|\'\'\'[\s\S]*?(?:\'\'\'|\Z)'
+        r'|"(?:\\.|[^"\\\n])*"?|\'(?:\\.|[^\'\\\n])*\'?|`(?:\\.|[^`\\])*`?)'
+        r'|(?P<number>\b(?:0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)\b)'
+        r'|(?P<keyword>\b(?:' + '|'.join(re.escape(w) for w in words) + r')\b)'
+        r'|(?P<function>\b[A-Za-z_]\w*(?=\s*\())',
+        flags,
+    )
+    _compiled[language] = pattern
+    return pattern
+
+
+def tokenize(code: str, language: str = "") -> List[Token]:
+    """
+    Tokenize code for highlighting
+
+    Args:
+        code: Source text
+        language: Fence language hint, may be empty
+
+    Returns:
+        List of (tag, start, end) in text order, indices as Tk "line.col"
+    """
+    line_starts = [0]
+    find = code.find
+    newline = find('\n')
+    while newline != -1:
+        line_starts.append(newline + 1)
+        newline = find('\n', newline + 1)
+
+    def index(offset):
+        line = bisect.bisect_right(line_starts, offset) - 1
+        return f"{line + 1}.{offset - line_starts[line]}"
+
+    tokens = []
+    for match in _pattern(_language_key(language)).finditer(code):
+        start, end = match.span()
+        if start != end:
+            tokens.append((match.lastgroup, index(start), index(end)))
+    return tokens
+
+
+class HighlightCache:
+    """Thread-safe LRU of token lists keyed by content hash"""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(code: str, language: str) -> str:
+        digest = hashlib.sha1(code.encode('utf-8', 'surrogatepass'))
+        return f"{_language_key(language)}:{digest.hexdigest()}"
+
+    def get(self, key: str) -> Optional[List[Token]]:
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is not None:
+                self._entries.move_to_end(key)
+            return tokens
+
+    def put(self, key: str, tokens: List[Token]):
+        with self._lock:
+            self._entries[key] = tokens
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = HighlightCache()
+
+
+def _tokenize_cached(code: str, language: str) -> List[Token]:
+    key = HighlightCache.key(code, language)
+    tokens = _cache.get(key)
+    if tokens is None:
+        tokens = tokenize(code, language)
+        _cache.put(key, tokens)
+    return tokens
+
+
+def highlight_async(code: str, language: str = "") -> Future:
+    """Tokenize on a worker thread; poll the returned Future from the UI thread"""
+    return _executor.submit(_tokenize_cached, code, language)
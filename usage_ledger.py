@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Usage ledger module
+Exact token usage per turn, priced per model, aggregated per session and per day
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# USD per million tokens: (input, output, cache write, cache read).
+# Matched against the model name by substring, longest key first.
+DEFAULT_PRICES: Dict[str, Tuple[float, float, float, float]] = {
+    'claude-opus': (15.0, 75.0, 18.75, 1.5),
+    'claude-sonnet': (3.0, 15.0, 3.75, 0.3),
+    'claude-haiku': (0.8, 4.0, 1.0, 0.08),
+    'gpt-4o-mini': (0.15, 0.6, 0.15, 0.075),
+    'gpt-4o': (2.5, 10.0, 2.5, 1.25),
+    'gpt-4': (30.0, 60.0, 30.0, 30.0),
+    'deepseek': (0.27, 1.1, 0.27, 0.07),
+}
+
+USAGE_KEYS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+
+def load_prices() -> Dict[str, Tuple[float, float, float, float]]:
+    """
+    Price table, with overrides from MODEL_PRICES
+
+    MODEL_PRICES format: "model=input/output[/cache_write/cache_read],..."
+    e.g. MODEL_PRICES=mimo=0.1/0.3,my-model=1/2/1.25/0.1
+    """
+    prices = dict(DEFAULT_PRICES)
+    for item in os.getenv('MODEL_PRICES', '').split(','):
+        if '=' not in item:
+            continue
+        name, values = item.split('=', 1)
+        try:
+            numbers = [float(v) for v in values.split('/')]
+        except ValueError:
+            continue
+        if len(numbers) == 2:
+            numbers += [numbers[0], numbers[0]]
+        if len(numbers) == 4 and name.strip():
+            prices[name.strip().lower()] = tuple(numbers)
+    return prices
+
+
+def price_for(model: str) -> Optional[Tuple[float, float, float, float]]:
+    model = (model or '').lower()
+    prices = load_prices()
+    for name in sorted(prices, key=len, reverse=True):
+        if name in model:
+            return prices[name]
+    return None
+
+
+def normalize_usage(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Provider usage (Anthropic or OpenAI style) -> the four USAGE_KEYS"""
+    usage = usage or {}
+    result = {key: int(usage.get(key) or 0) for key in USAGE_KEYS}
+    if not result['input_tokens'] and usage.get('prompt_tokens'):
+        result['input_tokens'] = int(usage['prompt_tokens'])
+    if not result['output_tokens'] and usage.get('completion_tokens'):
+        result['output_tokens'] = int(usage['completion_tokens'])
+    return result
+
+
+def total_tokens(usage: Dict[str, int]) -> int:
+    return sum(usage.get(key, 0) for key in USAGE_KEYS)
+
+
+def estimate_cost(model: str, usage: Dict[str, int]) -> Optional[float]:
+    """Cost in USD, or None when the model has no known price"""
+    price = price_for(model)
+    if price is None:
+        return None
+    per_token = [p / 1_000_000 for p in price]
+    return sum(usage.get(key, 0) * rate for key, rate in zip(USAGE_KEYS, per_token))
+
+
+def describe(usage: Dict[str, int], cost: Optional[float], stop_reason: Optional[str] = None) -> str:
+    """One-line summary of a turn, e.g. for a caption under the answer"""
+    parts = [f"in {usage['input_tokens']}", f"out {usage['output_tokens']}"]
+    cached = usage['cache_read_input_tokens']
+    written = usage['cache_creation_input_tokens']
+    if cached or written:
+        parts.append(f"cache read {cached} / write {written}")
+    if cost is not None:
+        parts.append(f"${cost:.4f}")
+    if stop_reason and stop_reason not in ('end_turn', 'stop'):
+        parts.append(stop_reason)
+    return ' · '.join(parts)
+
+
+class UsageLedger:
+    """Records priced usage and per-model timings through the session store and reads them back aggregated"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, session_id: Optional[str], model: str, usage: Dict[str, Any],
+               stop_reason: Optional[str] = None) -> Tuple[Dict[str, int], Optional[float]]:
+        """
+        Record one turn
+
+        Returns:
+            (normalized usage, cost or None)
+        """
+        usage = normalize_usage(usage)
+        cost = estimate_cost(model, usage)
+        if self.store is not None:
+            self.store.record_usage(session_id, model, usage, cost, stop_reason)
+        return usage, cost
+
+    def by_day(self, days: int = 14) -> List[Dict[str, Any]]:
+        return self.store.usage_by_day(days) if self.store is not None else []
+
+    def by_session(self, limit: int = 20) -> List[Dict[str, Any]]:
+        return self.store.usage_by_session(limit) if self.store is not None else []
+
+    def record_timing(self, model: str, mode: str, ttft_ms: Optional[float], tokens_per_sec: Optional[float],
+                      output_tokens: int = 0, outcome: str = 'done'):
+        """Record one model's TTFT and throughput (mode: single, fanout, race or hedge)"""
+        if self.store is not None:
+            self.store.record_timing(model, mode, ttft_ms, tokens_per_sec, output_tokens, outcome)
+
+    def by_model(self, days: int = 30) -> List[Dict[str, Any]]:
+        return self.store.timing_by_model(days) if self.store is not None else []
+
+    def recent_ttfts(self, model: str, limit: int = 200) -> List[float]:
+        return self.store.recent_ttfts(model, limit) if self.store is not None else []
+
+    def session_totals(self, session_id: str) -> Dict[str, Any]:
+        if self.store is None:
+            return {}
+        return self.store.session_usage(session_id)